@@ -0,0 +1,40 @@
+#!/usr/bin/env python2.6
+
+"""Chop time per million items by segment type, with and without reuse.
+
+The input is a range of integers, chopped into segments that are only
+iterated over, as a consumer that does not keep them would.  Reusing a
+segment should never be slower than allocating a new one each time.
+
+Usage: chop.py [number of items] [segment length]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import chop, numpy
+
+
+def measure(n, length, repeat=5, **options):
+	best = float('inf')
+	for _ in range(repeat):
+		start = time.time()
+		for _ in xrange(n) >> chop(length, **options):
+			pass
+		best = min(best, time.time() - start)
+	return best * 1e6 / n
+
+
+if __name__ == '__main__':
+	n = int(sys.argv[1]) if sys.argv[1:] else 1000000
+	length = int(sys.argv[2]) if sys.argv[2:] else 1024
+	cases = [('list', {}), ("typecode='d'", dict(typecode='d'))]
+	if numpy is not None:
+		cases.append(('dtype=float', dict(dtype=float)))
+	print '%-14s %12s %12s' % ('segment', 'new (s)', 'reuse (s)')
+	for name, options in cases:
+		print '%-14s %12.3f %12.3f' % (name, measure(n, length, **options),
+		                               measure(n, length, reuse=True, **options))
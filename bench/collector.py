@@ -0,0 +1,63 @@
+#!/usr/bin/env python2.6
+
+"""Latency of QCollector against the former polling implementation.
+
+Each of n ThreadedFeeder's produces items at random intervals, stamped
+with the time they are produced.  The latency of an item is the time
+until it comes out of the collector.
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import Stream, ThreadedFeeder, QCollector
+
+
+class PollingQCollector(Stream):
+	# QCollector as of stream.py 0.8, for reference.
+	def __init__(self, waittime=0.1):
+		self.inqueues = []
+		self.waittime = waittime
+		def nonemptyget():
+			while self.inqueues:
+				ready = [q for q in self.inqueues if not q.empty()]
+				if not ready:
+					time.sleep(self.waittime)
+				for q in ready:
+					item = q.get()
+					if item is StopIteration:
+						del self.inqueues[self.inqueues.index(q)]
+					else:
+						yield item
+		self.iterator = nonemptyget()
+
+	def __pipe__(self, inpipe):
+		self.inqueues.append(inpipe.outqueue)
+
+
+def producer(nitems, interval):
+	for _ in range(nitems):
+		time.sleep(random.random() * 2 * interval)
+		yield time.time()
+
+
+def measure(collector_class, ninputs, nitems, interval):
+	collector = collector_class()
+	for _ in range(ninputs):
+		ThreadedFeeder(producer, nitems, interval) >> collector
+	latencies = sorted(time.time() - t for t in collector)
+	n = len(latencies)
+	return sum(latencies) / n, latencies[n // 2], latencies[n * 99 // 100]
+
+
+if __name__ == '__main__':
+	print '%-18s %6s %10s %10s %10s' % ('collector', 'inputs', 'mean (ms)', 'p50 (ms)', 'p99 (ms)')
+	for ninputs in [1, 10, 100, 300]:
+		for collector_class in [PollingQCollector, QCollector]:
+			mean, p50, p99 = measure(collector_class, ninputs, 20, 0.05)
+			print '%-18s %6d %10.2f %10.2f %10.2f' % (collector_class.__name__, ninputs,
+			                                          mean * 1e3, p50 * 1e3, p99 * 1e3)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python2.6
+
+"""Throughput of an Executor over a ProcessPool by pipelining depth.
+
+Many small jobs are submitted at once.  With a depth of 1, a worker is
+idle between jobs for a round trip through the executor's threads.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import Executor, ProcessPool, map
+
+
+def measure(depth, njobs=20000):
+	executor = Executor(ProcessPool, map(lambda x: x*x), poolsize=4, depth=depth)
+	start = time.time()
+	futures = executor.submit(*range(njobs), futures=True)
+	futures[-1].result()
+	for future in futures:
+		future.result()
+	elapsed = time.time() - start
+	executor.close()
+	return njobs / elapsed, executor.depth
+
+
+if __name__ == '__main__':
+	print '%-6s %12s %12s' % ('depth', 'jobs/s', 'final depth')
+	for depth in [1, 2, 4, 8, 16, 'auto']:
+		throughput, final = measure(depth)
+		print '%-6s %12.0f %12s' % (depth, throughput, final)
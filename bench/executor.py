@@ -0,0 +1,46 @@
+#!/usr/bin/env python2.6
+
+"""Request/response latency of Executor jobs.
+
+A client submits one job at a time and waits for its result, either by
+polling status() and scanning the shared `result` stream as was needed
+before futures, or with the Future returned by submit(..., futures=True).
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import Executor, ThreadPool, map
+
+
+def polling(executor, x, waittime=0.001):
+	id = executor.submit(x)
+	while executor.status(id) != 'COMPLETED':
+		time.sleep(waittime)
+	return next(iter(executor.result))
+
+def future(executor, x):
+	return executor.submit(x, futures=True).result()
+
+
+def measure(request, nrequests):
+	executor = Executor(ThreadPool, map(lambda x: x*x), poolsize=4)
+	latencies = []
+	for x in range(nrequests):
+		start = time.time()
+		assert request(executor, x) == x*x
+		latencies.append(time.time() - start)
+	executor.close()
+	latencies.sort()
+	n = len(latencies)
+	return sum(latencies) / n, latencies[n // 2], latencies[n * 99 // 100]
+
+
+if __name__ == '__main__':
+	print '%-10s %10s %10s %10s' % ('request', 'mean (us)', 'p50 (us)', 'p99 (us)')
+	for request in [polling, future]:
+		mean, p50, p99 = measure(request, 2000)
+		print '%-10s %10.1f %10.1f %10.1f' % (request.__name__, mean * 1e6, p50 * 1e6, p99 * 1e6)
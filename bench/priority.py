@@ -0,0 +1,43 @@
+#!/usr/bin/env python2.6
+
+"""Latency of interactive Executor jobs under a backfill load.
+
+A batch of backfill jobs is submitted at once, then interactive jobs
+arrive one at a time while the batch is being worked on.  Every job
+takes about the same time.  The latency of an interactive job is the
+time from its submission to its completion.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import Executor, ThreadPool, map
+
+
+def measure(backfill_priority, aging, nbackfill=2000, ninteractive=50, jobtime=0.002):
+	executor = Executor(ThreadPool, map(lambda x: time.sleep(jobtime)), poolsize=4,
+	                    aging=aging)
+	backfill = executor.submit(*range(nbackfill), futures=True, priority=backfill_priority)
+	latencies = []
+	for x in range(ninteractive):
+		start = time.time()
+		executor.submit(x, futures=True).result()
+		latencies.append(time.time() - start)
+		time.sleep(jobtime)
+	backfill[-1].result()
+	executor.close()
+	latencies.sort()
+	n = len(latencies)
+	return sum(latencies) / n, latencies[n // 2], latencies[-1]
+
+
+if __name__ == '__main__':
+	print '%-24s %10s %10s %10s' % ('scheduling', 'mean (ms)', 'p50 (ms)', 'max (ms)')
+	for name, backfill_priority, aging in [('FIFO', 0, None),
+	                                       ('priority', 10, None),
+	                                       ('priority, aging=0.1s', 10, 0.1)]:
+		mean, p50, worst = measure(backfill_priority, aging)
+		print '%-24s %10.2f %10.2f %10.2f' % (name, mean * 1e3, p50 * 1e3, worst * 1e3)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python2.6
+
+"""Sort time of parallel_sort by number of workers, against sorted().
+
+Random floats are sorted by themselves, which is cheap, then random
+strings by a costly key:  the digest of many rounds of hashing.  The time
+is that taken to produce the whole sorted output.
+
+Usage: sort.py [number of items]
+"""
+
+import hashlib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import parallel_sort, _nCPU
+
+
+def digest(s, rounds=20):
+	for _ in xrange(rounds):
+		s = hashlib.sha1(s).digest()
+	return s
+
+
+def measure(data, key, nworkers):
+	start = time.time()
+	if nworkers == 0:
+		sorted(data, key=key)
+	else:
+		for _ in data >> parallel_sort(key=key, nworkers=nworkers):
+			pass
+	return time.time() - start
+
+
+if __name__ == '__main__':
+	n = int(sys.argv[1]) if sys.argv[1:] else 500000
+	r = random.Random(0)
+	cases = [
+		('floats', [r.random() for _ in xrange(n)], None),
+		('digests', ['%x' % r.getrandbits(64) for _ in xrange(n)], digest),
+	]
+	nworkers = sorted(set([1, 2, 4, _nCPU]))
+	print '%-10s %10s' % ('input', 'sorted (s)') + ''.join('%10s' % ('%d (s)' % k) for k in nworkers)
+	for name, data, key in cases:
+		times = [measure(data, key, k) for k in [0] + nworkers]
+		print '%-10s' % name + ''.join('%10.2f' % t for t in times)
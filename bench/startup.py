@@ -0,0 +1,57 @@
+#!/usr/bin/env python2.6
+
+"""Start latency of a ProcessPool by resident size of the parent process.
+
+The parent grows by allocating and touching a ballast of the given size,
+then a pool is created and the time until its first output is measured.  Forked workers copy the page tables of the parent,
+while those started from a Forkserver created beforehand do not.
+
+Usage: startup.py [ballast size in MB ...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import Forkserver, ProcessPool
+
+
+def pids(input):
+	for x in input:
+		time.sleep(0.01)     ## so that each worker gets an item
+		yield os.getpid()
+
+
+def rss():
+	# The resident set size of this process in MB.
+	for line in open('/proc/self/status'):
+		if line.startswith('VmRSS:'):
+			return int(line.split()[1]) // 1024
+	return 0
+
+
+def measure(forkserver, poolsize=4, repeat=5):
+	best = float('inf')
+	for _ in range(repeat):
+		start = time.time()
+		output = iter(range(poolsize * 4) >> ProcessPool(pids, poolsize=poolsize, forkserver=forkserver))
+		next(output)
+		best = min(best, time.time() - start)
+		for _ in output:
+			pass
+	return best
+
+
+if __name__ == '__main__':
+	sizes = [int(size) for size in sys.argv[1:]] or [0, 256, 1024]
+	forkserver = Forkserver(preload=['json', 'decimal'])
+	ballast = []
+	print '%10s %14s %18s' % ('RSS (MB)', 'fork (ms)', 'forkserver (ms)')
+	for size in sizes:
+		while len(ballast) < size:
+			ballast.append(bytearray(1 << 20))
+			ballast[-1][::4096] = 'x' * 256     ## touch every page
+		print '%10d %14.2f %18.2f' % (rss(), measure(None) * 1e3, measure(forkserver) * 1e3)
+	forkserver.close()
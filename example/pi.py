@@ -31,6 +31,16 @@ def Gregory(type=float):
 series1 = Gregory()
 
 
+def vGregory():
+	"""Same as Gregory(float), but computed block by block with NumPy.
+
+	The n-th term 1/x, x == 2n + 1, has the sign of (-1)**n.
+	"""
+	import numpy
+	from stream import vmap, vfold
+	return seq(1.0, step=2) >> vmap(lambda x: (1 - 2*(x//2 % 2)) / x) >> vfold(numpy.add)
+
+
 @Processor
 def Aitken(s):
 	"""Accelerate the convergence of the a series
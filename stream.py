@@ -24,8 +24,12 @@ Filters:
 	+ by index:  take, drop, takei, dropi
 	+ by condition:  filter, takewhile, dropwhile
 	+ by transformation:  apply, map, fold
-	+ by combining streams:  prepend, tee
+	+ by window:  sliding, tumbling
+	+ by combining streams:  prepend, tee, broadcast
 	+ for special purpose:  chop, cut, flatten
+	+ by ordering:  sort, parallel_sort
+	+ by key:  shuffle, group_by_key
+	+ vectorized with NumPy:  vmap, vfilter, vfold
 
 Accumulators:  item, maximum, minimum, reduce
 	+ from Python:  list, sum, dict, max, min ...
@@ -50,7 +54,19 @@ can be used.  They both utilize a number of workers in other theads
 or processes to work on items pulled from the input stream.  Their output
 are simply iterables respresented by the pool objects which can be used in
 pipelines.  Alternatively, an Executor can perform fine-grained, concurrent job
-control over a thread/process pool.
+control over a thread/process pool, with a Future object for each job if
+needed.
+
+The processes of a ForkedFeeder or ProcessPool can be started from a
+Forkserver, a small template process created early with some modules
+already imported, rather than forked from a possibly large parent.
+
+A NetworkPool is like a ProcessPool whose workers connect to it over TCP,
+so that they can run on other hosts.
+
+For I/O-bound work where each item spends most of its time waiting, amap
+runs a coroutine function on each item on an asyncio event loop, so that
+thousands of operations can be in progress without a thread for each.
 
 Multiple streams can be piped to a single PCollector or QCollector, which
 will gather generated items whenever they are avaiable.  PCollectors
@@ -61,6 +77,31 @@ streams (low to high), a Sorter will output items in sorted order.
 
 Using multiples Feeder's and Collector's, one can implement many parallel
 processing patterns:  fan-in, fan-out, many-to-many map-reduce, etc.
+For the reduce side of map-reduce, a shuffle stage partitions (key, value)
+pairs among reducer processes by hash of key, so that each reducer sees
+all the values of its keys.
+
+
+Profiling
+=========
+
+To find out which stage of a pipeline is slow, wrap it in a profiled object,
+or pipe the whole pipeline within a Profiler context.  Both record items in
+and out, wall time, time blocked on the upstream and a latency histogram
+for each stage.
+
+
+Asynchronous iteration
+======================
+
+A Stream is also an asynchronous iterable.  When the input of a pipeline is
+an asynchronous iterable (one with __aiter__), the processors by index,
+condition, transformation, window and for special purpose, as well as
+prepend and the accumulators item, maximum, minimum and reduce, pull their
+input with __anext__ without blocking the event loop.  The pipeline is then driven
+with `async for`, or by awaiting its __anext__ in a coroutine, and an
+accumulator returns a coroutine.  Pools, feeders, collectors and tee only
+accept synchronous input.
 
 
 Articles
@@ -73,15 +114,25 @@ Articles written about this module by the author can be retrieved from
 from __future__ import with_statement
 
 import __builtin__
+import array
+import atexit
 import copy
 import collections
+import cPickle as pickle
 import heapq
+import inspect
 import itertools
+import math
+import mmap
 import operator
+import os
 import Queue
 import re
 import select
+import shutil
+import socket
 import sys
+import tempfile
 import threading
 import time
 
@@ -91,11 +142,26 @@ zip = itertools.izip
 
 try:
 	import multiprocessing
+	import multiprocessing.connection
 	import multiprocessing.queues
+	import _multiprocessing
 	_nCPU = multiprocessing.cpu_count()
 except ImportError:
 	_nCPU = 1
 
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+try:
+	import asyncio
+except ImportError:
+	try:
+		import trollius as asyncio
+	except ImportError:
+		asyncio = None
+
 try:
 	Iterable = collections.Iterable
 except AttributeError:
@@ -107,6 +173,12 @@ except NameError:
 	def next(iterator):
 		return iterator.next()
 
+try:
+	StopAsyncIteration
+except NameError:
+	class StopAsyncIteration(Exception):
+		pass
+
 try:
 	from operator import methodcaller
 except ImportError:
@@ -145,6 +217,11 @@ class Stream(Iterable):
 	accumulator and will not return a Stream, in which case it will need to
 	implement __pipe__.
 
+	If the input is an asynchronous iterable, __pipe__ replaces
+	self.iterator with the asynchronous iterator returned by
+	__acall__(aiterator) instead.  A Stream is also an asynchronous
+	iterable, see __aiter__.
+
 	The `>>` operator works as follow: the expression `a >> b` means
 	`b.__pipe__(a) if hasattr(b, '__pipe__') else b(a)`.
 
@@ -152,18 +229,63 @@ class Stream(Iterable):
 	[1, 2, 3, 4, 5, 6]
 	"""
 	def __init__(self, iterable=None):
-		"""Make a Stream object from an iterable."""
-		self.iterator = iter(iterable if iterable else [])
+		"""Make a Stream object from an iterable, which may be
+		asynchronous.
+		"""
+		if _isasync(iterable):
+			self.iterator = _aiter(iterable)
+		else:
+			self.iterator = iter(iterable if iterable else [])
+
+	def __getstate__(self):
+		# A Stream is pickled without its input and output, so that a stage
+		# can be the function of workers started from a Forkserver or
+		# connected to a NetworkPool.
+		state = self.__dict__.copy()
+		for name in ['iterator', '_iterator', 'source']:
+			state.pop(name, None)
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.iterator = iter([])
 
 	def __iter__(self):
 		return self.iterator
 
+	def __aiter__(self):
+		"""Return an asynchronous iterator over the stream.  Items of a
+		synchronous stream are computed in the event loop thread.
+		"""
+		if hasattr(self.iterator, '__anext__'):
+			return self.iterator
+		return _AsyncStage(self.iterator)
+
 	def __call__(self, iterator):
 		"""Append to the end of iterator."""
 		return itertools.chain(iterator, self.iterator)
 
+	def __acall__(self, aiterator):
+		"""Append to the end of an asynchronous iterator."""
+		iterator = self.iterator
+		def chain():
+			pull = _Pull(aiterator)
+			while 1:
+				x = yield pull
+				if x is StopIteration:
+					break
+				yield x
+			for x in iterator:
+				yield x
+		return _AsyncStage(chain())
+
 	def __pipe__(self, inpipe):
-		self.iterator = self.__call__(iter(inpipe))
+		if _isasync(inpipe):
+			if not issubclass(_definer(self, '__acall__'), _definer(self, '__call__')):
+				raise BrokenPipe('%r does not accept asynchronous input' % self)
+			self.iterator = self.__acall__(_aiter(inpipe))
+		else:
+			self.iterator = self.__call__(iter(inpipe))
 		return self
 
 	@staticmethod
@@ -171,6 +293,8 @@ class Stream(Iterable):
 		"""Connect inpipe and outpipe.  If outpipe is not a Stream instance,
 		it should be an function callable on an iterable.
 		"""
+		if _profiler is not None and not isinstance(outpipe, profiled):
+			outpipe = _profiler.wrap(outpipe)
 		if hasattr(outpipe, '__pipe__'):
 			return outpipe.__pipe__(inpipe)
 		elif hasattr(outpipe, '__call__'):
@@ -196,6 +320,100 @@ class Stream(Iterable):
 		return 'Stream(%s)' % repr(self.iterator)
 
 
+#_____________________________________________________________________
+# Asynchronous iteration
+
+
+_coroutine = getattr(asyncio, 'coroutine', lambda function: function)
+_From = getattr(asyncio, 'From', lambda future: future)
+_Return = getattr(asyncio, 'Return', StopIteration)
+
+
+def _isasync(iterable):
+	# Whether iterable is to be iterated over asynchronously.
+	if isinstance(iterable, Stream):
+		return hasattr(iterable.iterator, '__anext__')
+	return hasattr(iterable, '__aiter__')
+
+def _aiter(iterable):
+	# Return an asynchronous iterator over iterable, which may be
+	# synchronous.
+	if hasattr(iterable, '__aiter__'):
+		return iterable.__aiter__()
+	return _AsyncStage(iter(iterable))
+
+def _definer(obj, attribute):
+	# Return the class of obj where attribute is defined.
+	for cls in type(obj).__mro__:
+		if attribute in cls.__dict__:
+			return cls
+
+
+class _Pull(object):
+	# Yielded by the body of an _AsyncStage to get the next item of an
+	# asynchronous iterator, which is sent back in, or StopIteration
+	# when the iterator is exhausted.
+	def __init__(self, aiterator):
+		self.aiterator = aiterator
+
+
+class _AsyncStage(object):
+	# An asynchronous iterator whose items are computed by body:  a
+	# generator yielding its output values, and _Pull's for the input
+	# items it needs.  Any other iterator is a body pulling nothing.
+	def __init__(self, body):
+		self.body = body
+
+	def __aiter__(self):
+		return self
+
+	@_coroutine
+	def __anext__(self):
+		value = None
+		while 1:
+			try:
+				out = self.body.send(value) if value is not None else next(self.body)
+			except StopIteration:
+				raise StopAsyncIteration
+			if type(out) is not _Pull:
+				raise _Return(out)
+			try:
+				value = yield _From(out.aiterator.__anext__())
+			except StopAsyncIteration:
+				value = StopIteration
+
+
+@_coroutine
+def _areduce(function, aiterator, initval=StopIteration):
+	# Reduce an asynchronous iterator, a la __builtin__.reduce.
+	accumulated = initval
+	while 1:
+		try:
+			x = yield _From(aiterator.__anext__())
+		except StopAsyncIteration:
+			break
+		if accumulated is StopIteration:
+			accumulated = x
+		else:
+			accumulated = function(accumulated, x)
+	if accumulated is StopIteration:
+		raise TypeError('reduce() of empty sequence with no initial value')
+	raise _Return(accumulated)
+
+@_coroutine
+def _acollect(aiterator, n=None):
+	# Collect the first n items, or all items, of an asynchronous iterator
+	# into a list.
+	items = []
+	while n is None or len(items) < n:
+		try:
+			x = yield _From(aiterator.__anext__())
+		except StopAsyncIteration:
+			break
+		items.append(x)
+	raise _Return(items)
+
+
 #_______________________________________________________________________
 # Process streams by element indices
 
@@ -216,6 +434,18 @@ class take(Stream):
 		self.items = list(itertools.islice(iterator, self.n))
 		return iter(self.items)
 
+	def __acall__(self, aiterator):
+		self.items = []
+		def taker():
+			pull = _Pull(aiterator)
+			for _ in xrange(self.n):
+				x = yield pull
+				if x is StopIteration:
+					break
+				self.items.append(x)
+				yield x
+		return _AsyncStage(taker())
+
 	def __repr__(self):
 		return 'Stream(%s)' % repr(self.items)
 
@@ -246,6 +476,8 @@ class itemtaker(Stream):
 			raise TypeError('key must be an integer or a slice')
 
 	def __pipe__(self, inpipe):
+		if _isasync(inpipe):
+			return self._aslice(_aiter(inpipe))
 		i = iter(inpipe)
 		if type(self.key) is int:
 			## just one item is needed
@@ -279,6 +511,31 @@ class itemtaker(Stream):
 				items = list(itertools.islice(i, stop))
 			return items[self.key]
 
+	@_coroutine
+	def _aslice(self, aiterator):
+		# Like __pipe__ for an asynchronous input, as a coroutine.
+		key = self.key
+		if type(key) is int:
+			if key >= 0:
+				items = yield _From(_acollect(aiterator, key + 1))
+				if len(items) <= key:
+					raise IndexError('stream index out of range')
+				raise _Return(items[key])
+			n = -key if key else 1
+			items = (yield _From(_acollect(aiterator)))[-n:]
+			raise _Return(items[-n] if items else [])
+		if negative(key.stop) or negative(key.start) \
+			or not (key.start or key.stop) \
+			or (not key.start and negative(key.step)) \
+			or (not key.stop and not negative(key.step)):
+			stop = None
+		elif negative(key.step):
+			stop = key.start
+		else:
+			stop = key.stop
+		items = yield _From(_acollect(aiterator, stop))
+		raise _Return(items[key])
+
 	def __repr__(self):
 		return '<itemtaker at %s>' % hex(id(self))
 
@@ -314,6 +571,23 @@ class takei(Stream):
 					idx = next(self.indexiter)
 		return itaker()
 
+	def __acall__(self, aiterator):
+		def itaker():
+			pull = _Pull(aiterator)
+			old_idx = -1
+			idx = next(self.indexiter)
+			for c in seq():
+				elem = yield pull
+				if elem is StopIteration:
+					break
+				while idx <= old_idx:
+					idx = next(self.indexiter)
+				if c == idx:
+					yield elem
+					old_idx = idx
+					idx = next(self.indexiter)
+		return _AsyncStage(itaker())
+
 
 class drop(Stream):
 	"""Drop the first n elements of the input stream.
@@ -330,6 +604,19 @@ class drop(Stream):
 		collections.deque(itertools.islice(iterator, self.n), maxlen=0)
 		return iterator
 
+	def __acall__(self, aiterator):
+		def dropper():
+			pull = _Pull(aiterator)
+			for _ in xrange(self.n):
+				if (yield pull) is StopIteration:
+					return
+			while 1:
+				x = yield pull
+				if x is StopIteration:
+					return
+				yield x
+		return _AsyncStage(dropper())
+
 
 class dropi(Stream):
 	"""Drop elements of the input stream by indices.
@@ -368,6 +655,20 @@ class dropi(Stream):
 					idx, exhausted = try_next_idx()
 		return idropper()
 
+	def __acall__(self, aiterator):
+		def idropper():
+			pull = _Pull(aiterator)
+			idx = -1
+			for c in seq():
+				elem = yield pull
+				if elem is StopIteration:
+					break
+				while idx is not None and idx < c:
+					idx = next(self.indexiter, None)
+				if c != idx:
+					yield elem
+		return _AsyncStage(idropper())
+
 
 #_______________________________________________________________________
 # Process streams with functions and higher-order ones
@@ -388,7 +689,113 @@ class Processor(Stream):
 		return self.function(iterator)
 
 
-class apply(Stream):
+_fusedloops = {}
+## Cache of compiled fused loops, keyed by tuples of stage opcodes.
+
+def _compile_loop(opcodes, asynchronous=False):
+	# Generate the source of a generator function running all element-wise
+	# stages given by opcodes in a single loop, then compile it.
+	# The stage functions are passed as arguments so that they are fast
+	# local variables inside the loop.  An asynchronous loop is the body
+	# of an _AsyncStage pulling from an asynchronous iterator.
+	args = ', '.join('f%d' % n for n in range(len(opcodes)))
+	head = ['def fused(iterator, %s):' % args]
+	body = []
+	for n, op in enumerate(opcodes):
+		if op == 'map':
+			body += ['x = f%d(x)' % n]
+		elif op == 'apply':
+			body += ['x = f%d(*x)' % n]
+		elif op == 'filter':
+			body += ['if not f%d(x):' % n, '\tcontinue']
+		elif op == 'takewhile':
+			body += ['if not f%d(x):' % n, '\treturn']
+		elif op == 'dropwhile':
+			head += ['\tdropping%d = True' % n]
+			body += ['if dropping%d:' % n,
+			         '\tif f%d(x):' % n,
+			         '\t\tcontinue',
+			         '\tdropping%d = False' % n]
+		else:
+			raise ValueError('cannot fuse stage %r' % op)
+	body += ['yield x']
+	if asynchronous:
+		head += ['\tpull = _Pull(iterator)']
+		loop = ['\twhile 1:', '\t\tx = yield pull', '\t\tif x is StopIteration:', '\t\t\treturn']
+	else:
+		loop = ['\tfor x in iterator:']
+	source = '\n'.join(head + loop + ['\t\t' + l for l in body])
+	namespace = {'_Pull': _Pull}
+	exec compile(source, '<fused %s>' % ' >> '.join(opcodes), 'exec') in namespace
+	namespace['fused'].source = source
+	return namespace['fused']
+
+def _fuse(plan, iterator):
+	# Return an iterator running all stages in plan over iterator, which
+	# may be asynchronous.
+	key = tuple(op for op, _ in plan), hasattr(iterator, '__anext__')
+	try:
+		loop = _fusedloops[key]
+	except KeyError:
+		loop = _fusedloops[key] = _compile_loop(*key)
+	output = loop(iterator, *[function for _, function in plan])
+	return _AsyncStage(output) if key[1] else output
+
+
+class _Elementwise(Stream):
+	"""Base class of the stages that process one element at a time with
+	a function:  apply, map, filter, takewhile and dropwhile.
+
+	Adjacent element-wise stages are fused when piped together, i.e.
+	they are run in a single generated loop instead of each wrapping
+	the iterator of the previous one.  The stages being run are listed
+	in the attribute `plan` as (opcode, function) pairs.
+
+	>>> even = lambda x: x%2 == 0
+	>>> s = range(10) >> map(lambda x: x*x) >> filter(even) >> takewhile(lambda x: x < 50)
+	>>> [op for op, _ in s.plan]
+	['map', 'filter', 'takewhile']
+	>>> s >> list
+	[0, 4, 16, 36]
+
+	An upstream stage that has already been iterated over is not fused.
+	"""
+	opcode = None
+	plan = []
+	_pending = False
+
+	def _get_iterator(self):
+		# The output iterator is only built when needed, so that a
+		# downstream element-wise stage can take over our plan instead.
+		if self._pending:
+			self._pending = False
+			if len(self.plan) > 1 or hasattr(self.source, '__anext__'):
+				self._iterator = _fuse(self.plan, self.source)
+			else:
+				self._iterator = self.__call__(self.source)
+		return self._iterator
+
+	def _set_iterator(self, iterator):
+		self._pending = False
+		self._iterator = iterator
+
+	iterator = property(_get_iterator, _set_iterator)
+
+	def __pipe__(self, inpipe):
+		if isinstance(inpipe, _Elementwise) and inpipe._pending:
+			self.source = inpipe.source
+			self.plan = inpipe.plan + [(self.opcode, self.function)]
+		elif _isasync(inpipe):
+			self.source = _aiter(inpipe)
+			self.plan = [(self.opcode, self.function)]
+		else:
+			self.source = iter(inpipe)
+			self.plan = [(self.opcode, self.function)]
+		self._pending = True
+		return self
+
+
+class apply(_Elementwise):
 	"""Invoke a function using each element of the input stream unpacked as
 	its argument list, a la itertools.starmap.
 
@@ -396,6 +803,8 @@ class apply(Stream):
 	>>> vectoradd([1, 2, 3], [4, 5, 6])
 	[5, 7, 9]
 	"""
+	opcode = 'apply'
+
 	def __init__(self, function):
 		"""function: to be called with each stream element unpacked as its
 		argument list
@@ -407,7 +816,7 @@ class apply(Stream):
 		return itertools.starmap(self.function, iterator)
 
 
-class map(Stream):
+class map(_Elementwise):
 	"""Invoke a function using each element of the input stream as its only
 	argument, a la itertools.imap.
 
@@ -415,6 +824,8 @@ class map(Stream):
 	>>> range(10) >> map(square) >> list
 	[0, 1, 4, 9, 16, 25, 36, 49, 64, 81]
 	"""
+	opcode = 'map'
+
 	def __init__(self, function):
 		"""function: to be called with each stream element as its
 		only argument
@@ -426,7 +837,7 @@ class map(Stream):
 		return itertools.imap(self.function, iterator)
 
 
-class filter(Stream):
+class filter(_Elementwise):
 	"""Filter the input stream, selecting only values which evaluates to True
 	by the given function, a la itertools.ifilter.
 
@@ -434,6 +845,8 @@ class filter(Stream):
 	>>> range(10) >> filter(even) >> list
 	[0, 2, 4, 6, 8]
 	"""
+	opcode = 'filter'
+
 	def __init__(self, function):
 		"""function: to be called with each stream element as its
 		only argument
@@ -445,10 +858,12 @@ class filter(Stream):
 		return itertools.ifilter(self.function, iterator)
 
 
-class takewhile(Stream):
+class takewhile(_Elementwise):
 	"""Take items from the input stream that come before the first item to
 	evaluate to False by the given function, a la itertools.takewhile.
 	"""
+	opcode = 'takewhile'
+
 	def __init__(self, function):
 		"""function: to be called with each stream element as its
 		only argument
@@ -460,10 +875,12 @@ class takewhile(Stream):
 		return itertools.takewhile(self.function, iterator)
 
 
-class dropwhile(Stream):
+class dropwhile(_Elementwise):
 	"""Drop items from the input stream that come before the first item to
 	evaluate to False by the given function, a la itertools.dropwhile.
 	"""
+	opcode = 'dropwhile'
+
 	def __init__(self, function):
 		"""function: to be called with each stream element as its
 		only argument
@@ -505,6 +922,255 @@ class fold(Stream):
 				accumulated = self.function(accumulated, val)
 		return folder()
 
+	def __acall__(self, aiterator):
+		def folder():
+			pull = _Pull(aiterator)
+			if self.initval:
+				accumulated = self.initval
+			else:
+				accumulated = yield pull
+				if accumulated is StopIteration:
+					return
+			while 1:
+				yield accumulated
+				val = yield pull
+				if val is StopIteration:
+					return
+				accumulated = self.function(accumulated, val)
+		return _AsyncStage(folder())
+
+
+#_____________________________________________________________________
+# Window aggregation
+
+
+class _TwoStacks(object):
+	# A FIFO queue of values which also gives their aggregate by an
+	# associative function, in amortised O(1) calls to it.  Values are
+	# pushed on the back stack, whose aggregate is kept up to date.  When
+	# the front stack is empty, popping flips the back stack onto it,
+	# keeping at each level the aggregate of the values from there to the
+	# newest one, so that the top is the aggregate of the whole stack.
+	def __init__(self, function):
+		self.function = function
+		self.front = []
+		self.back = []
+		self.backaggregate = None
+
+	def __len__(self):
+		return len(self.front) + len(self.back)
+
+	def append(self, value):
+		if self.back:
+			self.backaggregate = self.function(self.backaggregate, value)
+		else:
+			self.backaggregate = value
+		self.back.append(value)
+
+	def popleft(self):
+		if not self.front:
+			function = self.function
+			front, back = self.front, self.back
+			aggregate = back.pop()
+			front.append(aggregate)
+			while back:
+				aggregate = function(back.pop(), aggregate)
+				front.append(aggregate)
+			self.backaggregate = None
+		self.front.pop()
+
+	def aggregate(self):
+		if not self.front:
+			return self.backaggregate
+		if not self.back:
+			return self.front[-1]
+		return self.function(self.front[-1], self.backaggregate)
+
+
+class sliding(Stream):
+	"""Aggregate the input stream over a sliding window:  for each item,
+	output the combination by `function` of the last `n` items, or of
+	all of them until n have come.
+
+	>>> range(1, 8) >> sliding(operator.add, 3) >> list
+	[1, 3, 6, 9, 12, 15, 18]
+
+	The function of two arguments has to be associative, but need not be
+	commutative or invertible, as max or string concatenation.  The window
+	is kept in two stacks of partial aggregates, so that each item costs
+	amortised O(1) calls to it whatever the size of the window.
+
+	With `duration` instead of n, the window slides in time.  The input
+	items are then (timestamp, value) pairs, in order of time, and for each
+	one the output is (timestamp, aggregate), where aggregate combines the
+	values timed less than `duration` before.  Items can be timed as they
+	come with map(lambda x: (time.time(), x)).
+
+	>>> [(0, 1), (1, 5), (2, 2), (4, 3), (9, 1)] >> sliding(max, duration=3) >> list
+	[(0, 1), (1, 5), (2, 5), (4, 3), (9, 1)]
+	"""
+	def __init__(self, function, n=None, duration=None):
+		"""function: an associative function of two arguments
+
+		n: the number of items in a window
+
+		duration: the time spanned by a window of (timestamp, value) items
+		"""
+		super(sliding, self).__init__()
+		if (n is None) == (duration is None):
+			raise ValueError('exactly one of n and duration must be given')
+		if n is not None and n < 1:
+			raise ValueError('n must be at least 1')
+		if duration is not None and duration <= 0:
+			raise ValueError('duration must be positive')
+		self.function = function
+		self.n = n
+		self.duration = duration
+
+	def _slider(self):
+		# Return a function of an input item, returning its output item.
+		window = _TwoStacks(self.function)
+		if self.duration is None:
+			n = self.n
+			def slide(x):
+				if len(window) == n:
+					window.popleft()
+				window.append(x)
+				return window.aggregate()
+		else:
+			duration = self.duration
+			timestamps = collections.deque()
+			def slide(pair):
+				t, value = pair
+				while timestamps and timestamps[0] <= t - duration:
+					timestamps.popleft()
+					window.popleft()
+				timestamps.append(t)
+				window.append(value)
+				return t, window.aggregate()
+		return slide
+
+	def __call__(self, iterator):
+		return itertools.imap(self._slider(), iterator)
+
+	def __acall__(self, aiterator):
+		def slider():
+			pull = _Pull(aiterator)
+			slide = self._slider()
+			while 1:
+				x = yield pull
+				if x is StopIteration:
+					return
+				yield slide(x)
+		return _AsyncStage(slider())
+
+	def __repr__(self):
+		return '<sliding(n=%s, duration=%s) at %s>' % (self.n, self.duration, hex(id(self)))
+
+
+class tumbling(Stream):
+	"""Aggregate the input stream over consecutive windows which do not
+	overlap:  output the combination by `function` of every `n` items,
+	the last window having fewer if the input runs out.
+
+	>>> range(1, 8) >> tumbling(operator.add, 3) >> list
+	[6, 15, 7]
+
+	This is the same as reducing each segment of a chop(n), without keeping
+	the segments:  each item costs a single call to the function, which
+	has to be associative.
+
+	With `duration` instead of n, the windows span `duration` in time, each
+	starting at a multiple of it.  The input items are then (timestamp,
+	value) pairs of numbers, in order of time, and the output (start,
+	aggregate) pairs, where start is the time a window starts and aggregate
+	combines the values timed in it.  Windows without items are skipped.
+
+	>>> [(0, 1), (1, 5), (2, 2), (4, 3), (9, 1)] >> tumbling(max, duration=3) >> list
+	[(0, 5), (3, 3), (9, 1)]
+	"""
+	def __init__(self, function, n=None, duration=None):
+		"""function: an associative function of two arguments
+
+		n: the number of items in a window
+
+		duration: the time spanned by a window of (timestamp, value) items
+		"""
+		super(tumbling, self).__init__()
+		if (n is None) == (duration is None):
+			raise ValueError('exactly one of n and duration must be given')
+		if n is not None and n < 1:
+			raise ValueError('n must be at least 1')
+		if duration is not None and duration <= 0:
+			raise ValueError('duration must be positive')
+		self.function = function
+		self.n = n
+		self.duration = duration
+
+	def _tumbler(self):
+		# Return a function of an input item, returning the output item of
+		# the window it completes or StopIteration, and a function returning
+		# that of the last window or StopIteration.
+		function = self.function
+		if self.duration is None:
+			n = self.n
+			state = [0, None]           ## the count and aggregate of a window
+			def tumble(x):
+				state[1] = function(state[1], x) if state[0] else x
+				state[0] += 1
+				if state[0] < n:
+					return StopIteration
+				state[0] = 0
+				return state[1]
+			def flush():
+				return state[1] if state[0] else StopIteration
+		else:
+			duration = self.duration
+			state = [None, None]        ## the start and aggregate of a window
+			def tumble(pair):
+				t, value = pair
+				start = state[0]
+				if start is not None and t < start + duration:
+					state[1] = function(state[1], value)
+					return StopIteration
+				output = StopIteration if start is None else tuple(state)
+				state[:] = [t - t % duration, value]
+				return output
+			def flush():
+				return StopIteration if state[0] is None else tuple(state)
+		return tumble, flush
+
+	def __call__(self, iterator):
+		def tumbler():
+			tumble, flush = self._tumbler()
+			for x in iterator:
+				output = tumble(x)
+				if output is not StopIteration:
+					yield output
+			output = flush()
+			if output is not StopIteration:
+				yield output
+		return tumbler()
+
+	def __acall__(self, aiterator):
+		def tumbler():
+			pull = _Pull(aiterator)
+			tumble, flush = self._tumbler()
+			while 1:
+				x = yield pull
+				if x is StopIteration:
+					break
+				output = tumble(x)
+				if output is not StopIteration:
+					yield output
+			output = flush()
+			if output is not StopIteration:
+				yield output
+		return _AsyncStage(tumbler())
+
+	def __repr__(self):
+		return '<tumbling(n=%s, duration=%s) at %s>' % (self.n, self.duration, hex(id(self)))
+
 
 #_____________________________________________________________________
 # Special purpose stream processors
@@ -515,22 +1181,117 @@ class chop(Stream):
 
 	>>> range(10) >> chop(3) >> list
 	[[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+
+	Segments can also be compact arrays of a given type, either an
+	array.array of a given typecode or a NumPy array of a given dtype.
+
+	>>> range(5) >> chop(2, typecode='d') >> list
+	[array('d', [0.0, 1.0]), array('d', [2.0, 3.0]), array('d', [4.0])]
+
+	With reuse=True, the same segment object is refilled and yielded each
+	time, which is only correct for consumers that do not keep segments.
+	When the segments are NumPy arrays, they are taken from a single
+	preallocated buffer.
+
+	>>> range(5) >> chop(2, reuse=True) >> map(sum) >> list
+	[1, 5, 4]
 	"""
-	def __init__(self, n):
-		"""n: the length of the segments"""
+	def __init__(self, n, typecode=None, dtype=None, reuse=False):
+		"""n: the length of the segments
+
+		typecode: if given, segments are array.array's of this typecode
+
+		dtype: if given, segments are NumPy arrays of this data type
+
+		reuse: whether to refill and yield the same segment every time
+		"""
 		super(chop, self).__init__()
+		if typecode is not None and dtype is not None:
+			raise ValueError('only one of typecode and dtype can be given')
+		if dtype is not None and numpy is None:
+			raise ImportError('chopping into NumPy arrays requires NumPy')
 		self.n = n
+		self.typecode = typecode
+		self.dtype = dtype
+		self.reuse = reuse
 
 	def __call__(self, iterator):
+		n = self.n
+		islice = itertools.islice
+		if not self.reuse:
+			if self.dtype is not None:
+				segment = lambda: numpy.fromiter(islice(iterator, n), self.dtype)
+			elif self.typecode is not None:
+				segment = lambda: array.array(self.typecode, islice(iterator, n))
+			else:
+				segment = lambda: list(islice(iterator, n))
+			return itertools.takewhile(len, repeatcall(segment))
 		def chopper():
-			while 1:
-				s = iterator >> item[:self.n]
-				if s:
+			if self.dtype is not None:
+				## Read in one step, then copied into the preallocated buffer
+				buffer = numpy.empty(n, self.dtype)
+				while 1:
+					s = numpy.fromiter(islice(iterator, n), self.dtype)
+					k = len(s)
+					if not k:
+						break
+					buffer[:k] = s
+					yield buffer if k == n else buffer[:k]
+			elif self.typecode is not None:
+				s = array.array(self.typecode)
+				while 1:
+					del s[:]
+					s.extend(islice(iterator, n))
+					if not s:
+						break
+					yield s
+			else:
+				s = []
+				while 1:
+					s[:] = islice(iterator, n)
+					if not s:
+						break
 					yield s
-				else:
-					break
 		return chopper()
 
+	def __acall__(self, aiterator):
+		n = self.n
+		if self.dtype is not None:
+			if self.reuse:
+				buffer = numpy.empty(n, self.dtype)
+				def segment(s):
+					buffer[:len(s)] = s
+					return buffer if len(s) == n else buffer[:len(s)]
+			else:
+				segment = lambda s: numpy.array(s, self.dtype)
+		elif self.typecode is not None:
+			if self.reuse:
+				a = array.array(self.typecode)
+				def segment(s):
+					del a[:]
+					a.extend(s)
+					return a
+			else:
+				segment = lambda s: array.array(self.typecode, s)
+		elif self.reuse:
+			segment = lambda s: s
+		else:
+			segment = list
+		def chopper():
+			pull = _Pull(aiterator)
+			s = []
+			while 1:
+				x = yield pull
+				if x is StopIteration:
+					break
+				s.append(x)
+				if len(s) == n:
+					yield segment(s)
+					del s[:]
+			if s:
+				yield segment(s)
+		return _AsyncStage(chopper())
+
 
 class itemcutter(map):
 	"""Slice each element of the input stream.
@@ -579,82 +1340,958 @@ class flattener(Stream):
 						break
 		return flatten()
 
+	@staticmethod
+	def __acall__(aiterator):
+		def flatten():
+			## Nested iterables may be synchronous or asynchronous
+			stack = []
+			i = aiterator
+			while True:
+				if hasattr(i, '__anext__'):
+					e = yield _Pull(i)
+				else:
+					e = next(i, StopIteration)
+				if e is StopIteration:
+					if not stack:
+						break
+					i = stack.pop()
+				elif _isasync(e):
+					stack.append(i)
+					i = _aiter(e)
+				elif hasattr(e, "__iter__") and not isinstance(e, basestring):
+					stack.append(i)
+					i = iter(e)
+				else:
+					yield e
+		return _AsyncStage(flatten())
+
 	def __repr__(self):
 		return '<flattener at %s>' % hex(id(self))
 
 flatten = flattener()
 
 
-#_______________________________________________________________________
-# Combine multiple streams
+#_____________________________________________________________________
+# Sorting
+
+
+class _Reversed(object):
+	# A key which orders its value the other way around.
+	__slots__ = ['value']
+
+	def __init__(self, value):
+		self.value = value
+
+	def __lt__(self, other):
+		return other.value < self.value
+
+	def __eq__(self, other):
+		return self.value == other.value
+
+
+def _merge(iterables, key=None, reverse=False):
+	# Merge sorted iterables lazily, like heapq.merge, but also by key
+	# and from largest to smallest.  Items with equal keys come in the
+	# order of the iterables.
+	if key is None and not reverse:
+		return heapq.merge(*iterables)
+	if key is None:
+		key = lambda x: x
+	if reverse:
+		key = lambda x, key=key: _Reversed(key(x))
+	def merge():
+		heap = []
+		for order, iterable in enumerate(iterables):
+			iterator = iter(iterable)
+			for x in iterator:
+				heap.append([key(x), order, x, iterator])
+				break
+		heapq.heapify(heap)
+		while heap:
+			entry = heap[0]
+			yield entry[2]
+			iterator = entry[3]
+			for x in iterator:
+				entry[0] = key(x)
+				entry[2] = x
+				heapq.heapreplace(heap, entry)
+				break
+			else:
+				heapq.heappop(heap)
+	return merge()
 
 
-class prepend(Stream):
-	"""Inject values at the beginning of the input stream.
+def _spill(run, directory, blocksize):
+	# Write the items of a sorted run to a temporary file in directory,
+	# as pickles of blocksize items, and return the file.
+	f = tempfile.TemporaryFile(dir=directory)
+	run = iter(run)
+	while 1:
+		block = list(itertools.islice(run, blocksize))
+		if not block:
+			break
+		pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+	f.seek(0)
+	return f
 
-	>>> seq(7, 7) >> prepend(xrange(0, 10, 2)) >> item[:10]
-	[0, 2, 4, 6, 8, 7, 14, 21, 28, 35]
-	"""
-	def __call__(self, iterator):
-		return itertools.chain(self.iterator, iterator)
 
+def _load(f):
+	# Read the items of a run back.
+	while 1:
+		try:
+			block = pickle.load(f)
+		except EOFError:
+			break
+		for x in block:
+			yield x
 
-class tee(Stream):
-	"""Make a T-split of the input stream.
 
-	>>> foo = filter(lambda x: x%3==0)
-	>>> bar = seq(0, 2) >> tee(foo)
-	>>> bar >> item[:5]
-	[0, 2, 4, 6, 8]
-	>>> foo >> item[:5]
-	[0, 6, 12, 18, 24]
+class sort(Stream):
+	"""Sort the input stream, even if it does not fit in memory.
+
+	>>> [3, 1, 2] >> sort() >> list
+	[1, 2, 3]
+
+	Items are sorted in runs of at most `memory_limit` bytes, as estimated
+	with sys.getsizeof, each but the last of which is spilled to a temporary
+	file in `directory`.  The runs are then merged lazily, reading a block
+	of `blocksize` items at a time from each file.  Runs are written as
+	pickles of blocks, with the highest protocol, and their files deleted
+	once the output is exhausted or abandoned.  Whenever `fanin` runs have
+	been spilled, they are merged into a single one, so that no more files
+	are open at once.
+
+	The sort is stable, and `key` and `reverse` are as for sorted().
+
+	>>> words = 'the quick brown fox jumps over the lazy dog'.split()
+	>>> words >> sort(key=len, reverse=True, memory_limit=200) >> list
+	['quick', 'brown', 'jumps', 'over', 'lazy', 'the', 'fox', 'the', 'dog']
 	"""
-	def __init__(self, named_stream):
-		"""named_stream: a Stream object toward which the split branch
-		will be piped.
-		"""
-		super(tee, self).__init__()
-		self.named_stream = named_stream
+	def __init__(self, key=None, reverse=False, memory_limit=1 << 28,
+	             directory=None, blocksize=1024, fanin=256):
+		"""key: a function of one argument to extract a comparison key
 
-	def __pipe__(self, inpipe):
-		branch1, branch2 = itertools.tee(iter(inpipe))
-		self.iterator = branch1
-		Stream.pipe(branch2, self.named_stream)
-		return self
+		reverse: whether to sort from largest to smallest
 
+		memory_limit: the size in bytes of the items sorted in memory
 
-#_____________________________________________________________________
-# _iterqueue and _iterrecv
+		directory: where to write runs, by default the temporary directory
 
+		blocksize: the number of items of a run read or written at once
 
-def _iterqueue(queue):
-	# Turn a either a threading.Queue or a multiprocessing.queues.SimpleQueue
-	# into an thread-safe iterator which will exhaust when StopIteration is
-	# put into it.
-	while 1:
-		item = queue.get()
-		if item is StopIteration:
-			# Re-broadcast, in case there is another listener blocking on
-			# queue.get().  That listener will receive StopIteration and
-			# re-broadcast to the next one in line.
+		fanin: the maximum number of runs merged at once
+		"""
+		super(sort, self).__init__()
+		self.key = key
+		self.reverse = reverse
+		self.memory_limit = memory_limit
+		self.directory = directory
+		self.blocksize = blocksize
+		self.fanin = fanin
+
+	def __call__(self, iterator):
+		def sort():
+			runs = []
 			try:
-				queue.put(StopIteration)
-			except IOError:
-				# Could happen if the Queue is based on a system pipe,
-				# and the other end was closed.
-				pass
-			break
-		else:
-			yield item
+				run, size = [], 0
+				getsizeof = sys.getsizeof
+				for x in iterator:
+					run.append(x)
+					size += getsizeof(x) + 8     ## and a pointer in run
+					if size >= self.memory_limit:
+						run.sort(key=self.key, reverse=self.reverse)
+						runs.append(_spill(run, self.directory, self.blocksize))
+						run, size = [], 0
+						if len(runs) >= self.fanin:
+							merged = _merge(__builtin__.map(_load, runs),
+							                self.key, self.reverse)
+							merged = _spill(merged, self.directory, self.blocksize)
+							for f in runs:
+								f.close()
+							runs = [merged]
+				run.sort(key=self.key, reverse=self.reverse)
+				if not runs:
+					output = run
+				else:
+					inputs = __builtin__.map(_load, runs) + [run]
+					output = _merge(inputs, self.key, self.reverse)
+				for x in output:
+					yield x
+			finally:
+				for f in runs:
+					f.close()
+		return sort()
 
-def _iterrecv(pipe):
-	# Turn a the receiving end of a multiprocessing.Connection object
-	# into an iterator which will exhaust when StopIteration is
-	# put into it.  _iterrecv is NOT safe to use by multiple threads.
+	def __repr__(self):
+		return '<sort(memory_limit=%s) at %s>' % (self.memory_limit, hex(id(self)))
+
+
+class _ChunkedConnection(object):
+	# The receiving end of a connection over which items are sent in
+	# chunks:  recv() returns them one by one, and raises an exception
+	# sent in place of a chunk.
+	def __init__(self, connection):
+		self.connection = connection
+		self.chunk = collections.deque()
+
+	def recv(self):
+		if not self.chunk:
+			chunk = self.connection.recv()
+			if chunk is StopIteration:
+				return StopIteration
+			if isinstance(chunk, BaseException):
+				raise chunk
+			self.chunk = collections.deque(chunk)
+		return self.chunk.popleft()
+
+
+class _PipedWorker(object):
+	# A worker process running target(input, output, *args), which
+	# receives what is sent to inpipe and sends back chunks of items,
+	# read one by one from outpipe.  It can be piped to a PSorter.
+	def __init__(self, target, *args):
+		inreader, self.inpipe = multiprocessing.Pipe(duplex=False)
+		outreader, outwriter = multiprocessing.Pipe(duplex=False)
+		self.process = multiprocessing.Process(target=_runpiped,
+		                                       args=(target, inreader, outwriter) + args)
+		self.process.start()
+		inreader.close()
+		outwriter.close()
+		self.outpipe = _ChunkedConnection(outreader)
+
+def _runpiped(target, input, output, *args):
+	# Run target in a _PipedWorker, and send the exception it raises, if
+	# any, to be raised again by the reader of its output.
+	try:
+		target(input, output, *args)
+	except Exception, e:
+		output.send(e)
+		for _ in _iterrecv(input):     ## until all the input is sent
+			pass
+
+def _sendchunks(output, iterable, chunksize):
+	# Send the items of iterable in chunks of chunksize, then StopIteration.
+	iterator = iter(iterable)
 	while 1:
-		try:
-			item = pipe.recv()
-		except EOFError:
+		chunk = list(itertools.islice(iterator, chunksize))
+		if not chunk:
+			break
+		output.send(chunk)
+	output.send(StopIteration)
+
+def _sortrun(input, output, key, reverse, chunksize, memory_limit):
+	# Run in a worker of a parallel_sort:  receive (base index, chunk)
+	# pairs, and send back the (key, index, item) of the items received,
+	# sorted by key, in chunks.
+	def decorated():
+		for base, chunk in _iterrecv(input):
+			keys = chunk if key is None else __builtin__.map(key, chunk)
+			for x in itertools.izip(keys, itertools.count(base), chunk):
+				yield x
+	if memory_limit is None:
+		run = sorted(decorated(), key=itemgetter(0), reverse=reverse)
+	else:
+		run = decorated() >> sort(key=itemgetter(0), reverse=reverse,
+		                          memory_limit=memory_limit)
+	_sendchunks(output, run, chunksize)
+
+
+class parallel_sort(Stream):
+	"""Sort the input stream using many worker processes.
+
+	>>> range(10, 0, -1) >> parallel_sort(nworkers=2) >> list
+	[1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+
+	The input is sent in chunks of `chunksize` items to `nworkers` worker
+	processes in turn.  Each worker computes the keys of its share, sorts
+	it, and sends it back in chunks.  The sorted runs are then merged by a
+	PSorter on the keys already computed.  The sort is stable, and `key`
+	and `reverse` are as for sorted().
+
+	All items are sent to the workers before the first one is output.  A
+	worker sorts its share in memory,
+	unless `memory_limit` is given, in which case it sorts it with a sort
+	stage with that memory_limit.  Interprocess communication and merging
+	take a few microseconds per item, so this is faster than sorted() when
+	the key is costly, or the items are large and the merge output is all
+	that is needed.  An exception raised by `key` in a worker is raised
+	again by the output.
+	"""
+	def __init__(self, key=None, reverse=False, nworkers=_nCPU, chunksize=1024,
+	             memory_limit=None):
+		"""key: a function of one argument to extract a comparison key
+
+		reverse: whether to sort from largest to smallest
+
+		nworkers: the number of worker processes
+
+		chunksize: the number of items sent to or from a worker at once
+
+		memory_limit: if given, the memory_limit of the sort stage of
+		each worker
+		"""
+		super(parallel_sort, self).__init__()
+		self.key = key
+		self.reverse = reverse
+		self.nworkers = nworkers
+		self.chunksize = chunksize
+		self.memory_limit = memory_limit
+
+	def __call__(self, iterator):
+		def sort():
+			## Items come out in order of key, then of index
+			if self.reverse:
+				sorter = PSorter(key=lambda x: (_Reversed(x[0]), x[1]))
+			else:
+				sorter = PSorter()
+			workers = [_PipedWorker(_sortrun, self.key, self.reverse,
+			                        self.chunksize, self.memory_limit)
+			           for _ in xrange(self.nworkers)]
+			try:
+				base = 0
+				for worker in itertools.cycle(workers):
+					chunk = list(itertools.islice(iterator, self.chunksize))
+					if not chunk:
+						break
+					worker.inpipe.send((base, chunk))
+					base += len(chunk)
+				for worker in workers:
+					worker.inpipe.send(StopIteration)
+					worker >> sorter
+				for x in sorter:
+					yield x[2]
+			finally:
+				for worker in workers:
+					worker.process.terminate()    ## if abandoned
+					worker.process.join()
+		return sort()
+
+	def __repr__(self):
+		return '<parallel_sort(nworkers=%s) at %s>' % (self.nworkers, hex(id(self)))
+
+
+#_____________________________________________________________________
+# Grouping by key
+
+
+def _hashkey(key):
+	# Order keys by hash first, so that any hashable keys can be grouped
+	# after a merge:  keys are only compared when their hashes are equal.
+	return hash(key), key
+
+
+def _records(groups, blocksize):
+	# Yield the (key, values) records of a dict of lists of values,
+	# ordered by _hashkey, with at most blocksize values in each.
+	for key in sorted(groups, key=_hashkey):
+		values = groups[key]
+		for i in xrange(0, len(values), blocksize):
+			yield key, values[i:i+blocksize]
+
+
+def _group(key, values):
+	# The default reducer of a shuffle.
+	return list(values)
+
+
+def _reducerun(input, output, reducer, combiner, chunksize, memory_limit,
+               directory, blocksize):
+	# Run in a reducer of a shuffle:  receive chunks of (key, value)
+	# pairs and group the values by key, spilling the groups as a run
+	# sorted by _hashkey whenever they take more than memory_limit bytes,
+	# then send back the (key, reducer(key, values)) pairs in chunks.
+	groups, size, runs = {}, 0, []
+	getsizeof = sys.getsizeof
+	try:
+		for chunk in _iterrecv(input):
+			for key, value in chunk:
+				values = groups.get(key)
+				if values is None:
+					groups[key] = [value]
+					size += getsizeof(key) + getsizeof(value) + 128    ## and a list in a dict
+				elif combiner is None:
+					values.append(value)
+					size += getsizeof(value) + 8
+				else:
+					values[0] = combiner(values[0], value)
+					continue
+				if size >= memory_limit:
+					runs.append(_spill(_records(groups, blocksize), directory, blocksize))
+					groups, size = {}, 0
+		if not runs:
+			grouped = ((key, iter(values)) for key, values in groups.iteritems())
+		else:
+			## Records of a key are merged in the order of runs, and its
+			## values read lazily, a record at a time
+			inputs = __builtin__.map(_load, runs) + [_records(groups, blocksize)]
+			merged = _merge(inputs, key=lambda record: _hashkey(record[0]))
+			grouped = ((key, itertools.chain.from_iterable(values for _, values in records))
+			           for key, records in itertools.groupby(merged, itemgetter(0)))
+		_sendchunks(output, ((key, reducer(key, values)) for key, values in grouped),
+		            chunksize)
+	finally:
+		for f in runs:
+			f.close()
+
+
+class shuffle(Stream):
+	"""Group the input stream by key using many reducer processes, as in
+	the shuffle phase of map-reduce.
+
+	Input items are (key, value) pairs, or with `key`, the items are the
+	values and key(item) their key.  Each key is assigned to one of
+	`nreducers` reducer processes by its hash, and the pairs are sent in
+	chunks of `chunksize`.  A reducer groups the values it receives by
+	key, then outputs (key, reducer(key, values)) for each of its keys,
+	where values is an iterator over the values of the key, in input
+	order.  By default, reducer returns them as a list.  The output comes
+	from one reducer after another once all the input is sent, the keys of
+	each in no particular order.
+
+	>>> words = 'the quick brown fox jumps over the lazy dog'.split()
+	>>> words >> shuffle(nreducers=2, key=len) >> sorted
+	[(3, ['the', 'fox', 'the', 'dog']), (4, ['over', 'lazy']), (5, ['quick', 'brown', 'jumps'])]
+
+	With a `combiner`, a function of two values returning one, the values
+	of a key are folded as soon as they meet:  in the chunks being filled,
+	so that fewer pairs are sent, and in the reducer.  The values given to
+	reducer are then results of the combiner, which it has to accept, as
+	sum does for operator.add.
+
+	>>> pairs = [(w[0], 1) for w in words]
+	>>> count = lambda letter, ones: sum(ones)
+	>>> pairs >> shuffle(2, reducer=count, combiner=operator.add) >> sorted
+	[('b', 1), ('d', 1), ('f', 1), ('j', 1), ('l', 1), ('o', 1), ('q', 1), ('t', 2)]
+
+	A reducer keeps the groups of its keys in memory up to `memory_limit`
+	bytes, as estimated with sys.getsizeof, beyond which they are spilled
+	to a temporary file in `directory`, as by a sort stage.  The spilled
+	groups are merged back once the input is exhausted, and the values of
+	a key read `blocksize` at a time, so that a key with more values than
+	fit in memory can still be reduced by a reducer iterating over them.
+	Keys only have to be hashable, but distinct keys with equal hashes are
+	compared when spilled.  An exception raised by `reducer` or `combiner`
+	is raised again by the output.
+	"""
+	def __init__(self, nreducers=_nCPU, key=None, reducer=None, combiner=None,
+	             chunksize=1024, memory_limit=1 << 28, directory=None, blocksize=1024):
+		"""nreducers: the number of reducer processes
+
+		key: a function of one argument to extract the key of an item, by
+		default the items are (key, value) pairs
+
+		reducer: a function of a key and an iterator over its values,
+		whose result is output with the key
+
+		combiner: a function of two values to fold them into one
+
+		chunksize: the number of pairs sent to or from a reducer at once
+
+		memory_limit: the size in bytes of the groups a reducer keeps in
+		memory
+
+		directory: where to spill groups, by default the temporary directory
+
+		blocksize: the number of values spilled or read back at once
+		"""
+		super(shuffle, self).__init__()
+		self.nreducers = nreducers
+		self.key = key
+		self.reducer = reducer or _group
+		self.combiner = combiner
+		self.chunksize = chunksize
+		self.memory_limit = memory_limit
+		self.directory = directory
+		self.blocksize = blocksize
+
+	def _send(self, iterator, inpipes):
+		# Send the (key, value) pairs of the input to the reducers by hash
+		# of key, in chunks, folding the values of a key in a chunk with
+		# the combiner if any.
+		n = len(inpipes)
+		if self.key is not None:
+			iterator = ((self.key(x), x) for x in iterator)
+		combiner = self.combiner
+		if combiner is None:
+			chunks = [[] for _ in inpipes]
+			for pair in iterator:
+				i = hash(pair[0]) % n
+				chunk = chunks[i]
+				chunk.append(pair)
+				if len(chunk) >= self.chunksize:
+					inpipes[i].send(chunk)
+					chunks[i] = []
+		else:
+			chunks = [{} for _ in inpipes]
+			for key, value in iterator:
+				i = hash(key) % n
+				chunk = chunks[i]
+				if key in chunk:
+					chunk[key] = combiner(chunk[key], value)
+				else:
+					chunk[key] = value
+					if len(chunk) >= self.chunksize:
+						inpipes[i].send(chunk.items())
+						chunks[i] = {}
+			chunks = [chunk.items() for chunk in chunks]
+		for inpipe, chunk in itertools.izip(inpipes, chunks):
+			if chunk:
+				inpipe.send(chunk)
+			inpipe.send(StopIteration)
+
+	def __call__(self, iterator):
+		def shuffle():
+			workers = [_PipedWorker(_reducerun, self.reducer, self.combiner,
+			                        self.chunksize, self.memory_limit,
+			                        self.directory, self.blocksize)
+			           for _ in xrange(self.nreducers)]
+			try:
+				self._send(iterator, [worker.inpipe for worker in workers])
+				for worker in workers:
+					for x in _iterrecv(worker.outpipe):
+						yield x
+			finally:
+				for worker in workers:
+					worker.process.terminate()    ## if abandoned
+					worker.process.join()
+		return shuffle()
+
+	def __repr__(self):
+		return '<%s(nreducers=%s) at %s>' % (type(self).__name__, self.nreducers,
+		                                     hex(id(self)))
+
+
+class group_by_key(shuffle):
+	"""Group the values of the input stream by key using many reducer
+	processes:  output (key, values) pairs, values being the list of the
+	values of the key in input order.  This is a shuffle with its default
+	reducer.
+
+	>>> [('a', 1), ('b', 2), ('a', 3)] >> group_by_key(nreducers=2) >> sorted
+	[('a', [1, 3]), ('b', [2])]
+	"""
+	def __init__(self, nreducers=_nCPU, key=None, chunksize=1024,
+	             memory_limit=1 << 28, directory=None, blocksize=1024):
+		"""nreducers: the number of reducer processes
+
+		key: a function of one argument to extract the key of an item, by
+		default the items are (key, value) pairs
+
+		The other arguments are as for shuffle, in the same order.
+		"""
+		super(group_by_key, self).__init__(nreducers, key, chunksize=chunksize,
+		                                   memory_limit=memory_limit,
+		                                   directory=directory, blocksize=blocksize)
+
+
+#_____________________________________________________________________
+# Vectorized stream processors using NumPy
+
+
+def _blocks(iterator, blocksize, dtype):
+	# Pull items from iterator into NumPy arrays of at most blocksize items.
+	while 1:
+		block = numpy.fromiter(itertools.islice(iterator, blocksize), dtype)
+		if len(block):
+			yield block
+		else:
+			break
+
+
+def _cast(blocks, dtype):
+	# Convert NumPy arrays to dtype, those of another data type only.
+	dtype = numpy.dtype(dtype)
+	for block in blocks:
+		yield block if block.dtype == dtype else block.astype(dtype)
+
+
+def _reblock(blocks, blocksize):
+	# Split and join NumPy arrays into arrays of blocksize items, but the last.
+	pending = []
+	npending = 0
+	for block in blocks:
+		while len(block):
+			k = min(blocksize - npending, len(block))
+			pending.append(block[:k])
+			npending += k
+			block = block[k:]
+			if npending == blocksize:
+				yield pending[0] if len(pending) == 1 else numpy.concatenate(pending)
+				pending = []
+				npending = 0
+	if pending:
+		yield numpy.concatenate(pending)
+
+
+class _Vectorized(Stream):
+	"""Base class of the stages that process the input stream block by
+	block, each block being a NumPy array of up to `blocksize` items.
+
+	The output is unbatched back into items, unless `unbatch` is False,
+	in which case the output stream consists of the arrays themselves.
+	A vectorized stage piped into another works directly on its blocks,
+	which are only cast or re-blocked if it is given its own `dtype` or
+	`blocksize`.  Each subclass defines process(blocks), which turns an iterator of
+	blocks into another.
+
+	These stages require NumPy, which is otherwise not needed.
+	"""
+	def __init__(self, function, blocksize=None, dtype=None, unbatch=True):
+		"""function: to be called with each block, a NumPy array
+
+		blocksize: the number of items in each block, by default 4096 or
+		as output by a vectorized stage piped into this one
+
+		dtype: the NumPy data type of the blocks, by default float or as
+		output by a vectorized stage piped into this one
+
+		unbatch: whether to yield items rather than blocks
+		"""
+		if numpy is None:
+			raise ImportError('vectorized stream processors require NumPy')
+		super(_Vectorized, self).__init__()
+		self.function = function
+		self.blocksize = blocksize
+		self.dtype = dtype
+		self.unbatch = unbatch
+		self.blocks = iter([])
+		self.started = False
+
+	def _output(self, blocks):
+		def watch():
+			self.started = True
+			for block in self.process(blocks):
+				yield block
+		self.blocks = watch()
+		if self.unbatch:
+			return itertools.chain.from_iterable(
+				itertools.imap(methodcaller('tolist'), self.blocks))
+		else:
+			return self.blocks
+
+	def __call__(self, iterator):
+		blocksize = 4096 if self.blocksize is None else self.blocksize
+		dtype = float if self.dtype is None else self.dtype
+		return self._output(_blocks(iterator, blocksize, dtype))
+
+	def __pipe__(self, inpipe):
+		if isinstance(inpipe, _Vectorized) \
+			and not (inpipe.unbatch and inpipe.started):
+			blocks = inpipe.blocks
+			if self.dtype is not None:
+				blocks = _cast(blocks, self.dtype)
+			if self.blocksize is not None:
+				blocks = _reblock(blocks, self.blocksize)
+			self.iterator = self._output(blocks)
+		else:
+			self.iterator = self.__call__(iter(inpipe))
+		return self
+
+
+class vmap(_Vectorized):
+	"""Invoke a function on blocks of the input stream, e.g. a NumPy ufunc
+	or an expression of them, which must return an array of the same
+	length.  The vectorized counterpart of map::
+
+	  range(10) >> vmap(lambda x: x*x, dtype=int) >> list
+	  # [0, 1, 4, 9, 16, 25, 36, 49, 64, 81]
+	"""
+	def process(self, blocks):
+		return itertools.imap(self.function, blocks)
+
+
+class vfilter(_Vectorized):
+	"""Filter blocks of the input stream by the boolean mask returned by
+	the given function.  The vectorized counterpart of filter::
+
+	  range(10) >> vfilter(lambda x: x%2 == 0, dtype=int) >> list
+	  # [0, 2, 4, 6, 8]
+	"""
+	def process(self, blocks):
+		function = self.function
+		for block in blocks:
+			block = block[function(block)]
+			if len(block):
+				yield block
+
+
+class vfold(_Vectorized):
+	"""Running accumulation of the input stream using the `accumulate`
+	method of a binary NumPy ufunc, such as numpy.add.  The vectorized
+	counterpart of fold, yielding the same values::
+
+	  gseq(0.5) >> vfold(numpy.add) >> item[:5]
+	  # [1.0, 1.5, 1.75, 1.875, 1.9375]
+	"""
+	def __init__(self, function, initval=None, **kwargs):
+		"""function: a binary NumPy ufunc
+
+		initval: used as the starting value if supplied
+
+		Other keyword arguments are as of vmap.
+		"""
+		super(vfold, self).__init__(function, **kwargs)
+		self.initval = initval
+
+	def process(self, blocks):
+		accumulate = self.function.accumulate
+		carry = self.initval
+		first = carry is not None
+		for block in blocks:
+			if carry is not None:
+				# Accumulate starting from the carried value, as fold does,
+				# which is output first
+				block = accumulate(numpy.concatenate(([carry], block)))
+				if not first:
+					block = block[1:]
+			else:
+				block = accumulate(block)
+			first = False
+			carry = block[-1]
+			yield block
+		if first:
+			yield numpy.array([carry], float if self.dtype is None else self.dtype)
+
+
+#_______________________________________________________________________
+# Combine multiple streams
+
+
+class prepend(Stream):
+	"""Inject values at the beginning of the input stream.
+
+	>>> seq(7, 7) >> prepend(xrange(0, 10, 2)) >> item[:10]
+	[0, 2, 4, 6, 8, 7, 14, 21, 28, 35]
+	"""
+	def __call__(self, iterator):
+		return itertools.chain(self.iterator, iterator)
+
+	def __acall__(self, aiterator):
+		iterator = self.iterator
+		def chain():
+			for x in iterator:
+				yield x
+			pull = _Pull(aiterator)
+			while 1:
+				x = yield pull
+				if x is StopIteration:
+					break
+				yield x
+		return _AsyncStage(chain())
+
+
+class tee(Stream):
+	"""Make a T-split of the input stream.
+
+	>>> foo = filter(lambda x: x%3==0)
+	>>> bar = seq(0, 2) >> tee(foo)
+	>>> bar >> item[:5]
+	[0, 2, 4, 6, 8]
+	>>> foo >> item[:5]
+	[0, 6, 12, 18, 24]
+
+	The items not yet consumed by one branch are buffered without bound.
+	See also: broadcast
+	"""
+	def __init__(self, named_stream):
+		"""named_stream: a Stream object toward which the split branch
+		will be piped.
+		"""
+		super(tee, self).__init__()
+		self.named_stream = named_stream
+
+	def __pipe__(self, inpipe):
+		branch1, branch2 = itertools.tee(iter(inpipe))
+		self.iterator = branch1
+		Stream.pipe(branch2, self.named_stream)
+		return self
+
+
+class _SpillBuffer(object):
+	# A FIFO buffer keeping at most maxsize items in memory, and pickling
+	# the rest into a temporary file.
+	def __init__(self, maxsize):
+		self.maxsize = maxsize
+		self.memory = collections.deque()
+		self.file = None
+		self.spilled = 0
+		self.readpos = self.writepos = 0
+
+	def __len__(self):
+		return len(self.memory) + self.spilled
+
+	def append(self, item):
+		if self.spilled or len(self.memory) >= self.maxsize:
+			if self.file is None:
+				self.file = tempfile.TemporaryFile()
+			self.file.seek(self.writepos)
+			pickle.dump(item, self.file, pickle.HIGHEST_PROTOCOL)
+			self.writepos = self.file.tell()
+			self.spilled += 1
+		else:
+			self.memory.append(item)
+
+	def popleft(self):
+		if not self.memory and self.spilled:
+			# Read back the oldest spilled items
+			n = min(self.maxsize, self.spilled)
+			self.file.seek(self.readpos)
+			for _ in xrange(n):
+				self.memory.append(pickle.load(self.file))
+			self.spilled -= n
+			self.readpos = self.file.tell()
+			if not self.spilled:
+				self.file.seek(0)
+				self.file.truncate()
+				self.readpos = self.writepos = 0
+		return self.memory.popleft()
+
+
+class broadcast(Stream):
+	"""Broadcast the input stream to many branches.
+
+	Like tee, the broadcast object is the main branch and the other
+	branches are piped toward the given named streams.  Items which have
+	not yet been consumed by a branch are kept in a buffer of at most
+	`maxsize` items.  When a branch lags so much that its buffer is full,
+	the policy is one of:
+
+	  'block':  the other branches wait for it to consume some items,
+	            so the branches must be consumed from different threads;
+	  'drop':   the oldest items in its buffer are dropped;
+	  'spill':  the newest items are pickled to a temporary file.
+
+	>>> foo = map(lambda x: -x)
+	>>> bar = map(lambda x: x*10)
+	>>> main = range(10) >> broadcast(foo, bar, maxsize=3, policy='spill')
+	>>> main >> list
+	[0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+	>>> foo >> list
+	[0, -1, -2, -3, -4, -5, -6, -7, -8, -9]
+	>>> main = range(10) >> broadcast(bar, maxsize=3, policy='drop')
+	>>> main >> list
+	[0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+	>>> bar >> list
+	[70, 80, 90]
+
+	The branches are safe to be consumed from different threads.
+	"""
+	def __init__(self, *named_streams, **kwargs):
+		"""named_streams: Stream objects toward which the other branches
+		will be piped.
+
+		maxsize: the maximum number of items buffered for each branch,
+		default to 1024.
+
+		policy: either 'block' (default), 'drop' or 'spill'.
+		"""
+		super(broadcast, self).__init__()
+		self.named_streams = named_streams
+		self.maxsize = kwargs.pop('maxsize', 1024)
+		self.policy = kwargs.pop('policy', 'block')
+		if kwargs:
+			raise TypeError('unexpected keyword arguments: %s' % ', '.join(kwargs))
+		if self.policy not in ('block', 'drop', 'spill'):
+			raise ValueError("policy must be 'block', 'drop' or 'spill'")
+
+	def __pipe__(self, inpipe):
+		source = iter(inpipe)
+		n = len(self.named_streams) + 1
+		if self.policy == 'drop':
+			buffers = [collections.deque(maxlen=self.maxsize) for _ in range(n)]
+		elif self.policy == 'spill':
+			buffers = [_SpillBuffer(self.maxsize) for _ in range(n)]
+		else:
+			buffers = [collections.deque() for _ in range(n)]
+		cond = threading.Condition()
+		state = {'pulling': False, 'exhausted': False}
+		blocking = self.policy == 'block'
+		maxsize = self.maxsize
+		def branch(buffer):
+			others = [b for b in buffers if b is not buffer]
+			while 1:
+				with cond:
+					while 1:
+						if buffer:
+							if blocking and len(buffer) >= maxsize:
+								cond.notify_all()
+							item = buffer.popleft()
+							pull = False
+							break
+						elif state['exhausted']:
+							return
+						elif state['pulling'] or (blocking and
+							any(len(b) >= maxsize for b in others)):
+							cond.wait()
+						else:
+							state['pulling'] = pull = True
+							break
+				if pull:
+					# Pull a new item without holding the lock meanwhile,
+					# then hand it to the other branches.
+					try:
+						item = next(source)
+					except StopIteration:
+						with cond:
+							state['pulling'] = False
+							state['exhausted'] = True
+							cond.notify_all()
+						return
+					except:
+						with cond:
+							state['pulling'] = False
+							cond.notify_all()
+						raise
+					with cond:
+						for b in others:
+							b.append(item)
+						state['pulling'] = False
+						cond.notify_all()
+				yield item
+		self.branches = [branch(b) for b in buffers]
+		self.iterator = self.branches[0]
+		for named_stream, b in zip(self.named_streams, self.branches[1:]):
+			Stream.pipe(b, named_stream)
+		return self
+
+	def __repr__(self):
+		return '<broadcast(maxsize=%s, policy=%r) at %s>' % (self.maxsize,
+		                                                     self.policy,
+		                                                     hex(id(self)))
+
+
+#_____________________________________________________________________
+# _iterqueue and _iterrecv
+
+
+def _iterqueue(queue):
+	# Turn a either a threading.Queue or a multiprocessing.queues.SimpleQueue
+	# into an thread-safe iterator which will exhaust when StopIteration is
+	# put into it.
+	while 1:
+		item = queue.get()
+		if item is StopIteration:
+			# Re-broadcast, in case there is another listener blocking on
+			# queue.get().  That listener will receive StopIteration and
+			# re-broadcast to the next one in line.
+			try:
+				queue.put(StopIteration)
+			except IOError:
+				# Could happen if the Queue is based on a system pipe,
+				# and the other end was closed.
+				pass
+			break
+		else:
+			yield item
+
+def _iterrecv(pipe):
+	# Turn a the receiving end of a multiprocessing.Connection object
+	# into an iterator which will exhaust when StopIteration is
+	# put into it.  _iterrecv is NOT safe to use by multiple threads.
+	while 1:
+		try:
+			item = pipe.recv()
+		except EOFError:
 			break
 		else:
 			if item is StopIteration:
@@ -663,10 +2300,364 @@ def _iterrecv(pipe):
 				yield item
 
 
+#_____________________________________________________________________
+# Shared memory transport
+
+
+class _SharedBlock(object):
+	# A picklable handle to a buffer placed in a shared memory file.
+	def __init__(self, path, kind, size, dtype=None, shape=None):
+		self.path = path
+		self.kind = kind
+		self.size = size
+		self.dtype = dtype
+		self.shape = shape
+
+
+class SharedMemory(object):
+	"""A transport placing large buffers in shared memory instead of sending
+	them through a pipe:  str's, bytearray's and NumPy arrays of at least
+	`threshold` bytes, and at least one, are written to a file under
+	/dev/shm (or the temporary directory), and only a small handle is
+	pickled and sent.  This is not zero-copy:  the sender copies the buffer
+	into the file once, instead of pickling it and writing it to the pipe.
+
+	The receiver maps the file into memory and deletes it right away, so
+	the memory is freed once the received object is garbage collected.  A
+	received NumPy array is a view of the mapping, without another copy,
+	while a str or bytearray is copied out of it once.  Items of tuples and lists
+	are transported likewise.  Files of items never received are deleted
+	when the creating process exits.
+	"""
+	def __init__(self, threshold=1 << 20):
+		"""threshold: the size in bytes from which a buffer is placed in
+		shared memory, empty ones being always sent inline
+		"""
+		self.threshold = threshold
+		if os.path.isdir('/dev/shm'):
+			self.directory = tempfile.mkdtemp(prefix='stream-', dir='/dev/shm')
+		else:
+			self.directory = tempfile.mkdtemp(prefix='stream-')
+		atexit.register(shutil.rmtree, self.directory, True)
+
+	def _store(self, data, kind, size, dtype=None, shape=None):
+		fd, path = tempfile.mkstemp(dir=self.directory)
+		f = os.fdopen(fd, 'wb')
+		try:
+			f.write(data)
+		finally:
+			f.close()
+		return _SharedBlock(path, kind, size, dtype, shape)
+
+	def encode(self, item):
+		"""Return item, or a handle to it if it is placed in shared memory."""
+		if type(item) is tuple:
+			return tuple([self.encode(x) for x in item])
+		elif type(item) is list:
+			return [self.encode(x) for x in item]
+		elif isinstance(item, (str, bytearray)):
+			if len(item) >= max(self.threshold, 1):    ## no empty mmap
+				return self._store(item, type(item), len(item))
+		elif numpy is not None and isinstance(item, numpy.ndarray):
+			if item.nbytes >= max(self.threshold, 1):
+				item = numpy.ascontiguousarray(item)
+				return self._store(item.data, numpy.ndarray, item.nbytes,
+				                   item.dtype, item.shape)
+		return item
+
+	def decode(self, item):
+		"""Return the item that was encoded."""
+		if type(item) is tuple:
+			return tuple([self.decode(x) for x in item])
+		elif type(item) is list:
+			return [self.decode(x) for x in item]
+		elif not isinstance(item, _SharedBlock):
+			return item
+		f = open(item.path, 'r+b')
+		try:
+			mapping = mmap.mmap(f.fileno(), item.size, access=mmap.ACCESS_COPY)
+		finally:
+			f.close()
+			os.unlink(item.path)
+		if numpy is not None and item.kind is numpy.ndarray:
+			return numpy.frombuffer(mapping, item.dtype).reshape(item.shape)
+		data = item.kind(mapping[:])
+		mapping.close()
+		return data
+
+	def __repr__(self):
+		return '<SharedMemory(threshold=%s) at %s>' % (self.threshold, hex(id(self)))
+
+
+class _SharedMemoryQueue(object):
+	# A multiprocessing queue whose items are encoded by a SharedMemory.
+	def __init__(self, queue, transport):
+		self.queue = queue
+		self.transport = transport
+
+	def put(self, item):
+		self.queue.put(self.transport.encode(item))
+
+	def get(self):
+		return self.transport.decode(self.queue.get())
+
+	def empty(self):
+		return self.queue.empty()
+
+	def poll(self, timeout):
+		return _poll(self.queue, timeout)
+
+
+class _SharedMemoryConnection(object):
+	# A multiprocessing connection whose items are encoded by a SharedMemory.
+	def __init__(self, connection, transport):
+		self.connection = connection
+		self.transport = transport
+
+	def send(self, item):
+		self.connection.send(self.transport.encode(item))
+
+	def recv(self):
+		return self.transport.decode(self.connection.recv())
+
+	def poll(self, *args):
+		return self.connection.poll(*args)
+
+	def fileno(self):
+		return self.connection.fileno()
+
+	def close(self):
+		self.connection.close()
+
+
+#_____________________________________________________________________
+# _NotifyingQueue
+
+
+class _NotifyingQueue(Queue.Queue):
+	# A Queue which, for every item put, puts a reference to itself into
+	# each of its listener queues, so that a consumer of many such queues
+	# can block on a single listener until one of them is ready.
+	def __init__(self, maxsize=0):
+		Queue.Queue.__init__(self, maxsize)
+		self.listeners = []
+
+	def _put(self, item):
+		# Called with self.mutex held, so that listen() counts each item
+		# exactly once.
+		Queue.Queue._put(self, item)
+		for listener in self.listeners:
+			listener.put(self)
+
+	def listen(self, listener):
+		"""Register listener, notifying it of the items already queued."""
+		with self.mutex:
+			self.listeners.append(listener)
+			for _ in xrange(self._qsize()):
+				listener.put(self)
+
+	def unlisten(self, listener):
+		with self.mutex:
+			self.listeners.remove(listener)
+
+
+#_____________________________________________________________________
+# Forkserver
+
+
+def _fork(target, *args):
+	# Run target(*args) in a child process, return its pid.
+	pid = os.fork()
+	if pid:
+		return pid
+	status = 0
+	try:
+		target(*args)
+	except:
+		sys.excepthook(*sys.exc_info())
+		status = 1
+	sys.stdout.flush()
+	sys.stderr.flush()
+	os._exit(status)
+
+
+class _ForkserverChild(object):
+	# A handle to a child of a Forkserver's template process.
+	def __init__(self, control):
+		self.control = control
+		self.lock = threading.Lock()
+		self.exited = False
+
+	def join(self):
+		with self.lock:
+			if self.exited:
+				return
+			try:
+				self.control.recv()
+			except EOFError:
+				pass
+			self.control.close()
+			self.exited = True
+
+
+class Forkserver(object):
+	"""A small template process from which pools and feeders start their
+	worker processes, instead of forking the current process.
+
+	The template is forked when the Forkserver is created, and imports the
+	modules listed in `preload` right away.  Create it early, while the
+	process is small, so that each worker is forked from the template
+	without copying the page tables of a large parent, and with these
+	modules already imported.
+
+	>>> forkserver = Forkserver(preload=['json'])
+	>>> list(ForkedFeeder(iter, range(5), forkserver=forkserver))
+	[0, 1, 2, 3, 4]
+	>>> range(10) >> ProcessPool(iter, forkserver=forkserver) >> sum
+	45
+	>>> forkserver.close()
+
+	Workers receive their function and arguments pickled, so these should
+	be defined in modules, or at least before the Forkserver is created.
+	The connections to the workers are passed to the template over a Unix
+	socket.  The template exits when the Forkserver is closed, which is
+	done when the current process exits.
+	"""
+	def __init__(self, preload=[]):
+		"""preload: the names of the modules the template process imports"""
+		self.preload = preload
+		self.lock = threading.Lock()
+		## Acquired to send a request to the template.
+		self.connection, child = multiprocessing.Pipe()
+		self.pid = _fork(self._template, child)
+		child.close()
+		self.closed = False
+		atexit.register(self.close)
+
+	def _template(self, connection):
+		# Serve requests to start children, until the Forkserver is closed.
+		self.connection.close()
+		for name in self.preload:
+			__import__(name)
+		while 1:
+			try:
+				request = connection.recv()
+			except EOFError:
+				break
+			if request is None:
+				break
+			target, args, nconnections = request
+			fds = [_multiprocessing.recvfd(connection.fileno())
+			       for _ in xrange(nconnections + 1)]
+			_fork(self._child, connection, target, args, fds)
+			for fd in fds:
+				os.close(fd)
+			try:
+				while os.waitpid(-1, os.WNOHANG)[0]:
+					pass                             ## reap exited children
+			except OSError:
+				pass
+
+	def _child(self, connection, target, args, fds):
+		# Run target, then tell the parent process it is done.
+		connection.close()
+		control = _multiprocessing.Connection(fds[0])
+		connections = [_multiprocessing.Connection(fd) for fd in fds[1:]]
+		try:
+			target(*(connections + list(args)))
+		finally:
+			try:
+				control.send(None)
+			except IOError:
+				pass    ## the handle is gone
+
+	def start(self, target, connections, *args):
+		"""Run target(*connections + args) in a new child of the template
+		process, where connections are multiprocessing Connection objects,
+		and return a handle with a join() method to wait for it to exit.
+		"""
+		control, child = multiprocessing.Pipe()
+		with self.lock:
+			if self.closed:
+				raise BrokenPipe('The Forkserver has been closed.')
+			self.connection.send((target, args, len(connections)))
+			for connection in [child] + connections:
+				_multiprocessing.sendfd(self.connection.fileno(), connection.fileno())
+		child.close()
+		return _ForkserverChild(control)
+
+	def close(self):
+		"""Stop the template process.  Children already started go on."""
+		with self.lock:
+			if self.closed:
+				return
+			self.closed = True
+			self.connection.send(None)
+			self.connection.close()
+		os.waitpid(self.pid, 0)
+
+	def __repr__(self):
+		return '<Forkserver(preload=%r) at %s>' % (self.preload, hex(id(self)))
+
+
+def _serve_pool(inreader, inwriter, outreader, outwriter, failreader, failwriter,
+                state, poolsize, sharedmem):
+	# Run in a child of a Forkserver:  start the workers of a ProcessPool
+	# with the given queue connections and state, and wait for them.  The
+	# queue locks are shared by the workers only:  the parent is the sole
+	# reader of the outqueue and failqueue, writes the inqueue before any
+	# worker does, and otherwise only writes small messages, which are
+	# written to a pipe at once.
+	pool = ProcessPool.__new__(ProcessPool)
+	pool.__dict__.update(state)
+	pool.inqueue = _simplequeue(inreader, inwriter)
+	pool.outqueue = _simplequeue(outreader, outwriter)
+	pool.failqueue = _simplequeue(failreader, failwriter)
+	if sharedmem is not None:
+		pool.inqueue = _SharedMemoryQueue(pool.inqueue, sharedmem)
+		pool.outqueue = _SharedMemoryQueue(pool.outqueue, sharedmem)
+	pids = [_fork(pool.work) for _ in xrange(poolsize)]
+	for pid in pids:
+		os.waitpid(pid, 0)
+
+def _simplequeue(reader, writer):
+	# A SimpleQueue made of the given connections.
+	queue = multiprocessing.queues.SimpleQueue.__new__(multiprocessing.queues.SimpleQueue)
+	queue.__setstate__((reader, writer, multiprocessing.Lock(), multiprocessing.Lock()))
+	return queue
+
+def _feed(inpipe, generator, args, kwargs, sharedmem):
+	# Send the items generated into inpipe, then StopIteration.
+	if sharedmem is not None:
+		inpipe = _SharedMemoryConnection(inpipe, sharedmem)
+	i = generator(*args, **kwargs)
+	while 1:
+		try:
+			inpipe.send(next(i))
+		except StopIteration:
+			inpipe.send(StopIteration)
+			break
+
+
 #_____________________________________________________________________
 # Threaded/forked feeder
 
 
+def _reserved(generator, kwargs, name, default=None):
+	# Pop a keyword argument reserved by a feeder, refusing it if the
+	# generator also takes an argument of that name.
+	if name not in kwargs:
+		return default
+	try:
+		argnames = inspect.getargspec(generator).args
+	except TypeError:        ## not a Python function
+		argnames = []
+	if name in argnames:
+		raise TypeError('the keyword argument %r is reserved by the feeder, '
+		                'pass it to %r with functools.partial' % (name, generator))
+	return kwargs.pop(name)
+
+
 class ThreadedFeeder(Iterable):
 	def __init__(self, generator, *args, **kwargs):
 		"""Create a feeder that start the given generator with
@@ -677,8 +2668,13 @@ class ThreadedFeeder(Iterable):
 
 		This should improve performance when the generator often
 		blocks in system calls.
+
+		The reserved keyword argument `maxsize`, if given, bounds the
+		number of items generated ahead of the consumers:  the generator
+		is then suspended until they catch up.  A generator that also
+		takes a `maxsize` argument raises TypeError when it is given.
 		"""
-		self.outqueue = Queue.Queue()
+		self.outqueue = _NotifyingQueue(_reserved(generator, kwargs, 'maxsize', 0))
 		def feeder():
 			i = generator(*args, **kwargs)
 			while 1:
@@ -710,19 +2706,30 @@ class ForkedFeeder(Iterable):
 
 		This should improve performance when the generator often
 		blocks in system calls.  Note that serialization could
-		be costly.
+		be costly:  the reserved keyword argument `sharedmem`, if
+		given, is a SharedMemory transport for large items.
+
+		The reserved keyword argument `forkserver`, if given, is a
+		Forkserver whose template process starts the child process,
+		in which case the generator and its arguments must be picklable.
+
+		A generator that also takes an argument named as a reserved one
+		raises TypeError when it is given.
 		"""
+		sharedmem = _reserved(generator, kwargs, 'sharedmem')
+		forkserver = _reserved(generator, kwargs, 'forkserver')
 		self.outpipe, inpipe = multiprocessing.Pipe(duplex=False)
-		def feed():
-			i = generator(*args, **kwargs)
-			while 1:
-				try:
-					inpipe.send(next(i))
-				except StopIteration:
-					inpipe.send(StopIteration)
-					break
-		self.process = multiprocessing.Process(target=feed)
-		self.process.start()
+		if forkserver is not None:
+			self.process = forkserver.start(_feed, [inpipe],
+			                                generator, args, kwargs, sharedmem)
+			inpipe.close()
+		if sharedmem is not None:
+			self.outpipe = _SharedMemoryConnection(self.outpipe, sharedmem)
+		if forkserver is None:
+			self.process = multiprocessing.Process(target=_feed,
+			                                       args=(inpipe, generator, args,
+			                                             kwargs, sharedmem))
+			self.process.start()
 
 	def __iter__(self):
 		return _iterrecv(self.outpipe)
@@ -738,7 +2745,191 @@ class ForkedFeeder(Iterable):
 # Asynchronous stream processing using a pool of threads or processes
 
 
-class ThreadPool(Stream):
+def _work_ordered(function, input, outqueue, failqueue, args, kwargs):
+	# Worker loop of an ordered pool:  process the input items one by one
+	# and put their outputs tagged with the input sequence numbers.
+	for seq, item in input:
+		try:
+			outqueue.put((seq, list(function(iter([item]), *args, **kwargs))))
+		except Exception, e:
+			failqueue.put((item, e))
+			outqueue.put((seq, []))
+
+def _work_tagged(function, input, outqueue, args, kwargs):
+	# Worker loop of a persistent pool:  process the input items one by one
+	# and put their outputs, and their failures if any, tagged with the ids
+	# of their input streams and their sequence numbers.
+	for tag, item in input:
+		try:
+			outqueue.put((tag, list(function(iter([item]), *args, **kwargs)), None))
+		except Exception, e:
+			outqueue.put((tag, [], (item, e)))
+
+def _reorder(tagged, window):
+	# Yield the outputs of an ordered pool in the order of input, releasing
+	# the window semaphore as each input item is done with.
+	pending = {}
+	expected = 0
+	for seq, outputs in tagged:
+		pending[seq] = outputs
+		while expected in pending:
+			for item in pending.pop(expected):
+				yield item
+			expected += 1
+			window.release()
+
+
+class _ChunkedOutput(object):
+	# The outqueue of a chunked ProcessPool as seen by a worker:  outputs
+	# are buffered, then sent together by flush().
+	def __init__(self, outqueue):
+		self.outqueue = outqueue
+		self.outputs = []
+
+	def put(self, item):
+		self.outputs.append(item)
+
+	def flush(self):
+		if self.outputs:
+			self.outqueue.put(self.outputs)
+			self.outputs = []
+
+
+class _ChunkedInput(object):
+	# The inqueue of a chunked ProcessPool as seen by a worker:  get()
+	# returns the items of each chunk one by one.  Once the worker is done
+	# with a chunk, its outputs are flushed, and its processing time per item
+	# is averaged into the shared value `cost` if given.
+	def __init__(self, inqueue, output, cost=None, measured=None):
+		self.inqueue = inqueue
+		self.output = output
+		self.cost = cost
+		self.measured = measured
+		self.chunk = collections.deque()
+		self.started = None
+
+	def _done(self):
+		self.output.flush()
+		if self.started is not None and self.cost is not None:
+			itemcost = (time.time() - self.started) / self.size
+			with self.cost.get_lock():
+				if self.measured.is_set():
+					self.cost.value = 0.8 * self.cost.value + 0.2 * itemcost
+				else:
+					self.cost.value = itemcost
+			self.measured.set()
+		self.started = None
+
+	def poll(self, timeout):
+		if self.chunk:
+			return True
+		self._done()
+		return _poll(self.inqueue, timeout)
+
+	def get(self):
+		if self.chunk:
+			return self.chunk.popleft()
+		self._done()
+		chunk = self.inqueue.get()
+		if chunk is StopIteration:
+			return StopIteration
+		self.started = time.time()
+		self.size = len(chunk)
+		self.chunk = collections.deque(chunk)
+		return self.chunk.popleft()
+
+	def put(self, item):
+		# Only called to re-broadcast StopIteration to the other workers
+		self.inqueue.put(item)
+
+
+def _poll(queue, timeout):
+	# Whether an item can be got from a SimpleQueue, or a wrapper of one
+	# with a poll() method, within timeout seconds.
+	if hasattr(queue, 'poll'):
+		return queue.poll(timeout)
+	return queue._reader.poll(timeout)
+
+def _get(queue, timeout):
+	# Get an item from a Queue.Queue, or from a SimpleQueue or a wrapper
+	# of one, raising Queue.Empty after timeout seconds.
+	if isinstance(queue, Queue.Queue):
+		return queue.get(True, timeout)
+	if not _poll(queue, timeout):
+		raise Queue.Empty
+	return queue.get()
+
+
+class _WorkerCounts(object):
+	# The number of workers of an elastic pool, of those idle and of the
+	# input items queued, shared with worker processes if `shared`.
+	def __init__(self, size, shared):
+		if shared:
+			self.values = multiprocessing.Array('i', [size, size, 0])
+			self.lock = self.values.get_lock()
+		else:
+			self.values = [size, size, 0]
+			self.lock = threading.Lock()
+
+def _elastic_input(inqueue, counts, minsize, idletime):
+	# Like _iterqueue, for a worker of an elastic pool:  the worker counts
+	# as idle while waiting for an item.  Stop when it has been waiting for
+	# idletime seconds while the pool has more than minsize workers.
+	values = counts.values
+	while 1:
+		try:
+			item = _get(inqueue, idletime)
+		except Queue.Empty:
+			with counts.lock:
+				if values[0] > minsize:
+					values[0] -= 1
+					values[1] -= 1
+					return
+			continue
+		if item is StopIteration:
+			inqueue.put(StopIteration)
+			with counts.lock:
+				values[0] -= 1
+				values[1] -= 1
+			return
+		with counts.lock:
+			values[1] -= 1
+			values[2] -= 1
+		yield item
+		with counts.lock:
+			values[1] += 1
+
+
+class _ElasticPool(object):
+	# The sizing of an elastic ThreadPool or ProcessPool, whose workers are
+	# counted by `workers`, a _WorkerCounts, or None if not elastic, and
+	# started by _spawn().
+
+	def _grow(self, nitems=1):
+		# Account for nitems input items just queued, and start another
+		# worker if the pool is elastic, there are more items queued than
+		# idle workers and fewer than poolsize workers.
+		if self.workers is None:
+			return
+		values = self.workers.values
+		with self.workers.lock:
+			values[2] += nitems
+			size, idle, queued = values
+			if queued <= idle or size >= self.poolsize:
+				return
+			values[0] += 1
+			values[1] += 1
+		self._spawn()
+
+	@property
+	def size(self):
+		"""The current number of workers."""
+		if self.workers is None:
+			return self.poolsize
+		return self.workers.values[0]
+
+
+class ThreadPool(_ElasticPool, Stream):
 	"""Work on the input stream asynchronously using a pool of threads.
 
 	>>> range(10) >> ThreadPool(map(lambda x: x*x)) >> sum
@@ -749,21 +2940,84 @@ class ThreadPool(Stream):
 	exception) is put into the pool's `failqueue`.  The attribute
 	`failure` is a thead-safe iterator over the `failqueue`.
 
+	The output values come in the order of completion, unless the pool is
+	ordered, in which case they come in the order of input.  Then at most
+	`window` input items are in progress or waiting for the preceding ones
+	to complete, and the input stream is not pulled further until some of
+	them are output, so the output should be consumed to the end.  Note that
+	an ordered pool applies its function to each input item separately and
+	its `outqueue` contains tagged outputs, so it cannot be piped to a
+	collector.
+
+	>>> range(10) >> ThreadPool(map(lambda x: x*x), ordered=True) >> list
+	[0, 1, 4, 9, 16, 25, 36, 49, 64, 81]
+
+	By default, the input stream is pulled into the `inqueue` as fast as
+	possible, and the outputs accumulate in the `outqueue` until consumed.
+	When `maxsize` is given, both queues hold at most that many items:
+	workers wait for the consumer when the `outqueue` is full, and the
+	input stream is not pulled further when the `inqueue` is full.
+
+	When `minsize` is given, the pool is elastic:  it starts with minsize
+	workers, a new worker is started whenever there are more input items
+	queued than idle workers, up to `poolsize`, and a worker which has been
+	idle for `idletime` seconds stops unless there are only minsize left.
+	The attribute `size` is the current number of workers.  Workers may
+	stop at any time, so the function should process items independently.
+
+	>>> pool = ThreadPool(map(lambda x: x*x), poolsize=8, minsize=1)
+	>>> pool.size
+	1
+	>>> range(10) >> pool >> sum
+	285
+
 	See also: Executor
 	"""
-	def __init__(self, function, poolsize=_nCPU, args=[], kwargs={}):
+	def __init__(self, function, poolsize=_nCPU, args=[], kwargs={},
+	             ordered=False, window=1024, maxsize=0, minsize=None, idletime=10):
 		"""function: an iterator-processing function, one that takes an
 		iterator and return an iterator
+
+		ordered: whether to output values in the order of input
+
+		window: the maximum number of input items in progress when ordered
+
+		maxsize: the maximum size of the inqueue and outqueue, unbounded
+		if 0
+
+		minsize: if given, the minimum number of workers of an elastic pool
+
+		idletime: the time in seconds after which an idle worker of an
+		elastic pool stops
 		"""
+		if minsize is not None and minsize < 1:
+			raise ValueError('the minsize of an elastic pool must be at least 1')
 		super(ThreadPool, self).__init__()
 		self.function = function
-		self.inqueue = Queue.Queue()
-		self.outqueue = Queue.Queue()
+		self.poolsize = poolsize
+		self.minsize = minsize
+		self.idletime = idletime
+		if minsize is None:
+			self.workers = None
+		else:
+			self.workers = _WorkerCounts(minsize, shared=False)
+		self.ordered = ordered
+		self.window = threading.Semaphore(window)
+		self.inqueue = Queue.Queue(maxsize)
+		self.outqueue = _NotifyingQueue(maxsize)
 		self.failqueue = Queue.Queue()
 		self.failure = Stream(_iterqueue(self.failqueue))
 		self.closed = False
 		def work():
-			input, dupinput = itertools.tee(_iterqueue(self.inqueue))
+			if self.workers is None:
+				input = _iterqueue(self.inqueue)
+			else:
+				input = _elastic_input(self.inqueue, self.workers,
+				                       self.minsize, self.idletime)
+			if self.ordered:
+				return _work_ordered(self.function, input, self.outqueue,
+				                     self.failqueue, args, kwargs)
+			input, dupinput = itertools.tee(input)
 			output = self.function(input, *args, **kwargs)
 			while 1:
 				try:
@@ -773,11 +3027,10 @@ class ThreadPool(Stream):
 					break
 				except Exception, e:
 					self.failqueue.put((next(dupinput), e))
+		self.work = work
 		self.worker_threads = []
-		for _ in range(poolsize):
-			t = threading.Thread(target=work)
-			self.worker_threads.append(t)
-			t.start()
+		for _ in range(poolsize if minsize is None else minsize):
+			self._spawn()
 		def cleanup():
 			# Wait for all workers to finish,
 			# then signal the end of outqueue and failqueue.
@@ -788,94 +3041,685 @@ class ThreadPool(Stream):
 			self.closed = True
 		self.cleaner_thread = threading.Thread(target=cleanup)
 		self.cleaner_thread.start()
-		self.iterator = _iterqueue(self.outqueue)
+		if self.ordered:
+			self.iterator = _reorder(_iterqueue(self.outqueue), self.window)
+		else:
+			self.iterator = _iterqueue(self.outqueue)
 
 	def __call__(self, inpipe):
 		if self.closed:
 			raise BrokenPipe('All workers are dead, refusing to summit jobs. '
 			                 'Use another Pool.')
 		def feed():
-			for item in inpipe:
-				self.inqueue.put(item)
+			if self.ordered:
+				for seq, item in enumerate(inpipe):
+					self.window.acquire()
+					self.inqueue.put((seq, item))
+					self._grow()
+			else:
+				for item in inpipe:
+					self.inqueue.put(item)
+					self._grow()
 			self.inqueue.put(StopIteration)
 		self.feeder_thread = threading.Thread(target=feed)
 		self.feeder_thread.start()
 		return self.iterator
 
+	def _spawn(self):
+		t = threading.Thread(target=self.work)
+		self.worker_threads.append(t)
+		t.start()
+
+	def join(self):
+		self.cleaner_thread.join()
+
+	def __repr__(self):
+		return '<ThreadPool(poolsize=%s, maxsize=%s) at %s>' % (self.poolsize,
+		                                                        self.inqueue.maxsize,
+		                                                        hex(id(self)))
+
+
+class _PoolStream(Stream):
+	# An input stream of a persistent ProcessPool, iterable over its
+	# outputs.  Once all of its items have been fed, and as many processed
+	# (nitems == ndone), StopIteration is put into its queues.
+	def __init__(self, id, ordered, window):
+		self.id = id
+		self.window = threading.Semaphore(window)
+		self.outqueue = Queue.Queue()
+		self.failqueue = Queue.Queue()
+		self.failure = Stream(_iterqueue(self.failqueue))
+		self.nitems = None
+		self.ndone = 0
+		if ordered:
+			output = _reorder(_iterqueue(self.outqueue), self.window)
+		else:
+			output = _iterqueue(self.outqueue)
+		super(_PoolStream, self).__init__(output)
+
+	def __repr__(self):
+		return '<ProcessPool stream %s at %s>' % (self.id, hex(id(self)))
+
+
+class ProcessPool(_ElasticPool, Stream):
+	"""Work on the input stream asynchronously using a pool of processes.
+
+	>>> range(10) >> ProcessPool(map(lambda x: x*x)) >> sum
+	285
+
+	The pool object is an iterable over the output values.  If an
+	input value causes an Exception to be raised, the tuple (value,
+	exception) is put into the pool's `failqueue`.  The attribute
+	`failure` is a thead-safe iterator over the `failqueue`.
+
+	The output values come in the order of completion, unless the pool is
+	ordered, in which case they come in the order of input.  Then at most
+	`window` input items are in progress or waiting for the preceding ones
+	to complete, and the input stream is not pulled further until some of
+	them are output, so the output should be consumed to the end.  Note that
+	an ordered pool applies its function to each input item separately and
+	its `outqueue` contains tagged outputs, so it cannot be piped to a
+	collector.
+
+	>>> range(10) >> ProcessPool(map(lambda x: x*x), ordered=True) >> list
+	[0, 1, 4, 9, 16, 25, 36, 49, 64, 81]
+
+	Input items are sent to the workers, and outputs sent back, in chunks
+	of `chunksize` items, which amortizes the cost of interprocess
+	communication when the function is cheap.  With chunksize='auto', the
+	workers measure their processing time per item and chunks are sized
+	to take about `chunktime` seconds each, up to `maxchunksize` items.
+	The pool's output and `failure` are still streams of items.
+
+	>>> range(10) >> ProcessPool(map(lambda x: x*x), chunksize='auto') >> sum
+	285
+
+	Large input and output items can be placed in shared memory by a
+	SharedMemory transport rather than sent through pipes.
+
+	With `minsize`, the pool is elastic like a ThreadPool.
+
+	The workers are forked from the current process, unless a Forkserver
+	is given, in which case they are started by its template process.  The
+	function and its arguments must then be picklable, and the pool cannot
+	be elastic nor use chunksize='auto'.
+
+	A persistent pool serves any number of input streams, one after another
+	or concurrently, until it is closed, so that its workers are started
+	only once.  Piping a stream into it returns a new stream over the
+	outputs of that input only, whose `failure` attribute is an iterator
+	over its own failures.  Like an ordered pool, it applies its function
+	to each input item separately.
+
+	>>> pool = ProcessPool(map(lambda x: x*x), persistent=True)
+	>>> range(10) >> pool >> sum
+	285
+	>>> output = [1, 2, 'foo'] >> pool
+	>>> output >> list, output.failure >> list
+	([1, 4], [('foo', TypeError("can't multiply sequence by non-int of type 'str'",))])
+	>>> pool.close()
+
+	See also: Executor
+	"""
+	chunktime = 0.005
+	maxchunksize = 4096
+
+	def __init__(self, function, poolsize=_nCPU, args=[], kwargs={},
+	             ordered=False, window=1024, chunksize=1, sharedmem=None,
+	             minsize=None, idletime=10, persistent=False, forkserver=None):
+		"""function: an iterator-processing function, one that takes an
+		iterator and return an iterator
+
+		ordered: whether to output values in the order of input
+
+		window: the maximum number of input items in progress when ordered
+
+		chunksize: the number of items sent to a worker at once, or 'auto'
+
+		sharedmem: a SharedMemory transport for large items
+
+		minsize: if given, the minimum number of workers of an elastic pool
+
+		idletime: the time in seconds after which an idle worker of an
+		elastic pool stops
+
+		persistent: whether the pool serves many input streams until
+		close() is called
+
+		forkserver: a Forkserver to start the workers from
+		"""
+		if forkserver is not None and (minsize is not None or chunksize == 'auto'):
+			raise ValueError('a pool started from a Forkserver cannot be '
+			                 'elastic nor use chunksize=\'auto\'')
+		if minsize is not None and minsize < 1:
+			raise ValueError('the minsize of an elastic pool must be at least 1')
+		super(ProcessPool, self).__init__()
+		self.function = function
+		self.args = args
+		self.kwargs = kwargs
+		self.poolsize = poolsize
+		self.minsize = minsize
+		self.idletime = idletime
+		if minsize is None:
+			self.workers = None
+		else:
+			self.workers = _WorkerCounts(minsize, shared=True)
+		self.ordered = ordered
+		self.window = threading.Semaphore(window)
+		self.windowsize = window
+		self.persistent = persistent
+		self.streams = {}
+		## Input streams of a persistent pool not yet done, by id.
+		self.streamcount = 0
+		self.nfeeding = 0
+		## The number of input streams being fed.
+		self.lock = threading.Lock()
+		## Acquired to open input streams and update their counts.
+		self.stopped = threading.Event()
+		## Set when StopIteration has been put into the inqueue.
+		self.chunksize = chunksize
+		if chunksize == 'auto':
+			self.cost = multiprocessing.Value('d', 0.0)
+			self.measured = multiprocessing.Event()
+		else:
+			self.cost = self.measured = None
+		self.inqueue = multiprocessing.queues.SimpleQueue()
+		self.outqueue = multiprocessing.queues.SimpleQueue()
+		self.failqueue = multiprocessing.queues.SimpleQueue()
+		self.worker_processes = []
+		if forkserver is not None:
+			self.worker_processes.append(self._serve(forkserver, sharedmem))
+		if sharedmem is not None:
+			self.inqueue = _SharedMemoryQueue(self.inqueue, sharedmem)
+			self.outqueue = _SharedMemoryQueue(self.outqueue, sharedmem)
+		self.failure = Stream(_iterqueue(self.failqueue))
+		self.closed = False
+		if forkserver is None:
+			for _ in range(poolsize if minsize is None else minsize):
+				self._spawn()
+		def cleanup():
+			# Wait for all workers to finish,
+			# then signal the end of outqueue and failqueue.
+			if self.persistent:
+				self.stopped.wait()    ## elastic workers may all be gone
+			for p in self.worker_processes:
+				p.join()
+			self.outqueue.put(StopIteration)
+			self.failqueue.put(StopIteration)
+			self.closed = True
+		self.cleaner_thread = threading.Thread(target=cleanup)
+		self.cleaner_thread.start()
+		output = _iterqueue(self.outqueue)
+		if self.chunksize != 1:
+			output = itertools.chain.from_iterable(output)
+		if self.persistent:
+			self.router_thread = threading.Thread(target=self._route, args=(output,))
+			self.router_thread.start()
+		elif self.ordered:
+			self.iterator = _reorder(output, self.window)
+		else:
+			self.iterator = output
+
+	def work(self):
+		# Worker loop, run in the worker processes.
+		inqueue, outqueue = self.inqueue, self.outqueue
+		if self.chunksize != 1:
+			outqueue = _ChunkedOutput(self.outqueue)
+			inqueue = _ChunkedInput(self.inqueue, outqueue,
+			                        self.cost, self.measured)
+		if self.workers is None:
+			input = _iterqueue(inqueue)
+		else:
+			input = _elastic_input(inqueue, self.workers,
+			                       self.minsize, self.idletime)
+		if self.persistent:
+			return _work_tagged(self.function, input, outqueue,
+			                    self.args, self.kwargs)
+		if self.ordered:
+			return _work_ordered(self.function, input, outqueue,
+			                     self.failqueue, self.args, self.kwargs)
+		input, dupinput = itertools.tee(input)
+		output = self.function(input, *self.args, **self.kwargs)
+		while 1:
+			try:
+				outqueue.put(next(output))
+				next(dupinput)
+			except StopIteration:
+				break
+			except Exception, e:
+				self.failqueue.put((next(dupinput), e))
+
+	def _spawn(self):
+		p = multiprocessing.Process(target=self.work)
+		self.worker_processes.append(p)
+		p.start()
+
+	def _serve(self, forkserver, sharedmem):
+		# Have the workers started by the template process of forkserver,
+		# return a handle to their parent.
+		state = dict((name, getattr(self, name)) for name in
+		             ['function', 'args', 'kwargs', 'ordered', 'persistent',
+		              'chunksize', 'cost', 'measured', 'workers'])
+		queues = [self.inqueue, self.outqueue, self.failqueue]
+		connections = []
+		for queue in queues:
+			connections += [queue._reader, queue._writer]
+		return forkserver.start(_serve_pool, connections,
+		                        state, self.poolsize, sharedmem)
+
+	def _chunksizes(self):
+		# Yield the sizes of successive input chunks.  When adaptive, each
+		# worker is first sent a single item to measure the cost per item.
+		if self.chunksize != 'auto':
+			while 1:
+				yield self.chunksize
+		for _ in range(self.poolsize):
+			yield 1
+		self.measured.wait()
+		while 1:
+			size = int(self.chunktime / max(self.cost.value, 1e-9))
+			yield max(1, min(size, self.maxchunksize))
+
+	def __pipe__(self, inpipe):
+		if not self.persistent:
+			return super(ProcessPool, self).__pipe__(inpipe)
+		if _isasync(inpipe):
+			raise BrokenPipe('%r does not accept asynchronous input' % self)
+		return self.__call__(iter(inpipe))
+
+	def __call__(self, inpipe):
+		if self.persistent:
+			return self._open(inpipe)
+		if self.closed:
+			raise BrokenPipe('All workers are dead, refusing to summit jobs. '
+			                 'Use another Pool.')
+		self.feeder_thread = threading.Thread(target=self._feed,
+		                                      args=(inpipe, self.window, self.failqueue))
+		self.feeder_thread.start()
+		return self.iterator
+
+	def _feed(self, inpipe, window, failqueue, id=None):
+		# Put the items of inpipe into the inqueue, in chunks if needed.
+		# Items are tagged with their sequence numbers if the pool is
+		# ordered, and with the id of their input stream if it is
+		# persistent, in which case their number is returned.
+		seq = itertools.count()
+		sizes = self._chunksizes()
+		chunk, size = [], next(sizes)
+		while 1:
+			try:
+				item = next(inpipe)
+				if self.ordered and not window.acquire(False):
+					# The consumer may be waiting for the pending chunk
+					if chunk:
+						self.inqueue.put(chunk)
+						self._grow(len(chunk))
+						chunk, size = [], next(sizes)
+					window.acquire()
+				if self.persistent:
+					item = ((id, next(seq)), item)
+				elif self.ordered:
+					item = (next(seq), item)
+				if self.chunksize == 1:
+					self.inqueue.put(item)
+					self._grow()
+					continue
+				chunk.append(item)
+				if len(chunk) >= size:
+					self.inqueue.put(chunk)
+					self._grow(len(chunk))
+					chunk, size = [], next(sizes)
+			except StopIteration:
+				if chunk:
+					self.inqueue.put(chunk)
+					self._grow(len(chunk))
+				if not self.persistent:
+					self.inqueue.put(StopIteration)
+				return next(seq)
+			except Exception, e:
+				failqueue.put((None, e))
+
+	def _open(self, inpipe):
+		# Start feeding an input stream of a persistent pool,
+		# return the stream of its outputs.
+		with self.lock:
+			if self.closed:
+				raise BrokenPipe('The pool has been closed, refusing to '
+				                 'accept input streams.')
+			stream = _PoolStream(self.streamcount, self.ordered, self.windowsize)
+			self.streams[stream.id] = stream
+			self.streamcount += 1
+			self.nfeeding += 1
+		def feed():
+			nitems = self._feed(inpipe, stream.window, stream.failqueue, stream.id)
+			with self.lock:
+				stream.nitems = nitems
+				self._finish(stream)
+				self.nfeeding -= 1
+				stop = self.closed and not self.nfeeding
+			if stop:
+				self._stop()
+		stream.feeder_thread = threading.Thread(target=feed)
+		stream.feeder_thread.start()
+		return stream
+
+	def _route(self, output):
+		# Put the outputs and failures of a persistent pool into the queues
+		# of their input streams.
+		for (id, seq), outputs, failure in output:
+			stream = self.streams[id]
+			if self.ordered:
+				stream.outqueue.put((seq, outputs))
+			else:
+				for x in outputs:
+					stream.outqueue.put(x)
+			if failure is not None:
+				stream.failqueue.put(failure)
+			with self.lock:
+				stream.ndone += 1
+				self._finish(stream)
+
+	def _finish(self, stream):
+		# End an input stream if all of its items are done, with the lock held.
+		if stream.ndone == stream.nitems:
+			del self.streams[stream.id]
+			stream.outqueue.put(StopIteration)
+			stream.failqueue.put(StopIteration)
+
+	def _stop(self):
+		# Let the workers terminate after the items queued.  Not called
+		# with the lock held, as the inqueue may be full.
+		self.inqueue.put(StopIteration)
+		self.stopped.set()
+
+	def close(self):
+		"""Stop accepting input streams into a persistent pool.
+
+		The workers will terminate once the items of the streams already
+		piped are processed.  Without a call to close(), they will stay
+		around forever waiting for more streams to come.
+		"""
+		with self.lock:
+			if self.closed:
+				return
+			self.closed = True
+			stop = not self.nfeeding
+		if stop:
+			self._stop()
+
 	def join(self):
+		"""Note that a persistent pool must be close()'d elsewhere,
+		or join() will never return.
+		"""
 		self.cleaner_thread.join()
+		if self.persistent:
+			self.router_thread.join()
 
 	def __repr__(self):
-		return '<ThreadPool(poolsize=%s) at %s>' % (self.poolsize, hex(id(self)))
+		return '<ProcessPool(poolsize=%s, chunksize=%s) at %s>' % (self.poolsize,
+		                                                           self.chunksize,
+		                                                           hex(id(self)))
 
 
-class ProcessPool(Stream):
-	"""Work on the input stream asynchronously using a pool of processes.
+class _BatchQueue(object):
+	# The inqueue of a NetworkPool:  the items put are taken in batches by
+	# the threads serving the workers.  Those of a batch whose worker is
+	# lost are put back in front.
+	def __init__(self):
+		self.items = collections.deque()
+		self.nheld = 0
+		## The number of items taken and not yet done.
+		self.ended = False
+		self.cond = threading.Condition()
+
+	def put(self, item):
+		with self.cond:
+			if item is StopIteration:
+				self.ended = True
+			else:
+				self.items.append(item)
+			self.cond.notify_all()
 
-	>>> range(10) >> ProcessPool(map(lambda x: x*x)) >> sum
-	285
+	def _drained(self):
+		return self.ended and not self.items and not self.nheld
 
-	The pool object is an iterable over the output values.  If an
-	input value causes an Exception to be raised, the tuple (value,
-	exception) is put into the pool's `failqueue`.  The attribute
-	`failure` is a thead-safe iterator over the `failqueue`.
+	def take(self, n):
+		"""Return at most n items, waiting for one if needed, or an empty
+		batch once all items are done.
+		"""
+		with self.cond:
+			while not self.items and not self._drained():
+				self.cond.wait()
+			batch = [self.items.popleft() for _ in xrange(min(n, len(self.items)))]
+			self.nheld += len(batch)
+			return batch
+
+	def done(self, batch, lost=False):
+		with self.cond:
+			self.nheld -= len(batch)
+			if lost:
+				self.items.extendleft(reversed(batch))
+			self.cond.notify_all()
 
-	See also: Executor
+	def join(self):
+		with self.cond:
+			while not self._drained():
+				self.cond.wait()
+
+
+def _isloopback(host):
+	# Whether host is an address of the loopback interface.
+	if host in ('::1', 'localhost'):
+		return True
+	try:
+		return socket.gethostbyname(host).startswith('127.')
+	except socket.error:
+		return False
+
+
+class NetworkPool(Stream):
+	"""Work on the input stream asynchronously using worker processes
+	which connect to the pool over TCP, possibly from other hosts.
+
+	>>> range(10) >> NetworkPool(map(operator.neg)) >> sum
+	-45
+
+	The pool listens on `address`, by default a free port of the loopback
+	interface, and its attribute `address` is the actual address.  Unless
+	`local` is False, it starts `poolsize` workers on this host.  Other
+	workers are started with NetworkPool.work(address, authkey), e.g. on
+	another host with the same modules.  The function and its arguments
+	are pickled and sent to each worker, so they must be picklable.  The
+	function is applied to each input item separately.
+
+	Workers authenticate with `authkey`, by default the authkey of the
+	current process, which the workers started on this host inherit.  Since
+	the pool and its workers unpickle what they receive from each other, an
+	authkey must be given to listen on any other interface than loopback.
+
+	Items are sent to an idle worker in batches of at most `batchsize`
+	of those queued, along with which outputs and failures come back.  A
+	worker sends a heartbeat every `heartbeat` seconds, and one which holds
+	a batch and has not been heard from for `timeout` seconds, or which
+	disconnects, is considered lost:  its batch is sent to another worker.
+
+	An Executor can drive a NetworkPool, to which its keyword arguments
+	other than its own are passed::
+
+	  >>> executor = Executor(NetworkPool, map(operator.neg), poolsize=2, batchsize=16)
+	  >>> executor.submit(*range(10))
+	  [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+	  >>> executor.close()
+	  >>> sorted(executor.result)
+	  [-9, -8, -7, -6, -5, -4, -3, -2, -1, 0]
+
+	See also: ProcessPool
 	"""
-	def __init__(self, function, poolsize=_nCPU, args=[], kwargs={}):
+	def __init__(self, function, poolsize=_nCPU, args=[], kwargs={},
+	             address=('127.0.0.1', 0), authkey=None, local=True,
+	             batchsize=64, heartbeat=1.0, timeout=10.0):
 		"""function: an iterator-processing function, one that takes an
 		iterator and return an iterator
+
+		poolsize: the number of workers started on this host if local,
+		otherwise the number of remote workers expected
+
+		address: the (host, port) to listen on
+
+		authkey: a string which the workers must know, see
+		multiprocessing.connection, by default that of the current process
+		if address is on the loopback interface
+
+		local: whether to start poolsize workers on this host
+
+		batchsize: the maximum number of items sent to a worker at once
+
+		heartbeat: the time in seconds between heartbeats of a worker
+
+		timeout: the time in seconds after which a silent worker is lost
 		"""
-		super(ProcessPool, self).__init__()
+		if authkey is None:
+			if not _isloopback(address[0]):
+				raise ValueError('a NetworkPool listening on %r requires an '
+				                 'authkey' % (address[0],))
+			authkey = multiprocessing.current_process().authkey
+		super(NetworkPool, self).__init__()
 		self.function = function
 		self.poolsize = poolsize
-		self.inqueue = multiprocessing.queues.SimpleQueue()
-		self.outqueue = multiprocessing.queues.SimpleQueue()
-		self.failqueue = multiprocessing.queues.SimpleQueue()
+		self.setup = pickle.dumps((function, args, kwargs, heartbeat),
+		                          pickle.HIGHEST_PROTOCOL)
+		self.batchsize = batchsize
+		self.timeout = timeout
+		self.listener = multiprocessing.connection.Listener(address, authkey=authkey)
+		self.address = self.listener.address
+		self.inqueue = _BatchQueue()
+		self.outqueue = Queue.Queue()
+		self.failqueue = Queue.Queue()
 		self.failure = Stream(_iterqueue(self.failqueue))
 		self.closed = False
-		def work():
-			input, dupinput = itertools.tee(_iterqueue(self.inqueue))
-			output = self.function(input, *args, **kwargs)
-			while 1:
-				try:
-					self.outqueue.put(next(output))
-					next(dupinput)
-				except StopIteration:
-					break
-				except Exception, e:
-					self.failqueue.put((next(dupinput), e))
+		self.acceptor_thread = threading.Thread(target=self._accept)
+		self.acceptor_thread.daemon = True     ## blocked in accept()
+		self.acceptor_thread.start()
 		self.worker_processes = []
-		for _ in range(self.poolsize):
-			p = multiprocessing.Process(target=work)
-			self.worker_processes.append(p)
-			p.start()
+		if local:
+			for _ in range(poolsize):
+				p = multiprocessing.Process(target=NetworkPool.work,
+				                            args=(self.address, authkey))
+				self.worker_processes.append(p)
+				p.start()
 		def cleanup():
-			# Wait for all workers to finish,
+			# Wait for all items to be done,
 			# then signal the end of outqueue and failqueue.
+			self.inqueue.join()
 			for p in self.worker_processes:
 				p.join()
 			self.outqueue.put(StopIteration)
 			self.failqueue.put(StopIteration)
 			self.closed = True
+			try:
+				socket.create_connection(self.address).close()  ## wake accept()
+			except socket.error:
+				pass
 		self.cleaner_thread = threading.Thread(target=cleanup)
 		self.cleaner_thread.start()
 		self.iterator = _iterqueue(self.outqueue)
 
+	def _accept(self):
+		# Serve each worker that connects in a new thread.
+		while not self.closed:
+			try:
+				connection = self.listener.accept()
+			except Exception:
+				continue    ## failed authentication
+			threading.Thread(target=self._serve, args=(connection,)).start()
+		self.listener.close()
+
+	def _serve(self, connection):
+		# Send batches of items to a worker and put their outputs and
+		# failures into the outqueue and failqueue, until all items are
+		# done or the worker is lost.
+		try:
+			connection.send_bytes(self.setup)
+			while 1:
+				batch = self.inqueue.take(self.batchsize)
+				if not batch:
+					connection.send(StopIteration)
+					break
+				try:
+					connection.send(batch)
+					results = self._receive(connection)
+				except (IOError, EOFError):
+					self.inqueue.done(batch, lost=True)
+					break
+				except Exception, e:
+					results = [([], e)] * len(batch)    ## not picklable
+				for item, (outputs, exception) in zip(batch, results):
+					for x in outputs:
+						self.outqueue.put(x)
+					if exception is not None:
+						self.failqueue.put((item, exception))
+				self.inqueue.done(batch)
+		except (IOError, EOFError):
+			pass
+		finally:
+			connection.close()
+
+	def _receive(self, connection):
+		# Receive the results of a batch, skipping heartbeats.
+		while 1:
+			if not connection.poll(self.timeout):
+				raise IOError('worker lost')
+			message = connection.recv()
+			if message is not None:
+				return message
+
+	@staticmethod
+	def work(address, authkey=None):
+		"""Connect to the NetworkPool listening on address, and work on
+		the items it sends until it has no more.  The authkey is by
+		default that of the current process.
+		"""
+		if authkey is None:
+			authkey = multiprocessing.current_process().authkey
+		connection = multiprocessing.connection.Client(address, authkey=authkey)
+		function, args, kwargs, heartbeat = pickle.loads(connection.recv_bytes())
+		lock = threading.Lock()
+		stopped = threading.Event()
+		def beat():
+			while not stopped.wait(heartbeat):
+				with lock:
+					connection.send(None)
+		beater = threading.Thread(target=beat)
+		beater.daemon = True
+		beater.start()
+		try:
+			while 1:
+				batch = connection.recv()
+				if batch is StopIteration:
+					break
+				results = []
+				for item in batch:
+					try:
+						results.append((list(function(iter([item]), *args, **kwargs)), None))
+					except Exception, e:
+						results.append(([], e))
+				with lock:
+					connection.send(results)
+		except (IOError, EOFError):
+			pass    ## the pool is gone
+		finally:
+			stopped.set()
+			with lock:
+				connection.close()
+
 	def __call__(self, inpipe):
 		if self.closed:
 			raise BrokenPipe('All workers are dead, refusing to summit jobs. '
 			                 'Use another Pool.')
 		def feed():
-			while 1:
-				try:
-					item = next(inpipe)
-					self.inqueue.put(item)
-				except StopIteration:
-					self.inqueue.put(StopIteration)
-					break
-				except Exception, e:
-					self.failqueue.put((None, e))
+			for item in inpipe:
+				self.inqueue.put(item)
+			self.inqueue.put(StopIteration)
 		self.feeder_thread = threading.Thread(target=feed)
 		self.feeder_thread.start()
 		return self.iterator
@@ -884,11 +3728,178 @@ class ProcessPool(Stream):
 		self.cleaner_thread.join()
 
 	def __repr__(self):
-		return '<ProcessPool(poolsize=%s) at %s>' % (self.poolsize, hex(id(self)))
+		return '<NetworkPool(address=%r, batchsize=%s) at %s>' % (self.address,
+		                                                         self.batchsize,
+		                                                         hex(id(self)))
+
+
+class TimeoutError(Exception):
+	pass
+
+
+class CancelledError(Exception):
+	pass
+
+
+class Future(object):
+	"""The pending result of a job submitted to an Executor with
+	submit(..., futures=True).
+	"""
+	def __init__(self, executor, id):
+		self.executor = executor
+		self.id = id
+		self._state = None
+		self._value = None
+		self._callbacks = []
+
+	def done(self):
+		"""Whether the job has been completed, has failed or has been
+		cancelled.
+		"""
+		return self._state is not None
+
+	def cancelled(self):
+		return self._state == 'CANCELLED'
+
+	def cancel(self):
+		"""Try to cancel the job, return whether it has been cancelled."""
+		return self.executor.cancel(self.id) == 1
+
+	def add_done_callback(self, function):
+		"""Call function with the future as its only argument when the job
+		is done, in the thread that is tracking the job, or right away if
+		the job is already done.
+		"""
+		with self.executor.lock:
+			if self._state is None:
+				self._callbacks.append(function)
+				return
+		function(self)
+
+	def _remove_done_callback(self, function):
+		# Forget a callback added by add_done_callback, if still pending.
+		with self.executor.lock:
+			if function in self._callbacks:
+				self._callbacks.remove(function)
+
+	def exception(self, timeout=None):
+		"""Wait at most timeout seconds for the job to be done, and return
+		the exception it raised, or None if it has been completed.
+		"""
+		if self._state is None:
+			event = threading.Event()
+			waiter = lambda future: event.set()
+			self.add_done_callback(waiter)
+			event.wait(timeout)
+			if self._state is None:
+				self._remove_done_callback(waiter)
+				raise TimeoutError('job %s is not done' % self.id)
+		if self._state == 'CANCELLED':
+			raise CancelledError('job %s has been cancelled' % self.id)
+		return self._value if self._state == 'FAILED' else None
+
+	def result(self, timeout=None):
+		"""Wait at most timeout seconds for the job to be done, and return
+		its result, or raise the exception it raised.
+		"""
+		exception = self.exception(timeout)
+		if exception is not None:
+			raise exception
+		return self._value
+
+	def _set(self, state, value):
+		# Resolve the future, with the executor lock held.
+		# Return the callbacks to be run.
+		self._state = state
+		self._value = value
+		callbacks, self._callbacks = self._callbacks, []
+		return callbacks
+
+	def _run(self, callbacks):
+		for function in callbacks:
+			try:
+				function(self)
+			except Exception:
+				pass    ## must not stop the tracker thread
+
+	def __repr__(self):
+		return '<Future(%s, %s) at %s>' % (self.id, self._state or 'PENDING', hex(id(self)))
+
+
+FIRST_COMPLETED = 'FIRST_COMPLETED'
+FIRST_EXCEPTION = 'FIRST_EXCEPTION'
+ALL_COMPLETED = 'ALL_COMPLETED'
+
+
+def as_completed(futures, timeout=None):
+	"""Yield the given futures as they are done.  Raise TimeoutError if
+	they are not all done within timeout seconds.
+	"""
+	pending = set(futures)
+	done = Queue.Queue()
+	for future in pending:
+		future.add_done_callback(done.put)
+	if timeout is not None:
+		deadline = time.time() + timeout
+	while pending:
+		try:
+			if timeout is None:
+				future = done.get()
+			else:
+				future = done.get(timeout=max(0, deadline - time.time()))
+		except Queue.Empty:
+			for future in pending:
+				future._remove_done_callback(done.put)
+			raise TimeoutError('%s futures are not done' % len(pending))
+		pending.discard(future)
+		yield future
+
+
+def wait(futures, timeout=None, return_when=ALL_COMPLETED):
+	"""Wait at most timeout seconds for the given futures to be done:
+	either the first one (FIRST_COMPLETED), the first one to fail or all
+	of them (FIRST_EXCEPTION) or all of them (ALL_COMPLETED).
+
+	Return a pair of sets:  the futures done and those not done.
+	"""
+	futures = set(futures)
+	try:
+		for future in as_completed(futures, timeout):
+			if return_when == FIRST_COMPLETED:
+				break
+			if return_when == FIRST_EXCEPTION and future._state == 'FAILED':
+				break
+	except TimeoutError:
+		pass
+	done = set(future for future in futures if future.done())
+	return done, futures - done
+
+
+class _JobFunction(object):
+	# The function of the pool of an Executor:  apply function to the items
+	# of (id, item) pairs, and pair the outputs with their job ids.  Unlike
+	# a closure, it can be pickled to be sent to a NetworkPool.
+	def __init__(self, function):
+		self.function = function
+
+	def __call__(self, input, *args, **kwargs):
+		input, dupinput = itertools.tee(input)
+		id = iter(dupinput >> cut[0])
+		input = iter(input >> cut[1])
+		output = self.function(input, *args, **kwargs)
+		## izip, unlike a generator, goes on after a failed item
+		return itertools.izip(id, output)
+
+
+_JOBSTATES = ('SUBMITTED', 'RUNNING', 'COMPLETED', 'FAILED', 'CANCELLED')
+_SUBMITTED, _RUNNING, _COMPLETED, _FAILED, _CANCELLED = range(5)
+## Job statuses are stored as these codes, those of the finished jobs
+## being greater than _RUNNING.
 
 
 class Executor(object):
-	"""Provide a fine-grained level of control over a ThreadPool or ProcessPool.
+	"""Provide a fine-grained level of control over a ThreadPool, ProcessPool
+	or NetworkPool.
 
 	The constructor takes a pool class and arguments to its constructor::
 
@@ -916,22 +3927,75 @@ class Executor(object):
 	  True
 	  >>> list(executor.failure)
 	  [('foo', TypeError("can't multiply sequence by non-int of type 'str'",))]
+
+	With futures=True, submit() returns Future objects instead, which
+	give the result of each job.  These results are not put into
+	`result` and `failure`::
+
+	  >>> executor = Executor(ThreadPool, map(lambda x: x*x))
+	  >>> executor.submit(7, futures=True).result()
+	  49
+	  >>> futures = executor.submit(*range(5), futures=True)
+	  >>> sorted(future.result() for future in as_completed(futures))
+	  [0, 1, 4, 9, 16]
+
+	Items can also be drawn lazily from an iterable, while at most
+	`window` jobs are in flight::
+
+	  >>> ids = executor.submit_iter(xrange(100), window=10)
+	  >>> ids >> item[-1]
+	  105
+	  >>> executor.close()
+
+	Job statuses take one byte each, and those of the oldest finished jobs
+	are evicted when there are at least `evictsize` of them in a row.
+
+	Waiting jobs are run in order of priority, lowest first, then in order
+	of submission.  With `aging`, a job of priority p is run as if it had
+	been submitted p*aging seconds later, as told by `clock`, so that no
+	job waits forever.
+
+	At most `depth` jobs per worker are dispatched to the pool at a time,
+	so that a worker can start on its next job without waiting for the
+	executor.  An elastic pool counts as `poolsize` workers, and grows as
+	jobs are dispatched to it.  With depth='auto', the depth is doubled or halved every
+	`tuneinterval` seconds, up to `maxdepth`, in the direction that last
+	improved throughput.  Only dispatched jobs cannot be cancelled.
 	"""
-	def __init__(self, poolclass, function, poolsize=_nCPU, args=[], kwargs={}):
-		def process_job_id(input):
-			input, dupinput = itertools.tee(input)
-			id = iter(dupinput >> cut[0])
-			input = iter(input >> cut[1])
-			output = function(input, *args, **kwargs)
-			for item in output:
-				yield next(id), item
-		self.pool = poolclass(process_job_id,
+	evictsize = 65536
+	tuneinterval = 0.1
+	maxdepth = 64
+	clock = staticmethod(time.time)
+	## The time by which waiting jobs age.
+
+	def __init__(self, poolclass, function, poolsize=_nCPU, args=[], kwargs={},
+	             aging=None, depth=1, **options):
+		"""Other keyword arguments are passed to the pool class, except
+		ordered, chunksize and persistent, which change the items of the
+		pool's input queue and raise ValueError.
+		"""
+		for option, default in [('ordered', False), ('chunksize', 1),
+		                        ('persistent', False)]:
+			if options.get(option, default) != default:
+				raise ValueError('an Executor cannot use a pool with %s=%r'
+				                 % (option, options[option]))
+		self.pool = poolclass(_JobFunction(function),
 		                      poolsize=poolsize,
 		                      args=args,
-		                      kwargs=kwargs)
+		                      kwargs=kwargs,
+		                      **options)
 		self.jobcount = 0
-		self._status = []
-		self.waitqueue = Queue.Queue()
+		self._status = array.array('B')
+		self._base = 0
+		## The id of the job whose status is self._status[0].
+		self._nfinished = 0
+		## The number of finished jobs at the start of self._status.
+		self._ninflight = 0
+		self._futures = {}
+		## Futures of the jobs not yet done, by id.
+		self.aging = aging
+		self.waitqueue = Queue.PriorityQueue()
+		## Holds (key, id, item) of waiting jobs, see _key().
 		if poolclass is ProcessPool:
 			self.resultqueue = multiprocessing.queues.SimpleQueue()
 			self.failqueue = multiprocessing.queues.SimpleQueue()
@@ -945,59 +4009,169 @@ class Executor(object):
 		self.lock = threading.Lock()
 		## Acquired to submit and update job statuses.
 
-		self.sema = threading.BoundedSemaphore(poolsize)
+		self.finished = threading.Condition(self.lock)
+		## Notified when a job is finished.
+
+		self.autotune = depth == 'auto'
+		self.depth = 1 if self.autotune else depth
+		self._ndispatched = 0
+		self._tuning = time.time(), 0, 0, True
+		## The start time, the number of jobs done and the throughput
+		## of the current tuning interval, and whether depth was increased.
+
+		self.dispatchable = threading.Condition(self.lock)
 		## Used to throttle transfer from waitqueue to pool.inqueue,
-		## acquired by input_feeder, released by trackers.
+		## waited for by input_feeder, notified by trackers.
 
 		def feed_input():
-			for id, item in _iterqueue(self.waitqueue):
-				self.sema.acquire()
+			grow = getattr(self.pool, '_grow', None)
+			while 1:
+				with self.lock:         # before picking the next job
+					while self._ndispatched >= self.pool.poolsize * self.depth:
+						self.dispatchable.wait()
+				_, id, item = self.waitqueue.get()
+				if item is StopIteration:
+					break
 				with self.lock:
-					if self._status[id] == 'SUBMITTED':
+					## A job cancelled while waiting may have been evicted
+					if id >= self._base and self._status[id - self._base] == _SUBMITTED:
 						self.pool.inqueue.put((id, item))
-						self._status[id] = 'RUNNING'
-					else:
-						self.sema.release()
+						self._status[id - self._base] = _RUNNING
+						self._ndispatched += 1
+						if grow is not None:
+							grow()    ## an elastic pool may start a worker
 			self.pool.inqueue.put(StopIteration)
 		self.inputfeeder_thread = threading.Thread(target=feed_input)
 		self.inputfeeder_thread.start()
 
 		def track_result():
 			for id, item in self.pool:
-				self.sema.release()
 				with self.lock:
-					self._status[id] = 'COMPLETED'
-				self.resultqueue.put(item)
+					self._undispatch()
+					self._finish(id, _COMPLETED)
+					future = self._futures.pop(id, None)
+					if future is not None:
+						callbacks = future._set('COMPLETED', item)
+				if future is None:
+					self.resultqueue.put(item)
+				else:
+					future._run(callbacks)
 			self.resultqueue.put(StopIteration)
 		self.resulttracker_thread = threading.Thread(target=track_result)
 		self.resulttracker_thread.start()
 
 		def track_failure():
 			for outval, exception in self.pool.failure:
-				self.sema.release()
 				id, item = outval
 				with self.lock:
-					self._status[id] = 'FAILED'
-				self.failqueue.put((item, exception))
+					self._undispatch()
+					self._finish(id, _FAILED)
+					future = self._futures.pop(id, None)
+					if future is not None:
+						callbacks = future._set('FAILED', exception)
+				if future is None:
+					self.failqueue.put((item, exception))
+				else:
+					future._run(callbacks)
 			self.failqueue.put(StopIteration)
 		self.failuretracker_thread = threading.Thread(target=track_failure)
 		self.failuretracker_thread.start()
 
-	def submit(self, *items):
-		"""Return job ids assigned to the submitted items."""
+	def submit(self, *items, **kwargs):
+		"""Return job ids assigned to the submitted items, or Future
+		objects for them if called with futures=True.
+
+		The jobs have priority 0 unless called with another priority.
+		"""
+		futures = kwargs.pop('futures', False)
+		key = self._key(kwargs.pop('priority', 0))
 		with self.lock:
 			if self.closed:
 				raise BrokenPipe('Job submission has been closed.')
 			id = self.jobcount
-			self._status += ['SUBMITTED'] * len(items)
+			self._status.extend(array.array('B', [_SUBMITTED]) * len(items))
 			self.jobcount += len(items)
+			self._ninflight += len(items)
+			if futures:
+				for i in xrange(id, id + len(items)):
+					self._futures[i] = Future(self, i)
+				submitted = [self._futures[i] for i in xrange(id, id + len(items))]
 			for item in items:
-				self.waitqueue.put((id, item))
+				self.waitqueue.put((key, id, item))
 				id += 1
+		if not futures:
+			submitted = range(id - len(items), id)
 		if len(items) == 1:
-			return id - 1
+			return submitted[0]
+		else:
+			return submitted
+
+	def submit_iter(self, iterable, futures=False, window=None, priority=0):
+		"""Submit the items of iterable as they are needed, i.e. while
+		fewer than window jobs are submitted but not finished, by default
+		twice the pool size.
+
+		Return an iterator over the job ids, or Future objects if futures
+		is True, which draws and submits an item for each value.  Unless
+		futures is True, the `result` and `failure` should be consumed
+		meanwhile for the jobs to finish.
+		"""
+		if window is None:
+			window = 2 * self.pool.poolsize
+		for x in iterable:
+			with self.lock:
+				while self._ninflight >= window and not self.closed:
+					self.finished.wait()
+			yield self.submit(x, futures=futures, priority=priority)
+
+	def _key(self, priority):
+		# The key by which waiting jobs of the given priority are ordered.
+		if self.aging is None:
+			return priority
+		return self.clock() + priority * self.aging
+
+	def _undispatch(self):
+		# Account for a dispatched job being done, with the lock held,
+		# and tune the depth if needed.
+		self._ndispatched -= 1
+		self.dispatchable.notify()
+		if not self.autotune:
+			return
+		start, ndone, throughput, increased = self._tuning
+		ndone += 1
+		now = time.time()
+		if now - start < self.tuneinterval:
+			self._tuning = start, ndone, throughput, increased
+			return
+		if self.waitqueue.empty():
+			## Throughput is limited by submissions, not by the depth
+			self._tuning = now, 0, 0, increased
+			return
+		if ndone / (now - start) < throughput:
+			increased = not increased
+		if increased:
+			self.depth = min(self.depth * 2, self.maxdepth)
 		else:
-			return range(id - len(items), id)
+			self.depth = max(self.depth // 2, 1)
+		self._tuning = now, 0, ndone / (now - start), increased
+		self.dispatchable.notify()
+
+	def _finish(self, id, state):
+		# Set the status of a job that is finished, with the lock held.
+		# The statuses of the finished jobs at the start of self._status
+		# are evicted once there are at least evictsize of them.
+		self._status[id - self._base] = state
+		self._ninflight -= 1
+		self.finished.notify_all()
+		status = self._status
+		n = self._nfinished
+		while n < len(status) and status[n] > _RUNNING:
+			n += 1
+		if n >= self.evictsize:
+			del status[:n]
+			self._base += n
+			n = 0
+		self._nfinished = n
 
 	def cancel(self, *ids):
 		"""Try to cancel jobs with associated ids.
@@ -1005,26 +4179,38 @@ class Executor(object):
 		Return the actual number of jobs cancelled.
 		"""
 		ncancelled = 0
+		cancelled = []
 		with self.lock:
 			for id in ids:
-				try:
-					if self._status[id] == 'SUBMITTED':
-						self._status[id] = 'CANCELLED'
-						ncancelled += 1
-				except IndexError:
-					pass
+				if id < self._base or id >= self.jobcount:
+					continue
+				if self._status[id - self._base] == _SUBMITTED:
+					self._finish(id, _CANCELLED)
+					ncancelled += 1
+					future = self._futures.pop(id, None)
+					if future is not None:
+						cancelled.append((future, future._set('CANCELLED', None)))
+		for future, callbacks in cancelled:
+			future._run(callbacks)
 		return ncancelled
 
 	def status(self, *ids):
 		"""Return the statuses of jobs with associated ids at the
 		time of call:  either 'SUBMITED', 'CANCELLED', 'RUNNING',
-		'COMPLETED' or 'FAILED'.
+		'COMPLETED' or 'FAILED', or 'FINISHED' for a finished job whose
+		status has been evicted.
 		"""
+		def status(id):
+			if id < 0:
+				raise IndexError('job id out of range')
+			if id < self._base:
+				return 'FINISHED'
+			return _JOBSTATES[self._status[id - self._base]]
 		with self.lock:
 			if len(ids) > 1:
-				return [self._status[i] for i in ids]
+				return [status(i) for i in ids]
 			else:
-				return self._status[ids[0]]
+				return status(ids[0])
 
 	def close(self):
 		"""Signal that the executor will no longer accept job submission.
@@ -1036,8 +4222,9 @@ class Executor(object):
 		with self.lock:
 			if self.closed:
 				return
-			self.waitqueue.put(StopIteration)
+			self.waitqueue.put((float('inf'), self.jobcount, StopIteration))
 			self.closed = True
+			self.finished.notify_all()
 
 	def join(self):
 		"""Note that the Executor must be close()'d elsewhere,
@@ -1052,19 +4239,124 @@ class Executor(object):
 		"""Shut down the Executor.  Suspend all waiting jobs.
 
 		Running workers will terminate after finishing their current job items.
-		The call will block until all workers are terminated.
+		The call will block until all workers are terminated.  The futures
+		of suspended jobs are cancelled.
 		"""
+		cancelled = []
 		with self.lock:
 			self.pool.inqueue.put(StopIteration)   # Stop the pool workers
-			self.waitqueue.put(StopIteration)      # Stop the input_feeder
-			_iterqueue(self.waitqueue) >> item[-1] # Exhaust the waitqueue
-			self.closed = True
+			while not self.waitqueue.empty():      # Exhaust the waitqueue
+				self.waitqueue.get()
+			self.waitqueue.put((float('-inf'), -1, StopIteration))
+			self.closed = True                     # Stop the input_feeder
+			self.finished.notify_all()
+			for id, future in self._futures.items():
+				if self._status[id - self._base] == _SUBMITTED:
+					del self._futures[id]
+					cancelled.append((future, future._set('CANCELLED', None)))
+		for future, callbacks in cancelled:
+			future._run(callbacks)
 		self.join()
 
 	def __repr__(self):
-		return '<Executor(%s, poolsize=%s) at %s>' % (self.pool.__class__.__name__,
-		                                              self.pool.poolsize,
-		                                              hex(id(self)))
+		return '<Executor(%s, poolsize=%s, depth=%s) at %s>' % (self.pool.__class__.__name__,
+		                                                        self.pool.poolsize,
+		                                                        self.depth,
+		                                                        hex(id(self)))
+
+
+#_____________________________________________________________________
+# Concurrent I/O using an asyncio event loop
+
+
+class amap(Stream):
+	"""Invoke a coroutine function on each element of the input stream,
+	running up to `concurrency` of the coroutines at once on an asyncio
+	event loop, all in a single thread.
+
+	This is suited to I/O-bound work, where a ThreadPool would need as
+	many threads as there are operations in progress.  As with a pool,
+	the output values come in the order of completion.  If an input value
+	causes an Exception to be raised, the tuple (value, exception) is
+	put into the `failqueue`, and the attribute `failure` is a thread-safe
+	iterator over it.
+
+	Requires asyncio, or its backport trollius under Python 2.  For
+	example::
+
+	  @asyncio.coroutine
+	  def delayed(x):
+	      yield From(asyncio.sleep(0.1))
+	      raise Return(x * x)
+
+	  range(1000) >> amap(delayed, concurrency=1000) >> sum    # in 0.1s
+	"""
+	def __init__(self, function, concurrency=1000):
+		"""function: a coroutine function, to be called with each stream
+		element as its only argument
+
+		concurrency: the maximum number of coroutines in progress
+		"""
+		if asyncio is None:
+			raise ImportError('amap requires asyncio or trollius')
+		super(amap, self).__init__()
+		self.function = function
+		self.concurrency = concurrency
+		self.outqueue = _NotifyingQueue()
+		self.failqueue = Queue.Queue()
+		self.failure = Stream(_iterqueue(self.failqueue))
+
+	def __call__(self, inpipe):
+		loop = asyncio.new_event_loop()
+		slots = threading.Semaphore(self.concurrency)
+		## Acquired by the feeder for each item, released when done.
+
+		def done(item, future):
+			try:
+				self.outqueue.put(future.result())
+			except Exception, e:
+				self.failqueue.put((item, e))
+			slots.release()
+
+		def start(item):
+			try:
+				future = asyncio.ensure_future(self.function(item), loop=loop)
+			except Exception, e:
+				self.failqueue.put((item, e))
+				slots.release()
+			else:
+				future.add_done_callback(lambda future: done(item, future))
+
+		def feed():
+			try:
+				for item in inpipe:
+					slots.acquire()
+					loop.call_soon_threadsafe(start, item)
+			except Exception, e:
+				self.failqueue.put((None, e))
+			# Wait for all coroutines to be done
+			for _ in xrange(self.concurrency):
+				slots.acquire()
+			loop.call_soon_threadsafe(loop.stop)
+
+		def run():
+			asyncio.set_event_loop(loop)
+			loop.run_forever()
+			loop.close()
+			self.outqueue.put(StopIteration)
+			self.failqueue.put(StopIteration)
+
+		self.loop_thread = threading.Thread(target=run)
+		self.loop_thread.start()
+		self.feeder_thread = threading.Thread(target=feed)
+		self.feeder_thread.start()
+		return _iterqueue(self.outqueue)
+
+	def join(self):
+		self.loop_thread.join()
+
+	def __repr__(self):
+		return '<amap(concurrency=%s) at %s>' % (self.concurrency, hex(id(self)))
 
 
 #_____________________________________________________________________
@@ -1073,22 +4365,47 @@ class Executor(object):
 
 class PCollector(Stream):
 	"""Collect items from many ForkedFeeder's or ProcessPool's.
+
+	Input pipes are registered once with an epoll object, or a poll
+	object where epoll is not available, so there is no limit on their
+	number and each wakeup only costs as much as the number of ready
+	pipes.  Up to `burst` items are received from a ready pipe in a row.
 	"""
-	def __init__(self):
-		self.inpipes = []
-		def selrecv():
+	def __init__(self, burst=64):
+		"""burst: the maximum number of items received in a row from
+		a single pipe
+		"""
+		self.inpipes = {}
+		## Maps file descriptors to the pipes registered with the poller.
+		self.burst = burst
+		if hasattr(select, 'epoll'):
+			self.poller = select.epoll()
+			self.eventmask = select.EPOLLIN
+		else:
+			self.poller = select.poll()
+			self.eventmask = select.POLLIN
+		def pollrecv():
 			while self.inpipes:
-				ready, _, _ = select.select(self.inpipes, [], [])
-				for inpipe in ready:
-					item = inpipe.recv()
-					if item is StopIteration:
-						del self.inpipes[self.inpipes.index(inpipe)]
-					else:
+				for fd, _ in self.poller.poll():
+					inpipe = self.inpipes.get(fd)
+					for _ in xrange(self.burst):
+						try:
+							item = inpipe.recv()
+						except EOFError:
+							item = StopIteration
+						if item is StopIteration:
+							self.poller.unregister(fd)
+							del self.inpipes[fd]
+							break
 						yield item
-		self.iterator = selrecv()
+						if not inpipe.poll():
+							break
+		self.iterator = pollrecv()
 
 	def __pipe__(self, inpipe):
-		self.inpipes.append(inpipe.outpipe)
+		fd = inpipe.outpipe.fileno()
+		self.inpipes[fd] = inpipe.outpipe
+		self.poller.register(fd, self.eventmask)
 
 	def __repr__(self):
 		return '<PCollector at %s>' % hex(id(self))
@@ -1130,30 +4447,47 @@ if sys.platform == "win32":
 class QCollector(Stream):
 	"""Collect items from many ThreadedFeeder's or ThreadPool's.
 
-	All input queues are polled individually.  When none is ready, the
-	collector sleeps for a fix duration before polling again.
+	The collector blocks until any of its inputs produces an item, being
+	notified directly by their output queues.  Inputs whose `outqueue` is
+	some other kind of queue are forwarded by a thread each.
 	"""
 	def __init__(self, waittime=0.1):
-		"""waitime: the duration that the collector sleeps for
-		when all input pipes are empty
+		"""waitime: ignored, kept for compatibility with the former
+		polling implementation
 		"""
 		self.inqueues = []
 		self.waittime = waittime
-		def nonemptyget():
+		self.ready = Queue.Queue()
+		def readyget():
 			while self.inqueues:
-				ready = [q for q in self.inqueues if not q.empty()]
-				if not ready:
-					time.sleep(self.waittime)
-				for q in ready:
-					item = q.get()
-					if item is StopIteration:
-						del self.inqueues[self.inqueues.index(q)]
-					else:
-						yield item
-		self.iterator = nonemptyget()
+				q = self.ready.get()
+				try:
+					item = q.get_nowait()
+				except Queue.Empty:
+					# Taken by another consumer of the same queue
+					continue
+				if item is StopIteration:
+					q.unlisten(self.ready)
+					del self.inqueues[self.inqueues.index(q)]
+				else:
+					yield item
+		self.iterator = readyget()
 
 	def __pipe__(self, inpipe):
-		self.inqueues.append(inpipe.outqueue)
+		q = inpipe.outqueue
+		if not isinstance(q, _NotifyingQueue):
+			q = _NotifyingQueue()
+			def forward(source=inpipe.outqueue, sink=q):
+				while 1:
+					item = source.get()
+					sink.put(item)
+					if item is StopIteration:
+						break
+			t = threading.Thread(target=forward)
+			t.daemon = True
+			t.start()
+		self.inqueues.append(q)
+		q.listen(self.ready)
 
 	def __repr__(self):
 		return '<QCollector at %s>' % hex(id(self))
@@ -1162,12 +4496,21 @@ class QCollector(Stream):
 class PSorter(Stream):
 	"""Merge sorted input (smallest to largest) coming from many
 	ForkedFeeder's or ProcessPool's.
+
+	With `key` or `reverse`, the inputs are sorted as by sorted() with the
+	same arguments.  Items with equal keys come in the order of inputs.
 	"""
-	def __init__(self):
+	def __init__(self, key=None, reverse=False):
+		"""key: a function of one argument to extract a comparison key
+
+		reverse: whether the inputs are sorted from largest to smallest
+		"""
 		self.inpipes = []
+		self.key = key
+		self.reverse = reverse
 
 	def __iter__(self):
-		return heapq.merge(*__builtin__.map(_iterrecv, self.inpipes))
+		return _merge(__builtin__.map(_iterrecv, self.inpipes), self.key, self.reverse)
 
 	def __pipe__(self, inpipe):
 		self.inpipes.append(inpipe.outpipe)
@@ -1179,12 +4522,21 @@ class PSorter(Stream):
 class QSorter(Stream):
 	"""Merge sorted input (smallest to largest) coming from many
 	ThreadFeeder's or ThreadPool's.
+
+	With `key` or `reverse`, the inputs are sorted as by sorted() with the
+	same arguments.
 	"""
-	def __init__(self):
+	def __init__(self, key=None, reverse=False):
+		"""key: a function of one argument to extract a comparison key
+
+		reverse: whether the inputs are sorted from largest to smallest
+		"""
 		self.inqueues = []
+		self.key = key
+		self.reverse = reverse
 
 	def __iter__(self):
-		return heapq.merge(*__builtin__.map(_iterqueue, self.inqueues))
+		return _merge(__builtin__.map(_iterqueue, self.inqueues), self.key, self.reverse)
 
 	def __pipe__(self, inpipe):
 		self.inqueues.append(inpipe.outqueue)
@@ -1193,6 +4545,166 @@ class QSorter(Stream):
 		return '<PSorter at %s>' % hex(id(self))
 
 
+#_____________________________________________________________________
+# Profiling
+
+
+def _stagename(stage):
+	# A readable name for a stage, e.g. 'ThreadPool(map(<lambda>))'.
+	if hasattr(stage, '__name__'):
+		name = stage.__name__
+	else:
+		name = stage.__class__.__name__
+	function = getattr(stage, 'function', None)
+	if function is None:
+		return name
+	return '%s(%s)' % (name, _stagename(function))
+
+
+class profiled(Stream):
+	"""Record the throughput of a stage:  the number of items going in and
+	out, the cumulative wall time spent waiting for its output, the time
+	it spent blocked on the upstream, and a histogram of per-item latencies.
+
+	>>> square = profiled(map(lambda x: x*x))
+	>>> range(10) >> square >> sum
+	285
+	>>> stats = square.stats()
+	>>> stats['stage'], stats['items_in'], stats['items_out']
+	('map(<lambda>)', 10, 10)
+
+	Piping to a profiled object actually pipes to the wrapped stage, so
+	the rest of the pipeline is unchanged.  The latency of an item is the
+	time it took the stage to output it, less the time spent upstream
+	meanwhile, in microseconds rounded up to a power of 2.  Note that a
+	ThreadPool or ProcessPool pulls its input from another thread, so
+	their upstream time overlaps their wall time.
+
+	See also: Profiler
+	"""
+	def __init__(self, stage, name=None):
+		"""stage: a Stream object or a function callable on an iterable
+
+		name: the name of the stage in the report, by default
+		derived from the stage's class and function
+		"""
+		super(profiled, self).__init__()
+		self.stage = stage
+		self.name = name if name else _stagename(stage)
+		self.items_in = 0
+		self.items_out = 0
+		self.wall_time = 0.0
+		self.upstream_time = 0.0
+		self.latency = collections.defaultdict(int)
+
+	def _meter_input(self, iterator):
+		clock = time.time
+		while 1:
+			t = clock()
+			try:
+				item = next(iterator)
+			finally:
+				self.upstream_time += clock() - t
+			self.items_in += 1
+			yield item
+
+	def _meter_output(self, iterator):
+		clock = time.time
+		while 1:
+			upstream = self.upstream_time
+			t = clock()
+			try:
+				item = next(iterator)
+			finally:
+				elapsed = clock() - t
+				self.wall_time += elapsed
+			self.items_out += 1
+			own = max(elapsed - (self.upstream_time - upstream), 0)
+			self.latency[2 ** math.frexp(own * 1e6)[1]] += 1
+			yield item
+
+	def __pipe__(self, inpipe):
+		input = self._meter_input(iter(inpipe))
+		t = time.time()
+		if hasattr(self.stage, '__pipe__'):
+			output = self.stage.__pipe__(input)
+		else:
+			output = self.stage(input)
+		self.wall_time += time.time() - t
+		if isinstance(output, Stream):
+			output.iterator = self._meter_output(iter(output))
+		return output
+
+	def stats(self):
+		"""Return the recorded statistics as a dict."""
+		return {
+			'stage': self.name,
+			'items_in': self.items_in,
+			'items_out': self.items_out,
+			'wall_time': self.wall_time,
+			'upstream_time': self.upstream_time,
+			'latency_us': dict(self.latency),
+		}
+
+	def __repr__(self):
+		return '<profiled(%s) at %s>' % (self.name, hex(id(self)))
+
+
+_profiler = None
+## The active Profiler, if any.  Checked by Stream.pipe.
+
+
+class Profiler(object):
+	"""Profile every stage piped while the profiler is active, including
+	those piped by other threads.
+
+	  >>> with Profiler() as profiler:
+	  ...     range(10) >> map(lambda x: x*x) >> filter(lambda x: x%2) >> sum
+	  165
+	  >>> [(s['stage'], s['items_in'], s['items_out']) for s in profiler.report()]
+	  [('map(<lambda>)', 10, 10), ('filter(<lambda>)', 10, 5), ('sum', 5, 0)]
+
+	Since each stage is metered separately, element-wise stages are not
+	fused while profiling.
+	"""
+	def __init__(self):
+		self.stages = []
+		self.lock = threading.Lock()
+
+	def start(self):
+		global _profiler
+		_profiler = self
+
+	def stop(self):
+		global _profiler
+		if _profiler is self:
+			_profiler = None
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, *exc_info):
+		self.stop()
+
+	def wrap(self, stage):
+		"""Return a profiled object for stage, recorded in the report."""
+		stage = profiled(stage)
+		with self.lock:
+			self.stages.append(stage)
+		return stage
+
+	def report(self):
+		"""Return the statistics of each stage, as a list of dicts in the
+		order the stages were piped.  See profiled.stats().
+		"""
+		with self.lock:
+			return [stage.stats() for stage in self.stages]
+
+	def __repr__(self):
+		return '<Profiler at %s>' % hex(id(self))
+
+
 #_____________________________________________________________________
 # Useful generator functions
 
@@ -1253,7 +4765,11 @@ def maximum(key):
 	>>> Stream([3, 5, 28, 42, 7]) >> maximum(lambda x: x%28)
 	42
 	"""
-	return lambda s: max(s, key=key)
+	def maximum(s):
+		if _isasync(s):
+			return _areduce(lambda x, y: y if key(y) > key(x) else x, _aiter(s))
+		return max(s, key=key)
+	return maximum
 
 
 def minimum(key):
@@ -1263,7 +4779,11 @@ def minimum(key):
 	>>> Stream([[13, 52], [28, 35], [42, 6]]) >> minimum(lambda v: v[0] + v[1])
 	[42, 6]
 	"""
-	return lambda s: min(s, key=key)
+	def minimum(s):
+		if _isasync(s):
+			return _areduce(lambda x, y: y if key(y) < key(x) else x, _aiter(s))
+		return min(s, key=key)
+	return minimum
 
 
 def reduce(function, initval=None):
@@ -1273,10 +4793,15 @@ def reduce(function, initval=None):
 	>>> reduce(lambda x,y: x+y)( [1, 2, 3, 4, 5] )
 	15
 	"""
-	if initval is None:
-		return lambda s: __builtin__.reduce(function, s)
-	else:
-		return lambda s: __builtin__.reduce(function, s, initval)
+	def reduce(s):
+		if _isasync(s):
+			if initval is None:
+				return _areduce(function, _aiter(s))
+			return _areduce(function, _aiter(s), initval)
+		if initval is None:
+			return __builtin__.reduce(function, s)
+		return __builtin__.reduce(function, s, initval)
+	return reduce
 
 
 #_____________________________________________________________________
@@ -0,0 +1,90 @@
+#!/usr/bin/env python2.6
+
+import os, sys
+import time
+
+from nose.plugins.skip import SkipTest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import amap, asyncio
+
+if asyncio is None:
+	raise SkipTest('amap requires asyncio or trollius')
+
+From = getattr(asyncio, 'From', lambda future: future)
+Return = getattr(asyncio, 'Return', StopIteration)
+
+
+@asyncio.coroutine
+def delayed_square(x):
+	yield From(asyncio.sleep(0.2))
+	raise Return(x * x)
+
+@asyncio.coroutine
+def fail_on_odd(x):
+	yield From(asyncio.sleep(0))
+	if x % 2:
+		raise ValueError(x)
+	raise Return(x)
+
+
+## Test cases
+
+def test_concurrent():
+	start = time.time()
+	result = range(2000) >> amap(delayed_square, concurrency=2000)
+	assert sorted(result) == [x * x for x in range(2000)]
+	assert time.time() - start < 2
+
+def test_bounded():
+	for concurrency in [1, 10, 100]:
+		yield check_bounded, concurrency
+
+def check_bounded(concurrency):
+	running = [0, 0]
+	@asyncio.coroutine
+	def track(x):
+		running[0] += 1
+		running[1] = max(running)
+		yield From(asyncio.sleep(0.001 * concurrency))
+		running[0] -= 1
+		raise Return(x)
+	assert sorted(range(300) >> amap(track, concurrency)) == range(300)
+	assert running[1] == min(concurrency, 300)
+
+def test_failure():
+	failing = amap(fail_on_odd, concurrency=10)
+	result = range(100) >> failing >> list
+	assert sorted(result) == range(0, 100, 2)
+	failures = failing.failure >> list
+	assert sorted(x for x, e in failures) == range(1, 100, 2)
+	assert all(isinstance(e, ValueError) for x, e in failures)
+
+def test_not_coroutine():
+	## Values for which the function does not return a coroutine are failures
+	failing = amap(lambda x: 1 / x)
+	assert range(3) >> failing >> list == []
+	failures = failing.failure >> list
+	assert failures[0][0] == 0 and isinstance(failures[0][1], ZeroDivisionError)
+	assert [x for x, e in failures[1:]] == [1, 2]
+
+@asyncio.coroutine
+def cancel_on_odd(x):
+	if x % 2:
+		asyncio.Task.current_task().cancel()
+	yield From(asyncio.sleep(0.01))
+	raise Return(x)
+
+def test_cancelled():
+	cancelling = amap(cancel_on_odd, concurrency=10)
+	assert sorted(range(20) >> cancelling) == range(0, 20, 2)
+	failures = cancelling.failure >> list
+	assert sorted(x for x, e in failures) == range(1, 20, 2)
+	assert all(isinstance(e, asyncio.CancelledError) for x, e in failures)
+
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python2.6
+
+import operator
+import os, sys
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import *
+from stream import asyncio, StopAsyncIteration
+
+if asyncio is not None:
+	coroutine = asyncio.coroutine
+	sleep = asyncio.sleep
+	From = getattr(asyncio, 'From', lambda future: future)
+	Return = getattr(asyncio, 'Return', StopIteration)
+
+	def run(coroutine):
+		loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(loop)
+		try:
+			return loop.run_until_complete(coroutine)
+		finally:
+			asyncio.set_event_loop(None)
+			loop.close()
+else:
+	## Without an event loop library, the coroutines of the stream module
+	## are generators which yield the coroutines they await, and return by
+	## raising StopIteration with their result:  a trampoline runs them.
+	coroutine = lambda function: function
+	sleep = lambda delay: None
+	From = lambda future: future
+	Return = StopIteration
+
+	def run(coroutine):
+		stack = [coroutine]
+		value = error = None
+		while 1:
+			try:
+				if error is not None:
+					out = stack[-1].throw(*error)
+				else:
+					out = stack[-1].send(value)
+			except StopIteration, e:
+				stack.pop()
+				value, error = (e.args[0] if e.args else None), None
+				if not stack:
+					return value
+				continue
+			except Exception:
+				stack.pop()
+				if not stack:
+					raise
+				value, error = None, sys.exc_info()
+				continue
+			value = error = None
+			if isinstance(out, types.GeneratorType):
+				stack.append(out)
+
+
+class Ticker(object):
+	"""An asynchronous iterable of 0, 1, ..., n-1, giving control back
+	to the event loop before each item.
+	"""
+	def __init__(self, n):
+		self.i = 0
+		self.n = n
+
+	def __aiter__(self):
+		return self
+
+	@coroutine
+	def __anext__(self):
+		yield From(sleep(0))
+		if self.i == self.n:
+			raise StopAsyncIteration
+		self.i += 1
+		raise Return(self.i - 1)
+
+@coroutine
+def drain(s):
+	items = []
+	iterator = s.__aiter__()
+	while 1:
+		try:
+			x = yield From(iterator.__anext__())
+		except StopAsyncIteration:
+			break
+		items.append(x)
+	raise Return(items)
+
+
+## Test cases: an asynchronous source gives the same results as a
+## synchronous one through each operator
+
+n = 50
+even = lambda x: x%2 == 0
+
+stages = [
+	[lambda: Stream()],
+	[lambda: Stream([-1, -2])],
+	[lambda: take(10)],
+	[lambda: drop(10)],
+	[lambda: takei(xrange(3, 100, 7))],
+	[lambda: dropi(xrange(0, 100, 3))],
+	[lambda: map(lambda x: x*x)],
+	[lambda: filter(even)],
+	[lambda: map(lambda x: (x, x)), lambda: apply(operator.mul)],
+	[lambda: takewhile(lambda x: x < 20)],
+	[lambda: dropwhile(lambda x: x < 20)],
+	[lambda: map(lambda x: x*3), lambda: filter(even), lambda: takewhile(lambda x: x < 100)],
+	[lambda: fold(operator.add)],
+	[lambda: fold(operator.add, 7)],
+	[lambda: sliding(operator.add, 5)],
+	[lambda: map(lambda x: (x // 3, x)), lambda: sliding(max, duration=2)],
+	[lambda: tumbling(operator.add, 7)],
+	[lambda: map(lambda x: (x // 3, x)), lambda: tumbling(operator.add, duration=2)],
+	[lambda: chop(7)],
+	[lambda: chop(7, reuse=True), lambda: map(sum)],
+	[lambda: chop(7, typecode='i')],
+	[lambda: chop(3), lambda: flatten],
+	[lambda: map(lambda x: [x, [x, [x]]]), lambda: flatten],
+	[lambda: map(lambda x: [x, -x]), lambda: cut[1:]],
+	[lambda: prepend([-1, -2])],
+]
+
+def test_stages():
+	for stage in stages:
+		yield check_stage, stage
+
+def pipeline(source, stages):
+	for stage in stages:
+		source = source >> stage()
+	return source
+
+def check_stage(stages):
+	expected = pipeline(range(n), stages) >> list
+	assert run(drain(pipeline(Ticker(n), stages))) == expected
+
+accumulators = [
+	lambda: item[3],
+	lambda: item[-3],
+	lambda: item[:5],
+	lambda: item[2:9:3],
+	lambda: item[::-2],
+	lambda: maximum(lambda x: x%7),
+	lambda: minimum(lambda x: -x),
+	lambda: reduce(operator.add),
+	lambda: reduce(operator.add, 10),
+]
+
+def test_accumulators():
+	for accumulator in accumulators:
+		yield check_accumulator, accumulator
+
+def check_accumulator(accumulator):
+	expected = Stream(range(n)) >> accumulator()
+	assert run(Stream(Ticker(n)) >> accumulator()) == expected
+
+def test_sync_aiter():
+	assert run(drain(range(10) >> map(lambda x: x+1))) == range(1, 11)
+
+def test_nested_async():
+	nested = Ticker(3) >> map(lambda x: [x, Ticker(x)])
+	assert run(drain(nested >> flatten)) == [0, 1, 0, 2, 0, 1]
+
+def test_sync_only_stage():
+	try:
+		Ticker(3) >> Processor(lambda i: i)
+	except BrokenPipe:
+		pass
+	else:
+		assert False, 'Processor should refuse an asynchronous input'
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
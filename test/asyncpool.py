@@ -4,11 +4,13 @@ import os
 import sys
 
 from pprint import pprint
-from random import randint
+from random import randint, random
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from stream import filter, map, ThreadPool, ProcessPool
+import time
+
+from stream import filter, map, item, ThreadPool, ProcessPool
 
 
 ## The test data
@@ -52,6 +54,49 @@ def processpool(i):
 	assert result == resultset[i]
 
 
+def chunked(chunksize, ordered, i):
+	pool = ProcessPool(func, poolsize=2, ordered=ordered, chunksize=chunksize)
+	result = dataset[i] >> pool >> list
+	if ordered:
+		assert result == dataset[i] >> func >> list
+	else:
+		assert set(result) == resultset[i]
+
+def chunked_failure(chunksize):
+	pool = ProcessPool(map(lambda x: 10 // x), poolsize=2, chunksize=chunksize)
+	assert sorted(range(-5, 6) >> pool) == [-10, -5, -4, -3, -2, 2, 2, 3, 5, 10]
+	failures = list(pool.failure)
+	assert len(failures) == 1
+	assert failures[0][0] == 0
+	assert isinstance(failures[0][1], ZeroDivisionError)
+
+def ordered(poolclass, i):
+	result = dataset[i] >> poolclass(func, poolsize=4, ordered=True, window=16) >> list
+	assert result == dataset[i] >> func >> list
+
+def scrambled(poolclass):
+	# Items completing out of order still come out in order
+	def jitter(x):
+		time.sleep(random() * 0.01)
+		return x
+	result = range(100) >> poolclass(map(jitter), poolsize=4, ordered=True) >> list
+	assert result == range(100)
+
+def window(poolclass):
+	pulled = []
+	def source():
+		for x in range(100):
+			pulled.append(x)
+			yield x
+	output = iter(source() >> poolclass(map(lambda x: x), poolsize=2,
+	                                     ordered=True, window=5))
+	assert output >> item[:3] == [0, 1, 2]
+	time.sleep(0.2)
+	# 3 items output, up to 5 in progress, 1 held by the feeder
+	assert len(pulled) <= 3 + 5 + 1
+	assert list(output) == range(3, 100)
+
+
 ## Test cases
 
 def test_ThreadPool():
@@ -62,6 +107,25 @@ def test_ProcessPool():
 	for i in range(len(dataset)):
 		yield processpool, i
 
+def test_ordered_ThreadPool():
+	for i in range(len(dataset)):
+		yield ordered, ThreadPool, i
+	yield scrambled, ThreadPool
+	yield window, ThreadPool
+
+def test_ordered_ProcessPool():
+	for i in range(len(dataset)):
+		yield ordered, ProcessPool, i
+	yield scrambled, ProcessPool
+	yield window, ProcessPool
+
+def test_chunked_ProcessPool():
+	for chunksize in [7, 'auto']:
+		for ordered in [False, True]:
+			for i in range(len(dataset)):
+				yield chunked, chunksize, ordered, i
+		yield chunked_failure, chunksize
+
 
 if __name__ == '__main__':
 	import nose
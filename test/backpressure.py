@@ -0,0 +1,72 @@
+#!/usr/bin/env python2.6
+
+import __builtin__
+import os, sys, threading
+
+from nose.plugins.skip import SkipTest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import ThreadPool, ThreadedFeeder, map, item
+
+
+## Soak test:  an unbounded source consumed through bounded queues must run
+## in constant memory.
+
+N = 50000
+
+def rss():
+	# Resident set size in bytes
+	try:
+		statm = open('/proc/self/statm').read().split()
+	except IOError:
+		raise SkipTest('/proc/self/statm is not available')
+	return int(statm[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def unbounded(stop):
+	n = 0
+	while not stop.is_set():
+		yield str(n) * 100
+		n += 1
+
+def work(s):
+	# Slower than generating an item
+	return sum(__builtin__.map(ord, s))
+
+def soak(make_stream):
+	stop = threading.Event()
+	stream = iter(make_stream(stop))
+	stream >> item[N // 10]
+	before = rss()
+	for _ in range(9):
+		stream >> item[N // 10]
+	after = rss()
+	stop.set()
+	for _ in stream:
+		pass
+	assert after - before < (4 << 20), (before, after)
+
+
+## Test cases
+
+def test_ThreadPool():
+	soak(lambda stop: unbounded(stop) >> ThreadPool(map(work), poolsize=2, maxsize=100))
+
+def test_ThreadedFeeder():
+	soak(lambda stop: ThreadedFeeder(unbounded, stop, maxsize=100) >> map(work))
+
+def test_bounded_input():
+	pulled = []
+	def source():
+		for x in range(1000):
+			pulled.append(x)
+			yield x
+	output = iter(source() >> ThreadPool(map(lambda x: x), poolsize=2, maxsize=10))
+	assert output >> item[:5] == range(5)
+	assert len(pulled) < 50
+	assert sorted(output) == range(5, 1000)
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python2.6
+
+import os, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import broadcast, map, filter, seq, item, Stream
+
+
+N = 10000
+
+
+## Test scenario:  branches consumed concurrently at different speeds
+
+def concurrent(policy, nbranches):
+	branches = [Stream() for _ in range(nbranches - 1)]
+	main = xrange(N) >> broadcast(*branches, maxsize=100, policy=policy)
+	results = [None] * nbranches
+	def consume(i, stream):
+		output = []
+		for x in stream:
+			output.append(x)
+			if i == 1 and x % 1000 == 0:
+				time.sleep(0.01)    # lag behind the others
+		results[i] = output
+	threads = [threading.Thread(target=consume, args=(i, s))
+	           for i, s in enumerate([main] + branches)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	for r in results:
+		assert r == range(N)
+
+def buffered(policy):
+	# Consume the main branch entirely before the other one
+	foo = map(lambda x: x)
+	main = xrange(N) >> broadcast(foo, maxsize=100, policy=policy)
+	assert main >> list == range(N)
+	return foo >> list
+
+
+## Test cases
+
+def test_block():
+	for n in [1, 2, 3, 8]:
+		yield concurrent, 'block', n
+
+def test_spill():
+	for n in [2, 3]:
+		yield concurrent, 'spill', n
+	assert buffered('spill') == range(N)
+
+def test_drop():
+	assert buffered('drop') == range(N - 100, N)
+
+def test_bounded():
+	# With 'block', the main branch cannot get ahead by more than maxsize
+	foo = Stream()
+	main = seq() >> broadcast(foo, maxsize=10)
+	for x in foo >> item[:5]:
+		pass
+	pulled = []
+	t = threading.Thread(target=lambda: pulled.extend(main >> item[:100]))
+	t.daemon = True
+	t.start()
+	time.sleep(0.2)
+	assert pulled == []
+	assert t.is_alive()
+	foo >> item[:100]
+	t.join()
+	assert pulled == range(100)
+
+def test_exception():
+	def source():
+		yield 1
+		raise ValueError
+	foo = Stream()
+	main = source() >> broadcast(foo, policy='drop')
+	assert next(iter(main)) == 1
+	try:
+		next(iter(main))
+	except ValueError:
+		pass
+	else:
+		assert False
+	assert foo >> list == [1]
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
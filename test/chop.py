@@ -0,0 +1,50 @@
+#!/usr/bin/env python2.6
+
+import os, sys
+
+from nose.plugins.skip import SkipTest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import chop, map
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+def check(n, length, typecode, dtype, reuse):
+	if dtype is not None and numpy is None:
+		raise SkipTest('NumPy is not available')
+	segments = range(length) >> chop(n, typecode, dtype, reuse)
+	# Copy each segment, since they are refilled when reuse=True
+	result = segments >> map(list) >> list
+	assert result == [range(i, min(i + n, length)) for i in range(0, length, n)]
+
+
+## Test cases
+
+def test_chop():
+	for n in [1, 3, 10]:
+		for length in [0, 1, 9, 10, 11]:
+			for reuse in [False, True]:
+				yield check, n, length, None, None, reuse
+				yield check, n, length, 'l', None, reuse
+				yield check, n, length, None, int, reuse
+
+def test_reuse():
+	segments = range(10) >> chop(3, reuse=True) >> list
+	assert all(s is segments[0] for s in segments)
+
+def test_reuse_numpy():
+	if numpy is None:
+		raise SkipTest('NumPy is not available')
+	segments = range(9) >> chop(3, dtype=int, reuse=True) >> list
+	assert all(s is segments[0] for s in segments)
+	assert list(segments[0]) == [6, 7, 8]
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
@@ -1,9 +1,12 @@
 #!/usr/bin/env python2.6
 
-import os, sys
+import multiprocessing
+import os, sys, resource
 
 from pprint import pprint
 
+from nose.plugins.skip import SkipTest
+
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from stream import ForkedFeeder, ThreadedFeeder, PCollector, QCollector
@@ -27,6 +30,12 @@ def collect(feeder_class, collector_class, n):
 	assert set(results) == set(xrange(N))
 
 
+class PipeFeeder(object):
+	# A feeder whose items are sent from this very process.
+	def __init__(self):
+		self.outpipe, self.inpipe = multiprocessing.Pipe(duplex=False)
+
+
 ## Test cases
 
 def test_PCollector():
@@ -37,6 +46,25 @@ def test_QCollector():
 	for i in [1, 2, 3, 4]:
 		yield collect, ThreadedFeeder, QCollector, i
 
+def test_PCollector_many():
+	# More inputs than select() can handle
+	n = 2000
+	if resource.getrlimit(resource.RLIMIT_NOFILE)[0] < 2 * n + 100:
+		raise SkipTest('not enough file descriptors allowed')
+	consumer = PCollector()
+	feeders = [PipeFeeder() for _ in range(n)]
+	for f in feeders:
+		f >> consumer
+	for i, f in enumerate(feeders):
+		f.inpipe.send(i)
+		f.inpipe.send(-i)
+		if i % 2:
+			f.inpipe.send(StopIteration)
+		else:
+			f.inpipe.close()
+	results = consumer >> list
+	assert sorted(results) == sorted(range(n) + [-i for i in range(n)])
+
 
 if __name__ == '__main__':
 	import nose
@@ -0,0 +1,81 @@
+#!/usr/bin/env python2.6
+
+import os, sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import map, ThreadPool, ProcessPool, Executor
+
+
+def slow_square(x):
+	time.sleep(0.02)
+	return x*x
+
+def bursts(n, pause):
+	## n items at once, then nothing for a while, then n more
+	for x in range(n):
+		yield x
+	time.sleep(pause)
+	for x in range(n, 2*n):
+		yield x
+
+
+def sample_sizes(pool, sizes, stop):
+	while not stop.is_set():
+		sizes.append(pool.size)
+		time.sleep(0.01)
+
+def scaling(poolclass, options):
+	pool = poolclass(map(slow_square), poolsize=6, minsize=1, idletime=0.2, **options)
+	sizes, stop = [], threading.Event()
+	sampler = threading.Thread(target=sample_sizes, args=(pool, sizes, stop))
+	sampler.start()
+	output = bursts(60, 1) >> pool >> list
+	stop.set()
+	sampler.join()
+	assert sorted(output) == [x*x for x in range(120)]
+	grown = sizes.index(6)
+	shrunk = sizes.index(1, grown)            ## in between bursts
+	assert 6 in sizes[shrunk:]                ## and grew again
+	assert pool.size == 0
+
+def test_ThreadPool_scaling():
+	for options in [{}, dict(ordered=True)]:
+		yield scaling, ThreadPool, options
+
+def test_ProcessPool_scaling():
+	for options in [{}, dict(ordered=True), dict(chunksize=4)]:
+		yield scaling, ProcessPool, options
+
+def test_minsize():
+	pool = ThreadPool(map(slow_square), poolsize=4, minsize=2, idletime=0.05)
+	output = bursts(20, 0.5) >> pool >> list
+	assert sorted(output) == [x*x for x in range(40)]
+
+
+def test_minsize_zero():
+	for poolclass in [ThreadPool, ProcessPool]:
+		try:
+			poolclass(map(slow_square), minsize=0)
+		except ValueError:
+			pass
+		else:
+			assert False, '%s accepted minsize=0' % poolclass.__name__
+
+def test_Executor():
+	## Dispatched jobs grow an elastic pool
+	e = Executor(ThreadPool, map(slow_square), poolsize=4, minsize=1, idletime=0.2)
+	fs = e.submit(*range(40), futures=True)
+	sizes = []
+	while not fs[-1].done():
+		sizes.append(e.pool.size)
+		time.sleep(0.01)
+	assert sum(f.result() for f in fs) == sum(x*x for x in range(40))
+	assert max(sizes) == 4
+	e.close()
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
@@ -3,10 +3,12 @@
 import os
 import threading
 import sys
+import time
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from stream import map, Executor, ProcessPool, ThreadPool
+from stream import map, Executor, ProcessPool, ThreadPool, SharedMemory
+from stream import as_completed, wait, FIRST_COMPLETED, CancelledError, TimeoutError
 
 
 result = {
@@ -78,6 +80,248 @@ def test_ProcessPool_shutdown():
 		yield shutdown, ProcessPool, n
 
 
+## Test futures
+
+def futures(poolclass, n):
+	e = Executor(poolclass, map(lambda x: 1 // (x % 7)), poolsize=3)
+	fs = e.submit(*range(n), futures=True)
+	called = []
+	fs[0].add_done_callback(called.append)
+	for x, f in enumerate(fs):
+		if x % 7:
+			assert f.result() == 1 // (x % 7)
+		else:
+			assert isinstance(f.exception(), ZeroDivisionError)
+	assert called == [fs[0]]
+	assert sorted(as_completed(fs), key=lambda f: f.id) == fs
+	e.close()
+	assert e.result >> list == []
+	assert e.failure >> list == []
+
+def test_ThreadPool_futures():
+	for n in result.keys():
+		yield futures, ThreadPool, n
+
+def test_ProcessPool_futures():
+	for n in result.keys():
+		yield futures, ProcessPool, n
+
+def test_futures_wait():
+	e = Executor(ThreadPool, map(lambda x: time.sleep(x) or x), poolsize=2)
+	slow, fast = e.submit(1, 0, futures=True)
+	done, not_done = wait([slow, fast], return_when=FIRST_COMPLETED)
+	assert done == set([fast]) and not_done == set([slow])
+	try:
+		slow.result(timeout=0.1)
+	except TimeoutError:
+		pass
+	else:
+		assert False, 'result() should have timed out'
+	done, not_done = wait([slow, fast])
+	assert done == set([slow, fast]) and not not_done
+	e.close()
+
+def test_futures_timeout():
+	## Waiters which time out are not left behind, and the futures not
+	## yet done are counted
+	e = Executor(ThreadPool, map(lambda x: time.sleep(x) or x), poolsize=1)
+	fast, slow, queued = e.submit(0, 0.5, 0.5, futures=True)
+	for _ in range(10):
+		try:
+			slow.exception(timeout=0.001)
+		except TimeoutError:
+			pass
+	assert slow._callbacks == []
+	try:
+		for _ in as_completed([slow, fast, queued], timeout=0.1):
+			pass
+	except TimeoutError, error:
+		assert str(error) == '2 futures are not done'
+	else:
+		assert False, 'as_completed() should have timed out'
+	assert slow._callbacks == [] and queued._callbacks == []
+	assert slow.result() == 0.5
+	e.close()
+
+def test_futures_cancel():
+	e = Executor(ThreadPool, map(lambda x: time.sleep(x) or x), poolsize=1)
+	fs = e.submit(0.5, 0, 0, futures=True)
+	assert fs[2].cancel()
+	assert fs[2].cancelled() and e.status(fs[2].id) == 'CANCELLED'
+	try:
+		fs[2].result()
+	except CancelledError:
+		pass
+	else:
+		assert False, 'result() of a cancelled job should raise CancelledError'
+	assert fs[1].result() == 0
+	e.close()
+
+
+## Test lazy submission and eviction of job statuses
+
+def submit_iter(poolclass, n):
+	e = Executor(poolclass, map(lambda x: x*x), poolsize=3)
+	e.evictsize = 64
+	inflight = []
+	def items():
+		for x in range(n):
+			inflight.append(e._ninflight)
+			yield x
+	total = []
+	consumer = threading.Thread(target=lambda: total.append(sum(e.result)))
+	consumer.start()
+	ids = e.submit_iter(items(), window=8)
+	assert list(ids) == range(n)
+	e.close()
+	consumer.join()
+	assert total == [result[n]]
+	assert max(inflight) <= 8
+	assert len(e._status) < 64 and e._base >= n - 64
+	assert e.status(0) == 'FINISHED'
+	## unless the last statuses happened to make up a whole evictsize
+	assert e.status(n - 1) == ('FINISHED' if e._base == n else 'COMPLETED')
+
+def test_ThreadPool_submit_iter():
+	for n in result.keys():
+		yield submit_iter, ThreadPool, n
+
+def test_ProcessPool_submit_iter():
+	for n in result.keys():
+		yield submit_iter, ProcessPool, n
+
+
+def test_evicted_cancelled():
+	## Jobs cancelled while waiting, then evicted, are skipped
+	gate = threading.Event()
+	def work(x):
+		gate.wait()
+		return x
+	e = Executor(ThreadPool, map(work), poolsize=1)
+	e.evictsize = 4
+	fs = e.submit(*range(9), futures=True)
+	time.sleep(0.1)                       # job 0 is now running
+	assert e.cancel(*range(1, 8)) == 7
+	gate.set()
+	assert fs[0].result() == 0
+	assert fs[8].result(timeout=5) == 8
+	assert e._base == 8
+	assert e.status(3, 8) == ['FINISHED', 'COMPLETED']
+	e.close()
+	e.join()
+
+
+## Test priorities
+
+def run_in_order(aging, submissions):
+	gate = threading.Event()
+	order = []
+	def work(x):
+		gate.wait()
+		order.append(x)
+	now = [0.0]
+	e = Executor(ThreadPool, map(work), poolsize=1, aging=aging)
+	e.clock = lambda: now[0]
+	e.submit('first', futures=True)
+	time.sleep(0.1)                       # 'first' is now running
+	futures = []
+	for priority, items in submissions:
+		for x in items:
+			futures.append(e.submit(x, futures=True, priority=priority))
+		now[0] += 1.0                         # between groups of submissions
+	gate.set()
+	for f in futures:
+		f.result()
+	e.close()
+	return order[1:]
+
+def test_priority():
+	order = run_in_order(None, [(10, ['low1', 'low2']), (0, ['high1', 'high2'])])
+	assert order == ['high1', 'high2', 'low1', 'low2']
+
+def test_priority_aging():
+	## 'old' waits as if submitted at 0.1 or 10, 'new' is submitted at 1
+	order = run_in_order(0.1, [(1, ['old']), (0, ['new'])])
+	assert order == ['old', 'new']
+	order = run_in_order(10, [(1, ['old']), (0, ['new'])])
+	assert order == ['new', 'old']
+
+def test_priority_cancel():
+	e = Executor(ThreadPool, map(lambda x: time.sleep(x) or x), poolsize=1)
+	e.submit(0.2)
+	low, high = e.submit(0, 0, futures=True, priority=5), e.submit(0, futures=True)
+	assert e.status(low[0].id) == 'SUBMITTED'
+	assert low[0].cancel()
+	assert high.result() == 0 and low[1].result() == 0
+	assert e.status(low[0].id) == 'CANCELLED'
+	e.close()
+
+
+## Test pipelining depth
+
+def depth(poolclass, depth):
+	e = Executor(poolclass, map(lambda x: x*x), poolsize=2, depth=depth)
+	e.tuneinterval = 0.01
+	dispatched = []
+	fs = e.submit(*range(10000), futures=True)
+	while not fs[-1].done():
+		dispatched.append(e._ndispatched)
+		time.sleep(0.001)
+	assert sum(f.result() for f in fs) == result[10000]
+	e.close()
+	assert max(dispatched) <= 2 * e.maxdepth
+	if depth != 'auto':
+		assert max(dispatched) <= 2 * depth
+
+def test_ThreadPool_depth():
+	for d in [1, 4, 'auto']:
+		yield depth, ThreadPool, d
+
+def test_ProcessPool_depth():
+	for d in [1, 4, 'auto']:
+		yield depth, ProcessPool, d
+
+def test_depth_cancel():
+	e = Executor(ThreadPool, map(lambda x: time.sleep(x) or x), poolsize=1, depth=2)
+	fs = e.submit(0.2, 0, 0, futures=True)
+	time.sleep(0.1)
+	assert e.status(fs[1].id) == 'RUNNING'    # dispatched
+	assert not fs[1].cancel()
+	assert fs[2].cancel()
+	assert fs[1].result() == 0
+	e.close()
+
+
+## Test the pool options
+
+def rejected(poolclass, option, value):
+	try:
+		Executor(poolclass, map(lambda x: x*x), **{option: value})
+	except ValueError:
+		pass
+	else:
+		assert False, 'an Executor accepted %s=%r' % (option, value)
+
+def test_rejected_options():
+	for option, value in [('ordered', True), ('persistent', True)]:
+		yield rejected, ThreadPool if option == 'ordered' else ProcessPool, option, value
+	for value in [4, 'auto']:
+		yield rejected, ProcessPool, 'chunksize', value
+
+def accepted(poolclass, options):
+	e = Executor(poolclass, map(lambda x: x*x), poolsize=2, **options)
+	e.submit(*range(100))
+	e.close()
+	assert sum(e.result) == result[100]
+
+def test_accepted_options():
+	yield accepted, ThreadPool, dict(ordered=False, maxsize=10)
+	yield accepted, ThreadPool, dict(minsize=1, idletime=1)
+	yield accepted, ProcessPool, dict(chunksize=1, persistent=False)
+	yield accepted, ProcessPool, dict(minsize=1, idletime=1)
+	yield accepted, ProcessPool, dict(sharedmem=SharedMemory(threshold=1))
+
+
 if __name__ == "__main__":
 	import nose
 	nose.main()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python2.6
 
+import functools
 import time
 import operator
 import os, sys
@@ -35,6 +36,27 @@ def test_ForkedFeeder():
 	pprint(result)
 	assert result == expected
 
+def limited(n, maxsize=None, sharedmem=None):
+	return iter(range(min(n, maxsize)))
+
+def clash(feederclass, name):
+	try:
+		feederclass(limited, 10, **{name: 3})
+	except TypeError:
+		pass
+	else:
+		assert False, 'the keyword argument %r was taken from the generator' % name
+
+def test_reserved_keywords():
+	## A reserved keyword is not silently taken from a generator taking it
+	yield clash, ThreadedFeeder, 'maxsize'
+	yield clash, ForkedFeeder, 'sharedmem'
+
+def test_unreserved_keywords():
+	## Other keywords reach the generator, reserved ones can be bound
+	assert list(ThreadedFeeder(functools.partial(limited, maxsize=3), 10, maxsize=1)) == [0, 1, 2]
+	assert list(ForkedFeeder(limited, 10, maxsize=3)) == [0, 1, 2]
+
 
 if __name__ == '__main__':
 	import nose
@@ -0,0 +1,96 @@
+#!/usr/bin/env python2.6
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import Forkserver, ForkedFeeder, ProcessPool, SharedMemory, BrokenPipe
+
+
+def squares(input):
+	for x in input:
+		if x < 0:
+			raise ValueError(x)
+		yield x*x
+
+def parents(input):
+	for x in input:
+		yield os.getppid()
+
+def imported(input):
+	for name in input:
+		yield name in sys.modules
+
+def count(n):
+	return iter(xrange(n))
+
+
+def pool(options):
+	forkserver = Forkserver()
+	output = range(100) >> ProcessPool(squares, poolsize=3, forkserver=forkserver, **options)
+	if not options.get('ordered'):
+		output = sorted(output)
+	assert list(output) == [x*x for x in range(100)]
+	forkserver.close()
+
+def test_pool():
+	for options in [{}, dict(ordered=True), dict(chunksize=8),
+	                dict(sharedmem=SharedMemory(threshold=0))]:
+		yield pool, options
+
+def test_persistent():
+	forkserver = Forkserver()
+	p = ProcessPool(squares, poolsize=2, persistent=True, forkserver=forkserver)
+	assert sorted(range(10) >> p) == [x*x for x in range(10)]
+	assert sorted(range(20) >> p) == [x*x for x in range(20)]
+	p.close()
+	p.join()
+	forkserver.close()
+
+def test_failure():
+	forkserver = Forkserver()
+	p = ProcessPool(squares, poolsize=1, forkserver=forkserver)
+	assert [1, -1, 2] >> p >> list == [1]
+	assert [(x, str(e)) for x, e in p.failure] == [(-1, '-1')]
+	forkserver.close()
+
+def test_workers_forked_from_template():
+	forkserver = Forkserver()
+	ppids = set(range(10) >> ProcessPool(parents, poolsize=2, forkserver=forkserver))
+	forkserver.close()
+	assert os.getpid() not in ppids
+
+def test_preload():
+	assert 'wave' not in sys.modules
+	forkserver = Forkserver(preload=['wave'])
+	assert ['wave'] >> ProcessPool(imported, poolsize=1, forkserver=forkserver) >> list == [True]
+	forkserver.close()
+
+def test_ForkedFeeder():
+	forkserver = Forkserver()
+	feeder = ForkedFeeder(count, 100, forkserver=forkserver)
+	assert list(feeder) == range(100)
+	feeder.join()
+	forkserver.close()
+
+def test_unsupported():
+	forkserver = Forkserver()
+	for options in [dict(minsize=1), dict(chunksize='auto')]:
+		try:
+			ProcessPool(squares, forkserver=forkserver, **options)
+		except ValueError:
+			pass
+		else:
+			assert False, 'ProcessPool accepted %r with a Forkserver' % options
+	forkserver.close()
+	try:
+		ProcessPool(squares, forkserver=forkserver)
+	except BrokenPipe:
+		pass
+	else:
+		assert False, 'a closed Forkserver started a pool'
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
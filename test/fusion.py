@@ -0,0 +1,77 @@
+#!/usr/bin/env python2.6
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import map, filter, apply, takewhile, dropwhile, item, cut, seq
+
+
+## Stages together with equivalent generators which cannot be fused
+
+def _takewhile(s):
+	for x in s:
+		if not x < 500:
+			return
+		yield x
+
+def _dropwhile(s):
+	s = iter(s)
+	for x in s:
+		if not x < 50:
+			yield x
+			break
+	for x in s:
+		yield x
+
+stages = [
+	([lambda: map(lambda x: x * 3)], lambda s: (x * 3 for x in s)),
+	([lambda: filter(lambda x: x % 2)], lambda s: (x for x in s if x % 2)),
+	([lambda: map(lambda x: (x, 1)), lambda: apply(lambda x, y: x + y)],
+	 lambda s: (x + 1 for x in s)),
+	([lambda: takewhile(lambda x: x < 500)], _takewhile),
+	([lambda: dropwhile(lambda x: x < 50)], _dropwhile),
+]
+
+
+def compare(indices):
+	fused = range(1000)
+	expected = range(1000)
+	for i in indices:
+		factories, equivalent = stages[i]
+		for stage in factories:
+			fused = fused >> stage()
+		expected = equivalent(expected)
+	assert len(fused.plan) >= len(indices)
+	assert list(fused) == list(expected)
+
+
+## Test cases
+
+def test_fusion():
+	for a in range(len(stages)):
+		for b in range(len(stages)):
+			for c in range(len(stages)):
+				yield compare, (a, b, c)
+
+def test_plan():
+	s = range(10) >> map(str) >> cut[0] >> filter(bool) >> map(int)
+	assert [op for op, _ in s.plan] == ['map', 'map', 'filter', 'map']
+	assert s >> list == range(10)
+
+def test_started_upstream():
+	# Once iterated over, an upstream stage must keep its own state
+	upstream = seq() >> takewhile(lambda x: x < 3)
+	assert upstream >> item[:10] == [0, 1, 2]
+	downstream = upstream >> map(lambda x: x * 2)
+	assert [op for op, _ in downstream.plan] == ['map']
+	assert downstream >> list == []
+
+def test_dropwhile_state():
+	s = [5, 1, 7, 2] >> dropwhile(lambda x: x > 2) >> map(lambda x: x * 10)
+	assert s >> list == [10, 70, 20]
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python2.6
+
+import os, sys
+import multiprocessing
+import multiprocessing.connection
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import map, Executor, NetworkPool, as_completed
+
+
+def square(x):
+	if x < 0:
+		raise ValueError(x)
+	return x*x
+
+def slow_square(x):
+	time.sleep(0.001)
+	return x*x
+
+
+def start_worker(pool, authkey=None):
+	p = multiprocessing.Process(target=NetworkPool.work, args=(pool.address, authkey))
+	p.start()
+	return p
+
+def connect(pool, authkey=None):
+	## A worker which does nothing by itself
+	if authkey is None:
+		authkey = multiprocessing.current_process().authkey
+	connection = multiprocessing.connection.Client(pool.address, authkey=authkey)
+	connection.recv_bytes()
+	return connection
+
+
+def test_pool():
+	pool = NetworkPool(map(square), poolsize=3, batchsize=4)
+	assert sorted(range(100) >> pool) == [x*x for x in range(100)]
+
+def test_failure():
+	pool = NetworkPool(map(square), poolsize=2)
+	assert sorted([1, -1, 2, -2] >> pool) == [1, 4]
+	assert sorted((x, str(e)) for x, e in pool.failure) == [(-2, '-2'), (-1, '-1')]
+
+def test_remote_workers():
+	pool = NetworkPool(map(square), poolsize=2, authkey='secret', local=False)
+	output = range(100) >> pool
+	workers = [start_worker(pool, 'secret') for _ in range(2)]
+	assert sorted(output) == [x*x for x in range(100)]
+	for p in workers:
+		p.join()
+
+def test_batching():
+	pool = NetworkPool(map(square), poolsize=1, local=False, batchsize=5)
+	output = range(12) >> pool
+	time.sleep(0.1)                          ## for all items to be queued
+	connection = connect(pool)
+	batches = []
+	while 1:
+		batch = connection.recv()
+		if batch is StopIteration:
+			break
+		batches.append(batch)
+		connection.send([([x*x], None) for x in batch])
+	assert [len(batch) for batch in batches] == [5, 5, 2]
+	assert sorted(output) == [x*x for x in range(12)]
+
+def test_disconnected_worker():
+	pool = NetworkPool(map(square), poolsize=1, local=False, batchsize=10)
+	output = range(50) >> pool
+	time.sleep(0.1)                          ## for a full batch to be queued
+	connection = connect(pool)
+	held = connection.recv()
+	connection.close()
+	start_worker(pool)
+	assert len(held) == 10
+	assert sorted(output) == [x*x for x in range(50)]
+
+def test_silent_worker():
+	pool = NetworkPool(map(square), poolsize=1, local=False, batchsize=10, timeout=0.3)
+	output = range(50) >> pool
+	time.sleep(0.1)                          ## for a full batch to be queued
+	connection = connect(pool)
+	held = connection.recv()                 ## and no heartbeat
+	start_worker(pool)
+	assert len(held) == 10
+	assert sorted(output) == [x*x for x in range(50)]
+	connection.close()
+
+def test_heartbeat():
+	## A worker busy for longer than the timeout is not lost
+	pool = NetworkPool(map(slow_square), poolsize=1, batchsize=500,
+	                   heartbeat=0.05, timeout=0.2)
+	assert sorted(range(500) >> pool) == [x*x for x in range(500)]
+
+def test_authentication():
+	pool = NetworkPool(map(square), poolsize=1, local=False)
+	try:
+		connect(pool, authkey='wrong')
+	except multiprocessing.AuthenticationError:
+		pass
+	else:
+		assert False, 'a worker with the wrong authkey was accepted'
+	output = range(10) >> pool
+	start_worker(pool)
+	assert sorted(output) == [x*x for x in range(10)]
+
+def test_authkey_required():
+	try:
+		NetworkPool(map(square), address=('0.0.0.0', 0))
+	except ValueError:
+		pass
+	else:
+		assert False, 'a NetworkPool listened on all interfaces without authkey'
+	pool = NetworkPool(map(square), poolsize=1, address=('0.0.0.0', 0), authkey='secret')
+	assert range(10) >> pool >> sum == sum(x*x for x in range(10))
+
+
+## The Executor interface is unchanged.
+
+def test_Executor():
+	e = Executor(NetworkPool, map(square), poolsize=3, depth=4, batchsize=4)
+	e.submit(*range(1000))
+	e.submit(-1)
+	e.close()
+	assert sum(e.result) == sum(x*x for x in range(1000))
+	assert [(x, str(exception)) for x, exception in e.failure] == [(-1, '-1')]
+	assert e.status(0, 1000) == ['COMPLETED', 'FAILED']
+
+def test_Executor_cancel():
+	e = Executor(NetworkPool, map(slow_square), poolsize=2)
+	e.submit(*range(200))
+	cancelled = e.cancel(*range(200))
+	e.close()
+	assert len(e.result >> list) + cancelled == 200
+
+def test_Executor_futures():
+	e = Executor(NetworkPool, map(square), poolsize=2)
+	futures = e.submit(*range(20), futures=True)
+	assert sorted(f.result() for f in as_completed(futures)) == [x*x for x in range(20)]
+	e.close()
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python2.6
+
+import os, sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import map, ProcessPool, BrokenPipe
+
+
+def square(x):
+	if x < 0:
+		raise ValueError(x)
+	return x*x
+
+def pid(x):
+	return os.getpid()
+
+
+def sequential(options):
+	pool = ProcessPool(map(square), poolsize=2, persistent=True, **options)
+	for n in [10, 0, 100, 1]:
+		output = range(n) >> pool >> list
+		if not options.get('ordered'):
+			output.sort()
+		assert output == [x*x for x in range(n)]
+	pool.close()
+	pool.join()
+
+def test_sequential():
+	for options in [{}, dict(ordered=True), dict(chunksize=4),
+	                dict(chunksize='auto'), dict(minsize=1, idletime=0.1)]:
+		yield sequential, options
+
+def concurrent(options):
+	pool = ProcessPool(map(square), poolsize=4, persistent=True, **options)
+	outputs = {}
+	def run(k):
+		outputs[k] = range(k * 1000, k * 1000 + 500) >> pool >> list
+	threads = [threading.Thread(target=run, args=(k,)) for k in range(8)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	pool.close()
+	pool.join()
+	for k in range(8):
+		output = outputs[k]
+		if not options.get('ordered'):
+			output.sort()
+		assert output == [x*x for x in range(k * 1000, k * 1000 + 500)]
+
+def test_concurrent():
+	for options in [{}, dict(ordered=True), dict(chunksize=16)]:
+		yield concurrent, options
+
+def test_failure():
+	pool = ProcessPool(map(square), poolsize=2, persistent=True)
+	output1 = [1, -1, 2] >> pool
+	output2 = [-2, 3] >> pool
+	assert sorted(output1) == [1, 4]
+	assert [(x, str(e)) for x, e in output1.failure] == [(-1, '-1')]
+	assert sorted(output2) == [9]
+	assert [(x, str(e)) for x, e in output2.failure] == [(-2, '-2')]
+	pool.close()
+
+def test_workers_reused():
+	pool = ProcessPool(map(pid), poolsize=2, persistent=True)
+	pids = set(range(100) >> pool)
+	pids.update(range(100) >> pool)
+	pool.close()
+	pool.join()
+	assert len(pids) <= 2
+
+def test_closed():
+	pool = ProcessPool(map(square), persistent=True)
+	output = range(100) >> pool
+	pool.close()
+	try:
+		range(10) >> pool
+	except BrokenPipe:
+		pass
+	else:
+		assert False, 'a closed pool accepted an input stream'
+	assert sum(output) == sum(x*x for x in range(100))
+	pool.join()
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
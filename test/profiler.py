@@ -0,0 +1,56 @@
+#!/usr/bin/env python2.6
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import map, filter, item, Profiler, profiled, ThreadPool, ProcessPool
+
+
+## Test scenario
+
+def slow(x):
+	time.sleep(0.001)
+	return x
+
+def pool(poolclass):
+	with Profiler() as profiler:
+		result = range(100) >> map(slow) >> poolclass(map(lambda x: x*x), poolsize=2) >> sum
+	assert result == 328350
+	report = profiler.report()
+	assert [s['stage'] for s in report] == \
+	       ['map(slow)', '%s(map(<lambda>))' % poolclass.__name__, 'sum']
+	m, p, s = report
+	assert m['items_in'] == m['items_out'] == p['items_in'] == p['items_out'] == s['items_in'] == 100
+	assert sum(m['latency_us'].values()) == 100
+	assert m['wall_time'] >= 0.1
+	assert p['upstream_time'] >= 0.1
+	assert s['upstream_time'] <= s['wall_time']
+
+
+## Test cases
+
+def test_ThreadPool():
+	pool(ThreadPool)
+
+def test_ProcessPool():
+	pool(ProcessPool)
+
+def test_accumulator():
+	stage = profiled(item[:5], name='head')
+	assert range(10) >> stage == range(5)
+	stats = stage.stats()
+	assert stats['stage'] == 'head'
+	assert stats['items_in'] == 5
+
+def test_inactive():
+	profiler = Profiler()
+	with profiler:
+		range(10) >> filter(None) >> list
+	range(10) >> filter(None) >> list
+	assert len(profiler.report()) == 2
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
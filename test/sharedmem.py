@@ -0,0 +1,99 @@
+#!/usr/bin/env python2.6
+
+import os, sys
+
+from nose.plugins.skip import SkipTest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import stream
+from stream import ForkedFeeder, ProcessPool, PCollector, SharedMemory, map
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+## Test scenario
+
+def payloads():
+	for n in range(10):
+		yield chr(65 + n) * (1000 * n)
+
+def check_empty(transport):
+	assert os.listdir(transport.directory) == []
+
+
+## Test cases
+
+def test_ForkedFeeder():
+	transport = SharedMemory(threshold=1000)
+	feeder = ForkedFeeder(payloads, sharedmem=transport)
+	assert list(feeder) == list(payloads())
+	feeder.join()
+	check_empty(transport)
+
+def test_PCollector():
+	transport = SharedMemory(threshold=1000)
+	collector = PCollector()
+	for _ in range(3):
+		ForkedFeeder(payloads, sharedmem=transport) >> collector
+	assert sorted(collector) == sorted(list(payloads()) * 3)
+	check_empty(transport)
+
+def test_ProcessPool():
+	transport = SharedMemory(threshold=1000)
+	for chunksize in [1, 3]:
+		pool = ProcessPool(map(lambda s: (len(s), s.lower())), poolsize=2,
+		                   chunksize=chunksize, sharedmem=transport)
+		result = sorted(payloads() >> pool)
+		assert result == sorted((len(s), s.lower()) for s in payloads())
+		check_empty(transport)
+
+def test_without_numpy():
+	## Strings are shared even when NumPy is not available
+	saved, stream.numpy = stream.numpy, None
+	try:
+		transport = SharedMemory(threshold=1000)
+		feeder = ForkedFeeder(payloads, sharedmem=transport)
+		assert list(feeder) == list(payloads())
+		feeder.join()
+		check_empty(transport)
+	finally:
+		stream.numpy = saved
+
+def test_empty_payloads():
+	## Empty buffers are sent inline, since a mapping cannot be empty
+	transport = SharedMemory(threshold=0)
+	items = ['', 'x', bytearray(), ('', ['y', ''])]
+	if numpy is not None:
+		items.append(numpy.zeros(0))
+	received = [transport.decode(transport.encode(x)) for x in items]
+	assert received[:4] == items[:4]
+	if numpy is not None:
+		assert received[4].shape == (0,)
+	feeder = ForkedFeeder(lambda: iter(['', 'abc', '']), sharedmem=transport)
+	assert list(feeder) == ['', 'abc', '']
+	feeder.join()
+	check_empty(transport)
+
+def test_numpy():
+	if numpy is None:
+		raise SkipTest('NumPy is not available')
+	transport = SharedMemory(threshold=1000)
+	def arrays():
+		for n in range(5):
+			yield numpy.arange(1000 * n, dtype=float).reshape((n or 1, -1))
+	pool = ProcessPool(map(lambda a: a * 2), poolsize=2, sharedmem=transport)
+	result = sorted(arrays() >> pool, key=lambda a: a.size)
+	for a, b in zip(result, arrays()):
+		assert a.shape == b.shape
+		assert (a == b * 2).all()
+	result[-1] += 1    # received arrays are writable
+	check_empty(transport)
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python2.6
+
+import os, sys
+import collections
+import operator
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import shuffle, group_by_key
+
+
+def pairs(n, nkeys, seed=0):
+	r = random.Random(seed)
+	return [(r.randint(0, nkeys), r.random()) for _ in xrange(n)]
+
+def grouped(data):
+	groups = collections.defaultdict(list)
+	for key, value in data:
+		groups[key].append(value)
+	return sorted(groups.items())
+
+
+def grouping(nreducers, memory_limit):
+	data = pairs(5000, 100)
+	output = data >> group_by_key(nreducers=nreducers, chunksize=100,
+	                              memory_limit=memory_limit, blocksize=50)
+	assert sorted(output) == grouped(data)
+
+def test_group_by_key():
+	for nreducers in [1, 3]:
+		for memory_limit in [1 << 30, 10000]:
+			yield grouping, nreducers, memory_limit
+
+def test_key():
+	words = ['%x' % x for x in range(1000)]
+	output = words >> group_by_key(key=len, nreducers=2) >> sorted
+	assert output == grouped((len(w), w) for w in words)
+
+def test_positional():
+	## group_by_key takes its arguments in the order of shuffle
+	data = pairs(100, 10)
+	assert sorted(data >> group_by_key(2)) == grouped(data)
+	words = ['%x' % x for x in range(100)]
+	assert sorted(words >> group_by_key(2, len)) == sorted(words >> shuffle(2, len))
+
+def test_reducer():
+	data = pairs(5000, 100)
+	output = data >> shuffle(nreducers=3, reducer=lambda key, values: max(values))
+	assert sorted(output) == [(key, max(values)) for key, values in grouped(data)]
+
+def test_combiner():
+	data = [(key, 1) for key, _ in pairs(5000, 10)]
+	for memory_limit in [1 << 30, 100]:
+		output = data >> shuffle(nreducers=2, reducer=lambda key, counts: sum(counts),
+		                         combiner=operator.add, memory_limit=memory_limit)
+		assert sorted(output) == [(key, len(values)) for key, values in grouped(data)]
+
+def test_skewed_key():
+	## The values of a key spilled many times are merged in input order
+	data = [(0, x) for x in range(5000)] + pairs(1000, 50)
+	output = data >> shuffle(nreducers=2, reducer=lambda key, values: list(values),
+	                         memory_limit=5000, blocksize=10)
+	assert sorted(output) == grouped(data)
+
+def test_equal_hashes():
+	## -1 and -2 have the same hash
+	data = [(-1 - i % 2, i) for i in range(1000)]
+	output = data >> group_by_key(nreducers=2, memory_limit=1000)
+	assert sorted(output) == grouped(data)
+
+def test_empty():
+	assert [] >> group_by_key(nreducers=2) >> list == []
+
+def divide(key, values):
+	return [1.0 / v for v in values]
+
+def test_reducer_failure():
+	try:
+		[(0, 1), (1, 0)] * 1000 >> shuffle(nreducers=2, reducer=divide) >> list
+	except ZeroDivisionError:
+		pass
+	else:
+		assert False, 'the exception of a reducer was not raised'
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python2.6
+
+import os, sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import sort, parallel_sort
+
+
+def records(n, seed=0):
+	r = random.Random(seed)
+	return [(r.randint(0, n // 10), r.random()) for _ in xrange(n)]
+
+
+def sorting(memory_limit, options):
+	data = records(5000)
+	expected = sorted(data, **options)
+	assert data >> sort(memory_limit=memory_limit, **options) >> list == expected
+
+def test_sort():
+	for memory_limit in [1 << 30, 10000, 1000]:
+		for options in [{}, dict(reverse=True), dict(key=lambda r: r[0]),
+		                dict(key=lambda r: r[0], reverse=True)]:
+			yield sorting, memory_limit, options
+
+def test_fanin():
+	data = records(5000)
+	output = data >> sort(key=lambda r: r[0], memory_limit=1000, fanin=4) >> list
+	assert output == sorted(data, key=lambda r: r[0])
+
+def test_empty():
+	assert [] >> sort(memory_limit=1) >> list == []
+
+def parallel(nworkers, options, memory_limit=None):
+	data = records(5000)
+	expected = sorted(data, **options)
+	output = data >> parallel_sort(nworkers=nworkers, chunksize=100,
+	                               memory_limit=memory_limit, **options)
+	assert output >> list == expected
+
+def test_parallel_sort():
+	for nworkers in [1, 3]:
+		for options in [{}, dict(reverse=True), dict(key=lambda r: r[0]),
+		                dict(key=lambda r: r[0], reverse=True)]:
+			yield parallel, nworkers, options
+		yield parallel, nworkers, dict(key=lambda r: r[0]), 5000
+
+def test_parallel_sort_empty():
+	assert [] >> parallel_sort(nworkers=2) >> list == []
+
+def test_parallel_sort_failure():
+	try:
+		range(10000) >> parallel_sort(key=lambda x: 1 / (x - 5000), nworkers=2) >> list
+	except ZeroDivisionError:
+		pass
+	else:
+		assert False, 'the exception of a sort worker was not raised'
+
+def nfiles():
+	return len(os.listdir('/proc/self/fd'))
+
+def test_runs_closed():
+	## Run files are closed once the output is abandoned
+	before = nfiles()
+	output = iter(records(1000) >> sort(memory_limit=1000))
+	assert next(output) == min(records(1000))
+	assert nfiles() > before
+	output.close()
+	assert nfiles() == before
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
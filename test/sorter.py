@@ -19,6 +19,18 @@ def test_QSorter():
 	ThreadedFeeder(lambda: iter(xrange(0, 20, 2))) >> sorter
 	assert sorter >> list == [0, 0, 1, 2, 2, 3, 4, 4, 5, 6, 6, 7, 8, 8, 9, 10, 12, 14, 16, 18]
 
+def test_PSorter_key():
+	sorter = PSorter(key=lambda x: x % 10, reverse=True)
+	ForkedFeeder(lambda: iter([19, 9, 15, 3])) >> sorter
+	ForkedFeeder(lambda: iter([29, 8, 5])) >> sorter
+	assert sorter >> list == [19, 9, 29, 8, 15, 5, 3]
+
+def test_QSorter_key():
+	sorter = QSorter(key=len)
+	ThreadedFeeder(lambda: iter(['a', 'bb', 'ccc'])) >> sorter
+	ThreadedFeeder(lambda: iter(['d', 'ee'])) >> sorter
+	assert sorter >> list == ['a', 'd', 'bb', 'ee', 'ccc']
+
 
 if __name__ == '__main__':
 	import nose
@@ -0,0 +1,79 @@
+#!/usr/bin/env python2.6
+
+import operator
+import os, sys
+
+from nose.plugins.skip import SkipTest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import vmap, vfilter, vfold, map, filter, fold, seq, gseq, item
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+def check(vectorized, scalar, input):
+	if numpy is None:
+		raise SkipTest('NumPy is not available')
+	assert input() >> vectorized() >> list == input() >> scalar() >> list
+
+
+## Test cases
+
+def test_vmap():
+	for blocksize in [1, 7, 4096]:
+		yield (check,
+		       lambda: vmap(lambda x: 3*x + 1, blocksize=blocksize),
+		       lambda: map(lambda x: 3*x + 1),
+		       lambda: seq(0.5) >> item[:1000])
+
+def test_vfilter():
+	for blocksize in [1, 7, 4096]:
+		yield (check,
+		       lambda: vfilter(lambda x: x%3 == 0, blocksize=blocksize, dtype=int),
+		       lambda: filter(lambda x: x%3 == 0),
+		       lambda: range(1000))
+
+def test_vfold():
+	for initval in [None, 10]:
+		for blocksize in [1, 7, 4096]:
+			yield (check,
+			       lambda: vfold(numpy.add, initval=initval, blocksize=blocksize),
+			       lambda: fold(operator.add, initval=initval),
+			       lambda: gseq(0.9) >> item[:1000])
+
+def test_chained_blocks():
+	if numpy is None:
+		raise SkipTest('NumPy is not available')
+	blocks = range(100) >> vmap(numpy.sqrt, blocksize=10) \
+	                    >> vfilter(lambda x: x < 5, unbatch=False) >> list
+	assert [len(b) for b in blocks] == [10, 10, 5]
+	assert range(6) >> vmap(lambda x: x*2, dtype=int) >> vfold(numpy.add, dtype=int) >> list \
+	       == [0, 2, 6, 12, 20, 30]
+
+def test_chained_arguments():
+	## The blocks of a vectorized stage are cast and re-blocked by the next
+	## one only if it is given its own dtype or blocksize
+	if numpy is None:
+		raise SkipTest('NumPy is not available')
+	blocks = range(100) >> vmap(numpy.sqrt, blocksize=10) \
+	                    >> vfilter(lambda x: x < 5, blocksize=4, unbatch=False) >> list
+	assert [len(b) for b in blocks] == [4] * 6 + [1]
+	assert all(b.dtype == float for b in blocks)
+	blocks = range(30) >> vfilter(lambda x: x%2 == 0, blocksize=7, dtype=int) \
+	                   >> vmap(lambda x: x/4, blocksize=4, dtype=float, unbatch=False) >> list
+	assert [len(b) for b in blocks] == [4, 4, 4, 3]
+	assert all(b.dtype == float for b in blocks)
+	assert numpy.concatenate(blocks).tolist() == [x/4.0 for x in range(0, 30, 2)]
+	blocks = range(10) >> vmap(lambda x: x*2, dtype=int) >> vmap(lambda x: x, unbatch=False) >> list
+	assert [b.dtype for b in blocks] == [numpy.dtype(int)]
+	assert range(5) >> vmap(numpy.sqrt, blocksize=2) >> vfold(numpy.add, initval=1, dtype=int) >> list \
+	       == [1, 1, 2, 3, 4, 6]
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python2.6
+
+import os, sys
+import operator
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream import sliding, tumbling
+
+
+def concat(a, b):
+	## associative, but not commutative
+	return a + b
+
+def words(n, seed=0):
+	r = random.Random(seed)
+	return [chr(r.randint(97, 122)) for _ in xrange(n)]
+
+def timed(n, seed=0):
+	r = random.Random(seed)
+	t = 0
+	data = []
+	for _ in xrange(n):
+		t += r.choice([0, 0.5, 1, 3])
+		data.append((t, r.randint(0, 100)))
+	return data
+
+
+def slide(n, length):
+	data = words(length)
+	expected = [''.join(data[max(0, i - n + 1):i + 1]) for i in range(length)]
+	assert data >> sliding(concat, n) >> list == expected
+
+def test_sliding():
+	for n in [1, 2, 7, 100]:
+		for length in [0, 1, 10, 50]:
+			yield slide, n, length
+
+def slide_time(duration):
+	data = timed(200)
+	expected = [(t, max(v for s, v in data[:i + 1] if s > t - duration))
+	            for i, (t, _) in enumerate(data)]
+	assert data >> sliding(max, duration=duration) >> list == expected
+
+def test_sliding_time():
+	for duration in [0.5, 1, 4, 1000]:
+		yield slide_time, duration
+
+def tumble(n, length):
+	data = words(length)
+	expected = [''.join(data[i:i + n]) for i in range(0, length, n)]
+	assert data >> tumbling(concat, n) >> list == expected
+
+def test_tumbling():
+	for n in [1, 3, 10]:
+		for length in [0, 1, 9, 10, 11]:
+			yield tumble, n, length
+
+def tumble_time(duration):
+	data = timed(200)
+	expected = {}
+	for t, v in data:
+		start = t - t % duration
+		expected[start] = expected.get(start, 0) + v
+	output = data >> tumbling(operator.add, duration=duration) >> list
+	assert output == sorted(expected.items())
+
+def test_tumbling_time():
+	for duration in [0.5, 1, 4, 1000]:
+		yield tumble_time, duration
+
+def test_calls():
+	## Each item costs amortised O(1) calls, whatever the size of the window
+	for n in [2, 10, 1000]:
+		calls = [0]
+		def add(a, b):
+			calls[0] += 1
+			return a + b
+		output = range(10000) >> sliding(add, n) >> list
+		assert output[-1] == sum(range(10000 - n, 10000))
+		assert calls[0] <= 3 * 10000
+
+def test_arguments():
+	for stage in [sliding, tumbling]:
+		for kwargs in [{}, dict(n=0), dict(n=3, duration=1), dict(duration=0),
+		               dict(duration=-1)]:
+			try:
+				stage(operator.add, **kwargs)
+			except ValueError:
+				pass
+			else:
+				assert False, '%s accepted %r' % (stage.__name__, kwargs)
+
+
+if __name__ == '__main__':
+	import nose
+	nose.main()